@@ -2,7 +2,9 @@ import os
 import psycopg2
 import psycopg2.extras 
 import uuid
+import datetime
 import logging
+import threading
 from functools import wraps
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
@@ -11,18 +13,55 @@ from werkzeug.exceptions import Forbidden, NotFound
 
 from flask import (
     Flask, render_template, request, redirect, url_for, flash, session,
-    abort, current_app, send_from_directory
+    abort, current_app, send_from_directory, jsonify, Response, stream_template,
+    get_flashed_messages, g, has_request_context
 )
 import boto3
-from botocore.exceptions import ClientError
+from boto3.exceptions import S3UploadFailedError
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import BotoCoreError, ClientError
+
+import breaker
+import database
+import geo
+import jobs
+import logs
+import suggest
+from cache import TTLCache
+from compression import ResponseCompressor
 
 # --- Konfiguracja Początkowa ---
 load_dotenv()
 app = Flask(__name__)
-logging.basicConfig(level=logging.INFO)
+# Logi idą przez kolejkę do wątku zapisującego (logs.py): żądanie nigdy nie czeka na stdout
+LOG_PIPELINE = logs.configure(level=os.getenv('LOG_LEVEL', 'INFO'), queue_size=int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+                              sample_rates=logs.parse_sample_rates(os.getenv('LOG_SAMPLE_RATES', '')), json_format=os.getenv('LOG_FORMAT', 'json').lower() == 'json')
+s3_logger = logging.getLogger('papugo.s3'); orders_logger = logging.getLogger('papugo.orders')
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'default')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
+# --- Kompresja odpowiedzi (gzip / brotli) ---
+ResponseCompressor(app,
+    enabled=os.getenv('COMPRESS_ENABLED', 'true').lower() in ['true', '1', 't'],
+    min_size=int(os.getenv('COMPRESS_MIN_SIZE', '1024')),
+    gzip_level=int(os.getenv('COMPRESS_GZIP_LEVEL', '6')),
+    brotli_level=int(os.getenv('COMPRESS_BROTLI_LEVEL', '4')),
+    stream_flush_bytes=int(os.getenv('COMPRESS_STREAM_FLUSH_BYTES', '8192')))
+# Długie listy (admin, katalog) czytane są kursorem po stronie serwera, paczkami po tyle wierszy
+STREAM_FETCH_SIZE = int(os.getenv('STREAM_FETCH_SIZE', '500'))
+
+# --- Limity czasu i bezpieczniki zależności (RDS, S3) ---
+# Przy failoverze RDS albo problemach S3 żądanie ma dostać błąd po sekundach, nie po minucie;
+# po serii błędów bezpiecznik otwiera obwód i kolejne żądania kończą się od razu.
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '10000'))
+S3_CONNECT_TIMEOUT = float(os.getenv('S3_CONNECT_TIMEOUT', '2')); S3_READ_TIMEOUT = float(os.getenv('S3_READ_TIMEOUT', '10'))
+S3_MAX_ATTEMPTS = int(os.getenv('S3_MAX_ATTEMPTS', '2'))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5')); BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '30'))
+# Ostatnia poprawnie pobrana wersja stron katalogu - pokazywana, gdy baza nie odpowiada
+CATALOG_FALLBACK_CACHE = TTLCache(maxsize=2000, ttl_seconds=int(os.getenv('CATALOG_FALLBACK_TTL', '86400')))
+# Pełna lista restauracji zbierana do cache zapasowego najwyżej raz na tyle sekund, nie przy każdym renderze
+CATALOG_FALLBACK_REFRESH = int(os.getenv('CATALOG_FALLBACK_REFRESH', '300'))
+
 # --- Konfiguracja AWS S3 ---
 S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
 AWS_REGION = os.getenv('AWS_REGION')
@@ -35,7 +74,8 @@ else:
     S3_LOCATION = f"https://{S3_BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/"
     app.logger.info(f"Konfiguracja S3: Bucket={S3_BUCKET_NAME}, Region={AWS_REGION}, Location={S3_LOCATION}")
     try:
-        s3_client = boto3.client('s3', region_name=AWS_REGION)
+        s3_client = boto3.client('s3', region_name=AWS_REGION, config=BotoConfig(connect_timeout=S3_CONNECT_TIMEOUT, read_timeout=S3_READ_TIMEOUT,
+                                                                                  retries={'max_attempts': S3_MAX_ATTEMPTS, 'mode': 'standard'}))
         app.logger.info(f"Klient Boto3 S3 utworzony dla regionu {AWS_REGION} (używa poświadczeń z roli)")
     except Exception as e:
         app.logger.error(f"Błąd inicjalizacji klienta Boto3 S3: {e}")
@@ -43,29 +83,125 @@ else:
     if not s3_client:
         app.logger.error("Nie udało się zainicjalizować klienta S3.")
 
+def probe_database():
+    conn = database.connect(statement_timeout_ms=2000, connect_timeout=2)
+    try:
+        with conn.cursor() as cursor: cursor.execute('SELECT 1')
+    finally: conn.close()
+
+def probe_s3(): s3_client.head_bucket(Bucket=S3_BUCKET_NAME)
+
+# OperationalError = brak połączenia, timeout połączenia lub zapytania; błędy SQL nie otwierają obwodu
+DB_BREAKER = breaker.CircuitBreaker('rds', BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, probe=probe_database, failure_exceptions=(psycopg2.OperationalError,))
+S3_BREAKER = breaker.CircuitBreaker('s3', BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, probe=probe_s3 if s3_client else None)
+S3_OUTAGE_CODES = {'SlowDown', 'Throttling', 'RequestTimeout', 'InternalError', 'ServiceUnavailable'}
+
+def s3_call(func, *args, **kwargs):
+    """Wywołanie S3 przez bezpiecznik: błędy sieci, 5xx i throttling otwierają obwód, pozostałe ClientError (np. 404) nie."""
+    if not S3_BREAKER.allow(): raise breaker.CircuitOpenError(S3_BREAKER.name)
+    try: result = func(*args, **kwargs)
+    except (BotoCoreError, S3UploadFailedError) as e: S3_BREAKER.record_failure(e); raise
+    except ClientError as e:
+        if e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500 or e.response['Error']['Code'] in S3_OUTAGE_CODES: S3_BREAKER.record_failure(e)
+        else: S3_BREAKER.record_success()
+        raise
+    S3_BREAKER.record_success()
+    return result
+
+# --- Wyszukiwanie "najbliżej mnie" ---
+# Indeks siatkowy w pamięci procesu; przebudowywany z bazy po upływie TTL (inne workery
+# gunicorna widzą zmiany admina najpóźniej po tym czasie), lokalnie aktualizowany od razu.
+RESTAURANT_GEO_INDEX = geo.GeoGridIndex(ttl_seconds=int(os.getenv('GEO_INDEX_TTL', '300')), retry_seconds=int(os.getenv('GEO_INDEX_RETRY', '30')))
+GEO_INDEX_WAIT = float(os.getenv('GEO_INDEX_WAIT', '3')) # Tyle czeka pierwsze żądanie "near", zanim indeks zbuduje się w tle
+NEARBY_LIMIT = int(os.getenv('NEARBY_LIMIT', '30'))
+NEARBY_MAX_KM = float(os.getenv('NEARBY_MAX_KM', '50'))
+
+# --- Podpowiedzi wyszukiwarki (type-ahead) ---
+# Indeks prefiksów w pamięci procesu, budowany w tle przy starcie workera i po upływie TTL;
+# /api/suggest nigdy nie pyta bazy. Zmiany admina nanoszone są na indeks lokalnie od razu.
+SUGGEST_INDEX = suggest.SuggestIndex(ttl_seconds=int(os.getenv('SUGGEST_INDEX_TTL', '300')), retry_seconds=int(os.getenv('SUGGEST_INDEX_RETRY', '30')))
+SUGGEST_LIMIT = int(os.getenv('SUGGEST_LIMIT', '8'))
+
+# --- Rekomendacje dań ---
+# Tablice liczy wsadowo `maintenance.py refresh-recommendations`; strony czytają je przez cache procesu.
+RECOMMENDATIONS_CACHE = TTLCache(maxsize=5000, ttl_seconds=int(os.getenv('RECOMMENDATIONS_TTL', '600')))
+POPULAR_DISHES_LIMIT = int(os.getenv('POPULAR_DISHES_LIMIT', '3'))
+RELATED_DISHES_LIMIT = int(os.getenv('RELATED_DISHES_LIMIT', '4'))
+
+# --- Panel admina ---
+# Lista zamówień stronicowana po kluczu ("OrderDate", "OrderID") - indeks "Orders_OrderDate_idx"
+ADMIN_ORDERS_PAGE_SIZE = int(os.getenv('ADMIN_ORDERS_PAGE_SIZE', '100'))
+
+# --- Idempotencja składania zamówień ---
+# Klucz wydawany przez payment_page(); powtórzone /place_order (podwójne kliknięcie, retry LB)
+# zwraca istniejące zamówienie. Cache procesu -> tabela "OrderIdempotencyKeys" -> PRIMARY KEY.
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400'))
+ORDER_IDEMPOTENCY_CACHE = TTLCache(maxsize=10000, ttl_seconds=IDEMPOTENCY_TTL_SECONDS)
+
+# --- Identyfikator żądania (logi, application_name w bazie, metadane S3, zadania w tle) ---
+@app.before_request
+def assign_request_id():
+    g.request_id = logs.new_request_id(request.headers.get('X-Request-ID')); g.request_id_token = logs.set_request_id(g.request_id)
+
+@app.after_request
+def add_request_id_header(response):
+    if g.get('request_id'): response.headers['X-Request-ID'] = g.request_id
+    return response
+
+@app.teardown_request
+def clear_request_id(exc):
+    token = g.pop('request_id_token', None)
+    if token is not None: logs.reset_request_id(token)
+
+@app.teardown_request
+def record_db_outcome(exc):
+    """Żądanie, które połączyło się z bazą i żadne jego zapytanie nie padło, przerywa serię błędów bezpiecznika RDS."""
+    if isinstance(exc, psycopg2.OperationalError) and not g.get('db_failed'): note_db_failure(exc) # Nieobsłużony błąd, którego handler nie zgłosił
+    if g.pop('db_connected', False) and not g.pop('db_failed', False): DB_BREAKER.record_success()
+
 # --- Funkcje Pomocnicze Bazy Danych ---
-def get_db_connection():
-    """Nawiązuje połączenie z bazą danych PostgreSQL używając psycopg2."""
+def get_db_connection(quiet=False):
+    """Nawiązuje połączenie z bazą danych PostgreSQL używając psycopg2.
+
+    Przy otwartym obwodzie RDS zwraca None od razu. `quiet=True` pomija flash - dla stron,
+    które same pokazują zapasowe dane.
+    """
     try:
-        db_host = os.environ.get('DB_HOST')
-        db_name = os.environ.get('DB_NAME')
-        db_user = os.environ.get('DB_USER')
-        db_password = os.environ.get('DB_PASSWORD') 
-        db_port = os.environ.get('DB_PORT', '5432')
-        required_db_vars = {'DB_HOST': db_host, 'DB_NAME': db_name, 'DB_USER': db_user, 'DB_PASSWORD': db_password}
-        missing_vars = [k for k, v in required_db_vars.items() if not v]
+        db_params, missing_vars = database.connection_params(DB_STATEMENT_TIMEOUT_MS)
         if missing_vars:
              current_app.logger.error(f"Brak zmiennych środowiskowych bazy: {', '.join(missing_vars)}")
-             flash("Błąd krytyczny: Brak konfiguracji bazy danych!", "danger")
+             if not quiet: flash("Błąd krytyczny: Brak konfiguracji bazy danych!", "danger")
              return None
-        conn = psycopg2.connect(host=db_host, database=db_name, user=db_user, password=db_password, port=db_port, sslmode="require")
+        conn = connect_through_breaker(psycopg2.connect, **db_params)
         current_app.logger.debug("Połączenie psycopg2 nawiązane.")
         return conn
+    except breaker.CircuitOpenError:
+        current_app.logger.warning("Obwód RDS otwarty - pomijam próbę połączenia.")
+        if not quiet: flash("Baza danych jest chwilowo niedostępna. Spróbuj ponownie za chwilę.", "danger")
     except Exception as e: # Łapiemy ogólny wyjątek, logujemy szczegóły
         current_app.logger.error(f"Błąd połączenia psycopg2: {type(e).__name__}: {e}")
-        flash(f"Błąd połączenia z bazą danych.", "danger")
+        if not quiet: flash(f"Błąd połączenia z bazą danych.", "danger")
     return None
 
+def connect_through_breaker(connect, *args, **kwargs):
+    """Połączenie przez bezpiecznik RDS. Udane połączenie nie zeruje serii błędów.
+
+    Baza, która przyjmuje połączenia, a zapytania kończy statement_timeout, też ma otworzyć obwód -
+    sukces zapisuje dopiero koniec żądania bez błędu zapytania (record_db_outcome), a zadanie w tle
+    po swoich zapytaniach.
+    """
+    if not DB_BREAKER.allow(): raise breaker.CircuitOpenError(DB_BREAKER.name)
+    try: conn = connect(*args, **kwargs)
+    except psycopg2.OperationalError as e: DB_BREAKER.record_failure(e); raise
+    if has_request_context(): g.db_connected = True
+    return conn
+
+def note_db_failure(error):
+    """Błąd zapytania w trakcie żądania (np. statement_timeout) też liczy się do bezpiecznika RDS."""
+    if not isinstance(error, psycopg2.OperationalError): return
+    DB_BREAKER.record_failure(error)
+    if has_request_context(): g.db_failed = True
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -75,9 +211,172 @@ def format_address(street, number, code, city):
     if city_str: full_address += (", " if full_address else "") + city_str
     return full_address if full_address else None
 
+def with_full_address(restaurant):
+    restaurant['FullAddress'] = format_address(restaurant.get('Street'), restaurant.get('StreetNumber'), restaurant.get('PostalCode'), restaurant.get('City')) or "Brak adresu"
+    return restaurant
+
+def parse_order_cursor(value):
+    """'2024-05-01T12:00:00.123456_42' -> (data, OrderID); brak lub błędny format -> None (pierwsza strona)."""
+    date_part, _, id_part = (value or '').rpartition('_')
+    try: return datetime.datetime.fromisoformat(date_part), int(id_part)
+    except ValueError: return None
+
 def rows_to_dicts(cursor, rows): return [dict(row) for row in rows]
 def row_to_dict(cursor, row): return dict(row) if row else None
 
+class StreamedRows:
+    """Wiersze zapytania czytane kursorem po stronie serwera (named cursor) w trakcie renderowania szablonu.
+
+    Przejmuje połączenie: kursor i połączenie zamyka koniec iteracji albo `close()`, które
+    stream_page woła po zakończeniu odpowiedzi (także gdy klient się rozłączy). Pierwsza paczka
+    pobierana jest od razu - błąd zapytania wychodzi jeszcze w handlerze, a `{% if rows %}` działa.
+    `on_complete` dostaje listę wszystkich wierszy, jeśli iteracja doszła do końca.
+    """
+
+    def __init__(self, conn, sql, params=None, transform=None, on_complete=None, fetch_size=None):
+        self.conn = conn; self.transform = transform; self.on_complete = on_complete; self.fetch_size = fetch_size or STREAM_FETCH_SIZE
+        self.cursor = conn.cursor(name=f"stream_{uuid.uuid4().hex}", cursor_factory=psycopg2.extras.DictCursor)
+        try: self.cursor.execute(sql, params); self._batch = self.cursor.fetchmany(self.fetch_size)
+        except Exception: self._close_cursor(); raise # Połączenie zostaje u wywołującego
+
+    def __bool__(self): return bool(self._batch)
+
+    def __iter__(self):
+        collected = [] if self.on_complete else None
+        try:
+            while self._batch:
+                batch = self._batch
+                for row in batch:
+                    item = dict(row)
+                    if self.transform: item = self.transform(item)
+                    if collected is not None: collected.append(item)
+                    yield item
+                self._batch = self.cursor.fetchmany(self.fetch_size) if len(batch) == self.fetch_size else []
+            if collected is not None: self.on_complete(collected)
+        except psycopg2.Error as e:
+            app.logger.error(f"Błąd odczytu strumienia wierszy: {e}"); note_db_failure(e); raise
+        finally: self.close()
+
+    def _close_cursor(self):
+        try:
+            if not self.cursor.closed: self.cursor.close()
+        except psycopg2.Error: pass # Zerwane połączenie - kursor i tak przepadł
+
+    def close(self):
+        self._close_cursor()
+        if not self.conn.closed: self.conn.close()
+
+def stream_page(template_name, **context):
+    """Renderuje szablon strumieniowo - pierwsze bajty wychodzą, zanim wyrenderują się wszystkie wiersze."""
+    # Komunikaty flash trzeba zdjąć z sesji przed wysłaniem nagłówków (Set-Cookie), szablon dostanie je z cache żądania
+    get_flashed_messages(with_categories=True)
+    response = Response(stream_template(template_name, **context), mimetype='text/html')
+    for value in context.values():
+        if isinstance(value, StreamedRows): response.call_on_close(value.close)
+    return response
+
+def refresh_geo_index():
+    """Przebudowuje indeks "najbliżej mnie" na własnym połączeniu - działa w wątku tła, żądania czytają w tym czasie starą wersję."""
+    try:
+        conn = connect_through_breaker(database.connect)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT "RestaurantID", "Latitude", "Longitude" FROM "Restaurants" WHERE "Latitude" IS NOT NULL AND "Longitude" IS NOT NULL'); points = cursor.fetchall()
+        finally: conn.close()
+        DB_BREAKER.record_success()
+        RESTAURANT_GEO_INDEX.rebuild(points)
+        app.logger.info(f"Indeks geo zbudowany: {len(RESTAURANT_GEO_INDEX)} restauracji.")
+    except Exception as e: app.logger.error(f"Błąd budowy indeksu geo: {type(e).__name__}: {e}"); note_db_failure(e)
+    finally: RESTAURANT_GEO_INDEX.end_rebuild()
+
+def schedule_geo_refresh():
+    """Uruchamia przebudowę w tle, jeśli żadna nie trwa; przy błędzie bazy ponowienie najwcześniej po GEO_INDEX_RETRY s."""
+    if RESTAURANT_GEO_INDEX.try_begin_rebuild(): threading.Thread(target=refresh_geo_index, name='geo-index', daemon=True).start()
+
+def refresh_suggest_index():
+    """Przebudowuje indeks podpowiedzi na własnym połączeniu - działa w wątku tła, poza kontekstem żądania."""
+    try:
+        conn = connect_through_breaker(database.connect)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT "RestaurantID", "Name", "CuisineType", "City" FROM "Restaurants"'); restaurants = cursor.fetchall()
+                cursor.execute('SELECT "DishID", "Name", "RestaurantID" FROM "Dishes"'); dishes = cursor.fetchall()
+        finally: conn.close()
+        DB_BREAKER.record_success()
+        SUGGEST_INDEX.rebuild(restaurants, dishes)
+        app.logger.info(f"Indeks podpowiedzi zbudowany: {len(SUGGEST_INDEX)} wpisów.")
+    except Exception as e: app.logger.error(f"Błąd budowy indeksu podpowiedzi: {type(e).__name__}: {e}"); note_db_failure(e)
+    finally: SUGGEST_INDEX.end_rebuild()
+
+def schedule_suggest_refresh():
+    """Uruchamia przebudowę w tle, jeśli żadna nie trwa; przy błędzie bazy ponowienie najwcześniej po SUGGEST_INDEX_RETRY s."""
+    if SUGGEST_INDEX.try_begin_rebuild(): threading.Thread(target=refresh_suggest_index, name='suggest-index', daemon=True).start()
+
+def suggestion_to_dict(entry):
+    if entry['type'] in (suggest.TYPE_RESTAURANT, suggest.TYPE_DISH): url = url_for('restaurant_detail', restaurant_id=entry['ref'])
+    else: url = url_for('search', query=entry['label'])
+    return {'type': entry['type'], 'label': entry['label'], 'detail': entry['detail'], 'url': url}
+
+def popular_dish_ids(cursor, restaurant_id):
+    """ID najczęściej zamawianych dań restauracji (z cache albo "DishOrderCounts")."""
+    cached = RECOMMENDATIONS_CACHE.get(('popular', restaurant_id))
+    if cached is not None: return cached
+    cursor.execute('''SELECT c."DishID" FROM "DishOrderCounts" c JOIN "Dishes" d ON d."DishID" = c."DishID"
+                      WHERE d."RestaurantID" = %s ORDER BY c."OrderCount" DESC, c."DishID" LIMIT %s''', (restaurant_id, POPULAR_DISHES_LIMIT))
+    popular = [row[0] for row in cursor.fetchall()]
+    RECOMMENDATIONS_CACHE.set(('popular', restaurant_id), popular)
+    return popular
+
+def related_dishes(dish_ids):
+    """Dania "często zamawiane razem" z podanymi - wyniki sumowane, bez dań z listy. Baza tylko dla brakujących w cache."""
+    related = {dish_id: RECOMMENDATIONS_CACHE.get(('related', dish_id)) for dish_id in dish_ids}
+    missing = [dish_id for dish_id, dishes in related.items() if dishes is None]
+    if missing:
+        try:
+            conn = connect_through_breaker(database.connect, statement_timeout_ms=DB_STATEMENT_TIMEOUT_MS)
+            try:
+                with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+                    cursor.execute('''SELECT r."DishID" AS "SourceDishID", r."Score", d."DishID", d."Name", d."Price", d."ImageURL", d."RestaurantID"
+                                      FROM "DishRecommendations" r JOIN "Dishes" d ON d."DishID" = r."RecommendedDishID"
+                                      WHERE r."DishID" = ANY(%s) ORDER BY r."DishID", r."Rank"''', (missing,))
+                    rows = rows_to_dicts(cursor, cursor.fetchall())
+            finally: conn.close()
+        except Exception as e: app.logger.warning(f"Rekomendacje niedostępne: {type(e).__name__}: {e}"); note_db_failure(e); rows = None
+        if rows is not None:
+            for dish_id in missing: related[dish_id] = []
+            for row in rows: related[row.pop('SourceDishID')].append(row)
+            for dish_id in missing: RECOMMENDATIONS_CACHE.set(('related', dish_id), related[dish_id])
+    scores = {}; dishes = {}
+    for recommendations in related.values():
+        for dish in recommendations or []:
+            if dish['DishID'] in related: continue
+            scores[dish['DishID']] = scores.get(dish['DishID'], 0.0) + dish['Score']; dishes[dish['DishID']] = dish
+    return [dishes[dish_id] for dish_id in sorted(scores, key=lambda dish_id: (-scores[dish_id], dish_id))[:RELATED_DISHES_LIMIT]]
+
+def parse_idempotency_key(value):
+    try: return str(uuid.UUID(value)) if value else None
+    except ValueError: return None
+
+def find_idempotent_order(cursor, idempotency_key, user_id):
+    """Zwraca OrderID zamówienia złożonego wcześniej z tym kluczem (w obrębie TTL) albo None."""
+    cursor.execute('SELECT "OrderID" FROM "OrderIdempotencyKeys" WHERE "IdempotencyKey" = %s AND "UserID" = %s AND "CreatedAt" > CURRENT_TIMESTAMP - make_interval(secs => %s)',
+                   (idempotency_key, user_id, IDEMPOTENCY_TTL_SECONDS))
+    row = cursor.fetchone()
+    return row[0] if row and row[0] else None
+
+def finish_checkout(order_id, idempotency_key):
+    if idempotency_key: ORDER_IDEMPOTENCY_CACHE.set(idempotency_key, (session['user_id'], order_id))
+    session.pop('cart', None); session.pop('checkout_token', None); session.modified = True
+
+def resolve_origin(args):
+    """Punkt odniesienia dla sortowania po odległości: ?lat=&lon= z przeglądarki albo ?near= (kod pocztowy / miasto)."""
+    try:
+        lat = float(args.get('lat', '')); lon = float(args.get('lon', ''))
+        if -90 <= lat <= 90 and -180 <= lon <= 180: return (lat, lon)
+    except ValueError: pass
+    near = args.get('near', '').strip()
+    return geo.geocode(near, near) if near else None
+
 # --- Funkcje Pomocnicze S3 ---
 def upload_file_to_s3(file, bucket_name, object_name=None):
     if not s3_client: app.logger.error("S3 client error."); return None
@@ -89,12 +388,15 @@ def upload_file_to_s3(file, bucket_name, object_name=None):
              object_name = f"{'restaurants' if 'restaurants/' in file.filename else 'dishes'}/{uuid.uuid4()}.{extension}"
         else: object_name = f"uploads/{uuid.uuid4()}.{extension}"
     try:
-        s3_client.upload_fileobj(file, bucket_name, object_name, ExtraArgs={"ContentType": file.content_type})
+        extra_args = {"ContentType": file.content_type}
+        if logs.get_request_id(): extra_args["Metadata"] = {"request-id": logs.get_request_id()} # Obiekt wskazuje żądanie, które go wgrało
+        s3_call(s3_client.upload_fileobj, file, bucket_name, object_name, ExtraArgs=extra_args)
         file_url = f"{S3_LOCATION}{object_name}"
-        app.logger.info(f"File uploaded to S3: {file_url}")
+        s3_logger.info(f"File uploaded to S3: {file_url}")
         return file_url
-    except ClientError as e: app.logger.error(f"S3 upload error for '{object_name}': {e}"); return None
-    except Exception as e: app.logger.error(f"Unexpected S3 upload error: {e}"); return None
+    except breaker.CircuitOpenError: s3_logger.warning(f"Obwód S3 otwarty - pomijam wgrywanie '{object_name}'."); return None
+    except (ClientError, BotoCoreError, S3UploadFailedError) as e: s3_logger.error(f"S3 upload error for '{object_name}': {e}"); return None
+    except Exception as e: s3_logger.error(f"Unexpected S3 upload error: {e}"); return None
 
 def delete_file_from_s3(bucket_name, object_url_or_key):
     if not s3_client: app.logger.error("S3 client error."); return False
@@ -103,13 +405,27 @@ def delete_file_from_s3(bucket_name, object_url_or_key):
     if object_url_or_key.startswith(S3_LOCATION): object_key = object_url_or_key[len(S3_LOCATION):]
     if not object_key: app.logger.warning(f"Could not extract S3 key from: {object_url_or_key}"); return False
     try:
-        s3_client.delete_object(Bucket=bucket_name, Key=object_key)
-        app.logger.info(f"File {object_key} deleted from S3 bucket {bucket_name}")
+        s3_call(s3_client.delete_object, Bucket=bucket_name, Key=object_key)
+        s3_logger.info(f"File {object_key} deleted from S3 bucket {bucket_name}")
         return True
     except ClientError as e:
-        if e.response['Error']['Code'] == 'NoSuchKey': app.logger.warning(f"File {object_key} not found in S3 during delete."); return True
-        app.logger.error(f"S3 delete error for {object_key}: {e}"); return False
-    except Exception as e: app.logger.error(f"Unexpected S3 delete error for {object_key}: {e}"); return False
+        if e.response['Error']['Code'] == 'NoSuchKey': s3_logger.warning(f"File {object_key} not found in S3 during delete."); return True
+        s3_logger.error(f"S3 delete error for {object_key}: {e}"); return False
+    except breaker.CircuitOpenError: s3_logger.warning(f"Obwód S3 otwarty - usunięcie {object_key} zostanie ponowione."); return False
+    except BotoCoreError as e: s3_logger.error(f"S3 delete error for {object_key}: {e}"); return False
+    except Exception as e: s3_logger.error(f"Unexpected S3 delete error for {object_key}: {e}"); return False
+
+# --- Zadania w tle (worker.py) ---
+S3_DELETE_JOB = 's3.delete_object'
+
+@jobs.job(S3_DELETE_JOB, max_attempts=8, concurrency=4, backoff_seconds=15)
+def delete_s3_object_job(payload):
+    if not delete_file_from_s3(payload.get('bucket') or S3_BUCKET_NAME, payload['object']):
+        raise RuntimeError(f"Nie udało się usunąć {payload['object']} z S3")
+
+def enqueue_s3_delete(cursor, object_url_or_key):
+    """Zleca usunięcie pliku z S3 w bieżącej transakcji - wykona się dopiero po commit."""
+    if object_url_or_key: jobs.enqueue(cursor, S3_DELETE_JOB, {'bucket': S3_BUCKET_NAME, 'object': object_url_or_key})
 
 # --- Dekorator Admina ---
 def admin_required(f):
@@ -125,21 +441,58 @@ def admin_required(f):
 
 @app.route('/')
 def index():
-    conn = get_db_connection()
-    restaurants_display = []
-    if not conn: return render_template('index.html', restaurants=restaurants_display)
+    near_query = request.args.get('near', '').strip(); origin = resolve_origin(request.args)
+    if (near_query or request.args.get('lat')) and not origin: flash('Nie rozpoznano lokalizacji. Podaj kod pocztowy (np. 00-001) lub miasto.', 'warning')
+    # Indeks odświeżany także przy zwykłej liście - strona zapasowa (baza nie odpowiada) liczy z niego odległości
+    if RESTAURANT_GEO_INDEX.is_stale(): schedule_geo_refresh()
+    if origin and not RESTAURANT_GEO_INDEX.wait_built(GEO_INDEX_WAIT):
+        flash('Sortowanie po odległości jest chwilowo niedostępne - pokazujemy wszystkie restauracje.', 'warning'); origin = None
+    conn = get_db_connection(quiet=True)
+    restaurants_display = None
+    if not conn: return render_catalog_fallback(origin, near_query)
     cursor = None
     try:
         cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cursor.execute('SELECT "RestaurantID", "Name", "CuisineType", "Street", "StreetNumber", "PostalCode", "City", "ImageURL" FROM "Restaurants" ORDER BY "Name"')
-        restaurants = rows_to_dicts(cursor, cursor.fetchall())
-        for r in restaurants: r['FullAddress'] = format_address(r.get('Street'), r.get('StreetNumber'), r.get('PostalCode'), r.get('City')) or "Brak adresu"
+        if origin:
+            # Tryb "najbliżej mnie": indeks w pamięci wybiera N najbliższych, baza dociąga tylko ich wiersze
+            distances = dict(RESTAURANT_GEO_INDEX.nearest(origin[0], origin[1], limit=NEARBY_LIMIT, max_km=NEARBY_MAX_KM))
+            restaurants = []
+            if distances:
+                cursor.execute('SELECT "RestaurantID", "Name", "CuisineType", "Street", "StreetNumber", "PostalCode", "City", "ImageURL" FROM "Restaurants" WHERE "RestaurantID" = ANY(%s)', (list(distances),))
+                restaurants = sorted(rows_to_dicts(cursor, cursor.fetchall()), key=lambda r: distances[r['RestaurantID']])
+                for r in restaurants: with_full_address(r)['DistanceKm'] = distances[r['RestaurantID']]
+            else: flash(f"Brak restauracji w promieniu {NEARBY_MAX_KM:g} km.", "info")
+        else:
+            # Pełna lista trafia do cache zapasowego dopiero po wyrenderowaniu całej strony - i tylko gdy jej brak albo jest starsza niż CATALOG_FALLBACK_REFRESH
+            restaurants = StreamedRows(conn, 'SELECT "RestaurantID", "Name", "CuisineType", "Street", "StreetNumber", "PostalCode", "City", "ImageURL" FROM "Restaurants" ORDER BY "Name"',
+                                       transform=with_full_address, on_complete=store_catalog_fallback if catalog_fallback_due() else None)
+            conn = None # Połączenie zamknie StreamedRows po wyrenderowaniu strony
         restaurants_display = restaurants
-    except Exception as e: app.logger.error(f"Błąd pobierania restauracji: {e}"); flash("Wystąpił błąd.", "danger")
+    except Exception as e: app.logger.error(f"Błąd pobierania restauracji: {e}"); note_db_failure(e)
     finally:
         if cursor: cursor.close()
         if conn and not conn.closed: conn.close()
-    return render_template('index.html', restaurants=restaurants_display)
+    if restaurants_display is None: return render_catalog_fallback(origin, near_query)
+    return stream_page('index.html', restaurants=restaurants_display, near_query=near_query, sort_by_distance=bool(origin))
+
+def catalog_fallback_due():
+    return CATALOG_FALLBACK_CACHE.get('restaurants') is None or CATALOG_FALLBACK_CACHE.get('restaurants_fresh') is None
+
+def store_catalog_fallback(rows):
+    CATALOG_FALLBACK_CACHE.set('restaurants', rows); CATALOG_FALLBACK_CACHE.set('restaurants_fresh', True, ttl_seconds=CATALOG_FALLBACK_REFRESH)
+
+def render_catalog_fallback(origin, near_query):
+    """Strona główna z ostatnio pobranej listy restauracji, gdy baza nie odpowiada (odległości z indeksu w pamięci)."""
+    restaurants = CATALOG_FALLBACK_CACHE.get('restaurants')
+    if restaurants is None:
+        flash("Baza danych jest chwilowo niedostępna. Spróbuj ponownie za chwilę.", "danger")
+        return render_template('index.html', restaurants=[], near_query=near_query, sort_by_distance=bool(origin))
+    if origin and not RESTAURANT_GEO_INDEX.is_built(): origin = None # Bez indeksu pokazujemy całą listę
+    if origin:
+        distances = dict(RESTAURANT_GEO_INDEX.nearest(origin[0], origin[1], limit=NEARBY_LIMIT, max_km=NEARBY_MAX_KM))
+        restaurants = sorted((dict(r, DistanceKm=distances[r['RestaurantID']]) for r in restaurants if r['RestaurantID'] in distances), key=lambda r: r['DistanceKm'])
+    flash("Baza danych chwilowo nie odpowiada - pokazujemy ostatnio zapisaną listę restauracji.", "warning")
+    return stream_page('index.html', restaurants=restaurants, near_query=near_query, sort_by_distance=bool(origin))
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -186,9 +539,9 @@ def login():
                 except psycopg2.errors.UniqueViolation:
                     conn.rollback(); flash('Nazwa użytkownika jest już zajęta.', 'warning')
                 except Exception as e:
-                    conn.rollback(); app.logger.error(f"Błąd rejestracji {username}: {e}"); flash('Błąd rejestracji.', 'danger')
+                    note_db_failure(e); conn.rollback(); app.logger.error(f"Błąd rejestracji {username}: {e}"); flash('Błąd rejestracji.', 'danger')
 
-        except Exception as e: app.logger.error(f"Błąd logowania/rejestracji {username}: {e}"); flash('Błąd serwera.', 'danger')
+        except Exception as e: note_db_failure(e); app.logger.error(f"Błąd logowania/rejestracji {username}: {e}"); flash('Błąd serwera.', 'danger')
         finally:
             if cursor and not cursor.closed: cursor.close()
             if conn and not conn.closed and not user_logged_in: conn.close() # Zamknij tylko jeśli nie było przekierowania
@@ -207,24 +560,37 @@ def logout():
 
 @app.route('/restaurant/<int:restaurant_id>')
 def restaurant_detail(restaurant_id):
-    conn = get_db_connection()
-    restaurant_display = None; dishes_display = []
-    if not conn: return redirect(url_for('index'))
+    conn = get_db_connection(quiet=True)
+    restaurant_display = None; dishes_display = []; error_message = "Baza danych jest chwilowo niedostępna. Spróbuj ponownie za chwilę."
     cursor = None
-    try:
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cursor.execute('SELECT "RestaurantID", "Name", "CuisineType", "Street", "StreetNumber", "PostalCode", "City", "ImageURL" FROM "Restaurants" WHERE "RestaurantID" = %s', (restaurant_id,))
-        restaurant_display = row_to_dict(cursor, cursor.fetchone())
-        if restaurant_display:
-            restaurant_display['FullAddress'] = format_address(restaurant_display.get('Street'), restaurant_display.get('StreetNumber'), restaurant_display.get('PostalCode'), restaurant_display.get('City')) or "Brak adresu"
-            cursor.execute('SELECT "DishID", "Name", "Description", "Price", "ImageURL" FROM "Dishes" WHERE "RestaurantID" = %s ORDER BY "Name"', (restaurant_id,))
-            dishes_display = rows_to_dicts(cursor, cursor.fetchall())
-            return render_template('restaurant_detail.html', restaurant=restaurant_display, dishes=dishes_display)
-        else: flash('Nie znaleziono restauracji.', 'warning'); return redirect(url_for('index'))
-    except Exception as e: app.logger.error(f"Błąd szczegółów restauracji {restaurant_id}: {e}"); flash("Wystąpił błąd.", "danger"); return redirect(url_for('index'))
-    finally:
-        if cursor: cursor.close()
-        if conn and not conn.closed: conn.close()
+    if conn:
+        try:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+            cursor.execute('SELECT "RestaurantID", "Name", "CuisineType", "Street", "StreetNumber", "PostalCode", "City", "ImageURL" FROM "Restaurants" WHERE "RestaurantID" = %s', (restaurant_id,))
+            restaurant_display = row_to_dict(cursor, cursor.fetchone())
+            if restaurant_display:
+                restaurant_display['FullAddress'] = format_address(restaurant_display.get('Street'), restaurant_display.get('StreetNumber'), restaurant_display.get('PostalCode'), restaurant_display.get('City')) or "Brak adresu"
+                cursor.execute('SELECT "DishID", "Name", "Description", "Price", "ImageURL" FROM "Dishes" WHERE "RestaurantID" = %s ORDER BY "Name"', (restaurant_id,))
+                dishes_display = rows_to_dicts(cursor, cursor.fetchall())
+                try: popular_ids = popular_dish_ids(cursor, restaurant_id)
+                except psycopg2.Error as e: note_db_failure(e); conn.rollback(); app.logger.warning(f"Popularne dania niedostępne: {e}"); popular_ids = []
+                CATALOG_FALLBACK_CACHE.set(('restaurant', restaurant_id), (restaurant_display, dishes_display, popular_ids))
+                return render_restaurant_detail(restaurant_display, dishes_display, popular_ids)
+            else: flash('Nie znaleziono restauracji.', 'warning'); return redirect(url_for('index'))
+        except Exception as e: app.logger.error(f"Błąd szczegółów restauracji {restaurant_id}: {e}"); note_db_failure(e); error_message = "Wystąpił błąd."
+        finally:
+            if cursor: cursor.close()
+            if conn and not conn.closed: conn.close()
+    # Baza nie odpowiedziała - ostatnio pobrane menu, jeśli ten proces je ma
+    cached = CATALOG_FALLBACK_CACHE.get(('restaurant', restaurant_id))
+    if cached is None: flash(error_message, "danger"); return redirect(url_for('index'))
+    flash("Baza danych chwilowo nie odpowiada - pokazujemy ostatnio zapisane menu.", "warning")
+    return render_restaurant_detail(*cached)
+
+def render_restaurant_detail(restaurant_display, dishes_display, popular_ids):
+    dishes_by_id = {dish['DishID']: dish for dish in dishes_display}
+    popular_dishes = [dishes_by_id[dish_id] for dish_id in popular_ids if dish_id in dishes_by_id]
+    return render_template('restaurant_detail.html', restaurant=restaurant_display, dishes=dishes_display, popular_dishes=popular_dishes, popular_ids=set(popular_ids))
 
 @app.route('/search')
 def search():
@@ -233,54 +599,88 @@ def search():
     if not query: return render_template('index.html', restaurants=restaurants_display, search_query=query)
     conn = get_db_connection()
     if not conn: return render_template('index.html', restaurants=restaurants_display, search_query=query)
-    cursor = None
     try:
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
         search_term = f"%{query}%"
         sql = 'SELECT "RestaurantID", "Name", "CuisineType", "Street", "StreetNumber", "PostalCode", "City", "ImageURL" FROM "Restaurants" WHERE "Name" ILIKE %s OR "CuisineType" ILIKE %s OR "City" ILIKE %s ORDER BY "Name"'
-        cursor.execute(sql, (search_term, search_term, search_term))
-        restaurants = rows_to_dicts(cursor, cursor.fetchall())
-        for r in restaurants: r['FullAddress'] = format_address(r.get('Street'), r.get('StreetNumber'), r.get('PostalCode'), r.get('City')) or "Brak adresu"
-        restaurants_display = restaurants
+        restaurants_display = StreamedRows(conn, sql, (search_term, search_term, search_term), transform=with_full_address)
+        conn = None # Połączenie zamknie StreamedRows po wyrenderowaniu strony
         if not restaurants_display: flash(f"Nie znaleziono restauracji dla '{query}'.", "info")
-    except Exception as e: app.logger.error(f"Błąd wyszukiwania '{query}': {e}"); flash("Błąd wyszukiwania.", "danger")
+    except Exception as e: note_db_failure(e); app.logger.error(f"Błąd wyszukiwania '{query}': {e}"); flash("Błąd wyszukiwania.", "danger")
     finally:
-        if cursor: cursor.close()
         if conn and not conn.closed: conn.close()
-    return render_template('index.html', restaurants=restaurants_display, search_query=query)
+    return stream_page('index.html', restaurants=restaurants_display, search_query=query)
 
-# --- Koszyk ---
-@app.route('/cart/add/<int:dish_id>', methods=['POST'])
-def add_to_cart(dish_id):
-    if 'user_id' not in session: flash('Musisz być zalogowany.', 'warning'); return redirect(url_for('login'))
-    try: quantity = int(request.form.get('quantity', 1)); assert quantity > 0
-    except: flash('Nieprawidłowa ilość.', 'warning'); return redirect(request.referrer or url_for('index'))
+@app.route('/api/suggest')
+def api_suggest():
+    if SUGGEST_INDEX.is_stale(): schedule_suggest_refresh()
+    query = request.args.get('q', '').strip()[:100]
+    limit = max(1, min(SUGGEST_LIMIT, request.args.get('limit', SUGGEST_LIMIT, type=int)))
+    response = jsonify(query=query, ready=SUGGEST_INDEX.is_built(), suggestions=[suggestion_to_dict(entry) for entry in SUGGEST_INDEX.search(query, limit)])
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    return response
 
-    conn = get_db_connection(); redirect_url = request.referrer or url_for('index'); dish_data_dict = None
-    if not conn: return redirect(redirect_url)
+# --- Koszyk ---
+# Operacje na koszyku zwracają (komunikat, kategoria, status HTTP); trasy formularzy zamieniają je
+# na flash + przekierowanie, trasy /api/cart/* na JSON z podsumowaniem koszyka.
+def cart_add(dish_id, quantity, quiet=False):
+    conn = get_db_connection(quiet=quiet); dish_data_dict = None
+    if not conn: return "Błąd połączenia z bazą danych.", 'danger', 503
     cursor = None
     try:
         cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
         cursor.execute('SELECT "DishID", "Name", "Price" FROM "Dishes" WHERE "DishID" = %s', (dish_id,))
         dish_data_dict = row_to_dict(cursor, cursor.fetchone())
-        if not dish_data_dict: flash('Nie znaleziono dania.', 'danger')
-    except Exception as e: app.logger.error(f"Błąd pobierania dania {dish_id}: {e}"); flash("Błąd pobierania dania.", "danger")
+    except Exception as e: note_db_failure(e); app.logger.error(f"Błąd pobierania dania {dish_id}: {e}"); return "Błąd pobierania dania.", 'danger', 500
     finally:
         if cursor: cursor.close()
-        if conn and not conn.closed and not dish_data_dict: conn.close()
+        if conn and not conn.closed: conn.close()
+    if not dish_data_dict: return 'Nie znaleziono dania.', 'danger', 404
+
+    cart = session.get('cart', {}); dish_id_str = str(dish_id)
+    try:
+        price = float(dish_data_dict['Price']); current_quantity = cart.get(dish_id_str, {}).get('quantity', 0)
+        cart[dish_id_str] = {'name': dish_data_dict['Name'], 'price': price, 'quantity': current_quantity + quantity}
+        session['cart'] = cart; session.modified = True
+        return f"Dodano '{dish_data_dict['Name']}' (x{quantity}).", 'success', 200
+    except (KeyError, ValueError) as e: app.logger.error(f"Błąd koszyka {dish_id}: {e}"); return "Błąd dodawania do koszyka.", 'danger', 500
+
+def cart_set_quantity(dish_id, quantity):
+    if quantity <= 0: return cart_remove(dish_id)
+    cart = session.get('cart', {}); dish_id_str = str(dish_id)
+    if dish_id_str not in cart: return 'Tego produktu nie ma w koszyku.', 'warning', 404
+    cart[dish_id_str]['quantity'] = quantity; session['cart'] = cart; session.modified = True
+    return f"Zmieniono ilość '{cart[dish_id_str].get('name', f'Produkt ID {dish_id_str}')}' na {quantity}.", 'info', 200
 
-    if dish_data_dict:
-        if 'cart' not in session: session['cart'] = {}
-        cart = session.get('cart', {}); dish_id_str = str(dish_id)
+def cart_remove(dish_id):
+    cart = session.get('cart', {}); dish_id_str = str(dish_id)
+    if dish_id_str not in cart: return 'Tego produktu nie ma w koszyku.', 'warning', 404
+    item_name = cart[dish_id_str].get('name', f'Produkt ID {dish_id_str}'); del cart[dish_id_str]; session['cart'] = cart; session.modified = True
+    return f"Usunięto '{item_name}'.", 'info', 200
+
+def cart_summary():
+    """Pozycje koszyka z sesji (pomija błędne wpisy - sprząta je view_cart)."""
+    items = []; total_price = 0.0
+    for item_id_str, item_data in session.get('cart', {}).items():
         try:
-            price = float(dish_data_dict['Price']); current_quantity = cart.get(dish_id_str, {}).get('quantity', 0)
-            cart[dish_id_str] = {'name': dish_data_dict['Name'], 'price': price, 'quantity': current_quantity + quantity}
-            session['cart'] = cart; session.modified = True
-            flash(f"Dodano '{dish_data_dict['Name']}' (x{quantity}).", 'success')
-        except (KeyError, ValueError) as e: app.logger.error(f"Błąd koszyka {dish_id}: {e}"); flash("Błąd dodawania do koszyka.", "danger")
-        finally:
-            if conn and not conn.closed: conn.close()
+            price = float(item_data['price']); quantity = int(item_data['quantity'])
+            if quantity <= 0: continue
+            items.append({'id': int(item_id_str), 'name': item_data.get('name', f'ID {item_id_str}'), 'price': price, 'quantity': quantity, 'total': price * quantity})
+            total_price += price * quantity
+        except (KeyError, ValueError, TypeError): continue
+    return {'items': items, 'count': len(items), 'total': round(total_price, 2)}
+
+def parse_quantity(value, default=None):
+    try: return int(value if value is not None else default)
+    except (TypeError, ValueError): return None
 
+@app.route('/cart/add/<int:dish_id>', methods=['POST'])
+def add_to_cart(dish_id):
+    if 'user_id' not in session: flash('Musisz być zalogowany.', 'warning'); return redirect(url_for('login'))
+    redirect_url = request.referrer or url_for('index')
+    quantity = parse_quantity(request.form.get('quantity'), 1)
+    if not quantity or quantity <= 0: flash('Nieprawidłowa ilość.', 'warning'); return redirect(redirect_url)
+    message, category, status = cart_add(dish_id, quantity)
+    if status != 503: flash(message, category) # Błąd połączenia zgłosił już get_db_connection()
     return redirect(redirect_url)
 
 @app.route('/cart')
@@ -299,17 +699,56 @@ def view_cart():
             except (KeyError, ValueError, TypeError) as e:
                 app.logger.warning(f"Usuwanie błędnego elem. z koszyka ID {item_id_str}: {e}"); flash(f"Produkt ID {item_id_str} usunięty (błędne dane).", "warning"); del cart[item_id_str]; cart_changed = True
     if cart_changed: session['cart'] = cart; session.modified = True
+    recommended = related_dishes([item['id'] for item in items_display]) if items_display else []
     # Przekazujemy total_price do szablonu
-    return render_template('cart.html', cart_items=items_display, total_price=total_price)
+    return render_template('cart.html', cart_items=items_display, total_price=total_price, recommended_dishes=recommended)
+
+@app.route('/cart/update/<int:dish_id>', methods=['POST'])
+def update_cart_quantity(dish_id):
+    if 'user_id' not in session: flash('Zaloguj się.', 'warning'); return redirect(url_for('login'))
+    quantity = parse_quantity(request.form.get('quantity'))
+    if quantity is None: flash('Nieprawidłowa ilość.', 'warning')
+    else: message, category, _ = cart_set_quantity(dish_id, quantity); flash(message, category)
+    return redirect(url_for('view_cart'))
 
 @app.route('/cart/remove/<dish_id>', methods=['POST'])
 def remove_from_cart(dish_id):
     if 'user_id' not in session: flash('Zaloguj się.', 'warning'); return redirect(url_for('login'))
-    cart = session.get('cart', {}); dish_id_str = str(dish_id)
-    if dish_id_str in cart: item_name = cart[dish_id_str].get('name', f'Produkt ID {dish_id_str}'); del cart[dish_id_str]; session['cart'] = cart; session.modified = True; flash(f"Usunięto '{item_name}'.", 'info')
-    else: flash('Tego produktu nie ma w koszyku.', 'warning')
+    message, category, _ = cart_remove(dish_id); flash(message, category)
     return redirect(url_for('view_cart'))
 
+# --- Koszyk: API JSON (progressive enhancement w restaurant_detail.html / cart.html) ---
+def cart_json_response(message, category, status):
+    return jsonify({'ok': status == 200, 'message': message, 'category': category, 'cart': cart_summary()}), status
+
+def api_quantity(default=None):
+    payload = request.get_json(silent=True) or {}
+    return parse_quantity(payload.get('quantity', request.form.get('quantity')), default)
+
+@app.route('/api/cart', methods=['GET'])
+def api_cart():
+    if 'user_id' not in session: return jsonify({'ok': False, 'message': 'Musisz być zalogowany.', 'login_url': url_for('login')}), 401
+    return jsonify({'ok': True, 'cart': cart_summary()})
+
+@app.route('/api/cart/add/<int:dish_id>', methods=['POST'])
+def api_cart_add(dish_id):
+    if 'user_id' not in session: return jsonify({'ok': False, 'message': 'Musisz być zalogowany.', 'login_url': url_for('login')}), 401
+    quantity = api_quantity(1)
+    if not quantity or quantity <= 0: return cart_json_response('Nieprawidłowa ilość.', 'warning', 400)
+    return cart_json_response(*cart_add(dish_id, quantity, quiet=True)) # Błąd połączenia trafia do JSON, nie do flash
+
+@app.route('/api/cart/update/<int:dish_id>', methods=['POST'])
+def api_cart_update(dish_id):
+    if 'user_id' not in session: return jsonify({'ok': False, 'message': 'Musisz być zalogowany.', 'login_url': url_for('login')}), 401
+    quantity = api_quantity()
+    if quantity is None: return cart_json_response('Nieprawidłowa ilość.', 'warning', 400)
+    return cart_json_response(*cart_set_quantity(dish_id, quantity))
+
+@app.route('/api/cart/remove/<int:dish_id>', methods=['POST'])
+def api_cart_remove(dish_id):
+    if 'user_id' not in session: return jsonify({'ok': False, 'message': 'Musisz być zalogowany.', 'login_url': url_for('login')}), 401
+    return cart_json_response(*cart_remove(dish_id))
+
 # --- Przepływ Płatności i Zamówienia ---
 
 @app.route('/payment', methods=['GET'])
@@ -329,7 +768,10 @@ def payment_page():
         try: price = float(item_data['price']); quantity = int(item_data['quantity']); total_price += price * quantity
         except: pass # Ignoruj błędy tutaj, walidacja była w view_cart
 
-    return render_template('payment.html', total_price=total_price)
+    # Jeden klucz na checkout - odświeżenie strony płatności nie tworzy nowego
+    checkout_token = session.get('checkout_token') or str(uuid.uuid4())
+    session['checkout_token'] = checkout_token
+    return render_template('payment.html', total_price=total_price, checkout_token=checkout_token)
 
 @app.route('/place_order', methods=['POST'])
 def place_order():
@@ -338,8 +780,24 @@ def place_order():
         flash('Musisz być zalogowany, aby złożyć zamówienie.', 'warning')
         return redirect(url_for('login'))
 
+    idempotency_key = parse_idempotency_key(request.form.get('idempotency_key'))
+    if idempotency_key:
+        cached = ORDER_IDEMPOTENCY_CACHE.get(idempotency_key)
+        if cached and cached[0] == session['user_id']:
+            orders_logger.info(f"Powtórzone place_order (cache) dla zam. #{cached[1]}")
+            finish_checkout(cached[1], idempotency_key); return redirect(url_for('order_confirmation', order_id=cached[1]))
+
     cart = session.get('cart', {})
     if not cart:
+        # Powtórzenie po udanym zamówieniu (koszyk już wyczyszczony) na innym workerze
+        if idempotency_key:
+            conn = get_db_connection()
+            if conn:
+                try:
+                    with conn.cursor() as cursor: existing_order_id = find_idempotent_order(cursor, idempotency_key, session['user_id'])
+                except Exception as e: note_db_failure(e); app.logger.error(f"Błąd sprawdzania klucza idempotencji: {e}"); existing_order_id = None
+                finally: conn.close()
+                if existing_order_id: finish_checkout(existing_order_id, idempotency_key); return redirect(url_for('order_confirmation', order_id=existing_order_id))
         flash('Twój koszyk jest pusty.', 'warning')
         return redirect(url_for('view_cart'))
 
@@ -362,17 +820,30 @@ def place_order():
     cursor = None; new_order_id = None
     try:
         cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cursor.execute('INSERT INTO "Orders" ("UserID", "TotalPrice", "Status") VALUES (%s, %s, %s) RETURNING "OrderID"', (session['user_id'], total_price, 'Złożone'))
+        if idempotency_key:
+            # Równoległe żądanie z tym samym kluczem czeka tu na commit/rollback pierwszego
+            cursor.execute('INSERT INTO "OrderIdempotencyKeys" ("IdempotencyKey", "UserID") VALUES (%s, %s) ON CONFLICT ("IdempotencyKey") DO NOTHING', (idempotency_key, session['user_id']))
+            if cursor.rowcount == 0:
+                existing_order_id = find_idempotent_order(cursor, idempotency_key, session['user_id']); conn.rollback()
+                if existing_order_id:
+                    orders_logger.info(f"Powtórzone place_order dla zam. #{existing_order_id}")
+                    finish_checkout(existing_order_id, idempotency_key)
+                    return redirect(url_for('order_confirmation', order_id=existing_order_id))
+                session.pop('checkout_token', None); flash('Sesja płatności wygasła. Spróbuj ponownie.', 'warning')
+                return redirect(url_for('payment_page'))
+        cursor.execute('INSERT INTO "Orders" ("UserID", "TotalPrice", "Status") VALUES (%s, %s, %s) RETURNING "OrderID", "OrderDate"', (session['user_id'], total_price, 'Złożone'))
         result = cursor.fetchone()
-        if result: new_order_id = result['OrderID']; app.logger.info(f"Zamówienie #{new_order_id} dla UserID: {session['user_id']}")
+        if result: new_order_id = result['OrderID']; new_order_date = result['OrderDate']; orders_logger.info(f"Zamówienie #{new_order_id} dla UserID: {session['user_id']}")
         else: raise Exception("Nie pobrano ID nowego zamówienia.")
 
-        insert_item_sql = 'INSERT INTO "OrderItems" ("OrderID", "DishID", "Quantity", "PricePerItem") VALUES (%s, %s, %s, %s)'
-        items_to_insert = [(new_order_id, item['dish_id'], item['quantity'], item['price_per_item']) for item in order_items_data]
+        # "OrderDate" jest kluczem partycjonowania - pozycje trafiają do tej samej partycji miesięcznej co zamówienie
+        insert_item_sql = 'INSERT INTO "OrderItems" ("OrderID", "OrderDate", "DishID", "Quantity", "PricePerItem") VALUES (%s, %s, %s, %s, %s)'
+        items_to_insert = [(new_order_id, new_order_date, item['dish_id'], item['quantity'], item['price_per_item']) for item in order_items_data]
         cursor.executemany(insert_item_sql, items_to_insert)
-        app.logger.info(f"Dodano {len(items_to_insert)} pozycji do zam. #{new_order_id}")
+        orders_logger.info(f"Dodano {len(items_to_insert)} pozycji do zam. #{new_order_id}")
+        if idempotency_key: cursor.execute('UPDATE "OrderIdempotencyKeys" SET "OrderID" = %s WHERE "IdempotencyKey" = %s', (new_order_id, idempotency_key))
 
-        conn.commit(); session.pop('cart', None); session.modified = True # Wyczyść koszyk
+        conn.commit(); finish_checkout(new_order_id, idempotency_key) # Wyczyść koszyk
         flash('Zamówienie złożone pomyślnie!', 'success')
         # Zamknij połączenie przed przekierowaniem
         if cursor: cursor.close()
@@ -380,7 +851,7 @@ def place_order():
         return redirect(url_for('order_confirmation', order_id=new_order_id))
 
     except Exception as e:
-        conn.rollback(); app.logger.error(f"BŁĄD place_order dla UserID {session.get('user_id')}: {e}"); flash('Błąd podczas składania zamówienia.', 'danger')
+        note_db_failure(e); conn.rollback(); app.logger.error(f"BŁĄD place_order dla UserID {session.get('user_id')}: {e}"); flash('Błąd podczas składania zamówienia.', 'danger')
         return redirect(url_for('payment_page')) # Wróć do płatności w razie błędu
     finally:
         if cursor and not cursor.closed: cursor.close()
@@ -402,26 +873,34 @@ def my_orders():
         return redirect(url_for('login'))
 
     user_id = session['user_id']
-    orders_list = []
+    show_archive = request.args.get('archive') == '1' # Archiwum tylko na żądanie
+    orders_list = []; archived_orders = []
     conn = get_db_connection()
-    if not conn: return render_template('my_orders.html', orders=orders_list) # Pokaż pustą listę przy błędzie DB
+    if not conn: return render_template('my_orders.html', orders=orders_list, archived_orders=archived_orders, show_archive=show_archive) # Pokaż pustą listę przy błędzie DB
 
     cursor = None
     try:
         cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        # Bieżące partycje - zakończone zamówienia sprzed okresu retencji są już w archiwum
         cursor.execute(
             'SELECT "OrderID", "OrderDate", "TotalPrice", "Status" FROM "Orders" WHERE "UserID" = %s ORDER BY "OrderDate" DESC',
             (user_id,)
         )
         orders_list = rows_to_dicts(cursor, cursor.fetchall())
+        if show_archive:
+            cursor.execute(
+                'SELECT "OrderID", "OrderDate", "TotalPrice", "Status" FROM "OrdersArchive" WHERE "UserID" = %s ORDER BY "OrderDate" DESC',
+                (user_id,)
+            )
+            archived_orders = rows_to_dicts(cursor, cursor.fetchall())
     except Exception as e:
-        app.logger.error(f"Błąd pobierania zamówień dla UserID {user_id}: {e}")
+        note_db_failure(e); app.logger.error(f"Błąd pobierania zamówień dla UserID {user_id}: {e}")
         flash("Wystąpił błąd podczas pobierania historii zamówień.", "danger")
     finally:
         if cursor: cursor.close()
         if conn and not conn.closed: conn.close()
 
-    return render_template('my_orders.html', orders=orders_list)
+    return render_template('my_orders.html', orders=orders_list, archived_orders=archived_orders, show_archive=show_archive)
 
 
 @app.route('/orders/<int:order_id>')
@@ -446,6 +925,14 @@ def track_order_detail(order_id):
             (order_id,)
         )
         order_details = row_to_dict(cursor, cursor.fetchone())
+        is_archived = False
+        if not order_details:
+            # Zakończone, starsze zamówienia są przenoszone do archiwum przez maintenance.py
+            cursor.execute(
+                'SELECT "OrderID", "UserID", "OrderDate", "TotalPrice", "Status" FROM "OrdersArchive" WHERE "OrderID" = %s',
+                (order_id,)
+            )
+            order_details = row_to_dict(cursor, cursor.fetchone()); is_archived = order_details is not None
 
         # Sprawdzenie, czy zamówienie istnieje i czy należy do zalogowanego użytkownika (lub czy to admin)
         if not order_details:
@@ -456,20 +943,30 @@ def track_order_detail(order_id):
             return redirect(url_for('my_orders'))
 
         # Pobierz pozycje zamówienia, dołączając dane dań
-        sql_items = """
-            SELECT oi."Quantity", oi."PricePerItem", d."Name", d."ImageURL"
-            FROM "OrderItems" oi
-            JOIN "Dishes" d ON oi."DishID" = d."DishID"
-            WHERE oi."OrderID" = %s
-        """
-        cursor.execute(sql_items, (order_id,))
+        if is_archived:
+            sql_items = """
+                SELECT oi."Quantity", oi."PricePerItem", d."Name", d."ImageURL"
+                FROM "OrderItemsArchive" oi
+                JOIN "Dishes" d ON oi."DishID" = d."DishID"
+                WHERE oi."OrderID" = %s
+            """
+            cursor.execute(sql_items, (order_id,))
+        else:
+            # Warunek na "OrderDate" pozwala odciąć pozostałe partycje
+            sql_items = """
+                SELECT oi."Quantity", oi."PricePerItem", d."Name", d."ImageURL"
+                FROM "OrderItems" oi
+                JOIN "Dishes" d ON oi."DishID" = d."DishID"
+                WHERE oi."OrderID" = %s AND oi."OrderDate" = %s
+            """
+            cursor.execute(sql_items, (order_id, order_details['OrderDate']))
         order_items = rows_to_dicts(cursor, cursor.fetchall())
 
     except Forbidden as e: # Obsługa abort(403) 
          app.logger.warning(f"Odmowa dostępu (403) dla UserID {user_id} do zamówienia ID {order_id}")
          return redirect(url_for('my_orders'))
     except Exception as e:
-        app.logger.error(f"Błąd pobierania szczegółów zamówienia ID {order_id}: {e}")
+        note_db_failure(e); app.logger.error(f"Błąd pobierania szczegółów zamówienia ID {order_id}: {e}")
         flash("Wystąpił błąd podczas pobierania szczegółów zamówienia.", "danger")
         return redirect(url_for('my_orders'))
     finally:
@@ -486,6 +983,15 @@ def track_order_detail(order_id):
 def admin_dashboard():
     return render_template('admin/admin_dashboard.html')
 
+@app.route('/admin/metrics')
+@admin_required
+def admin_metrics():
+    """Metryki procesu (ten worker gunicorna): potok logów, bezpieczniki, indeksy i cache w pamięci."""
+    return jsonify(pid=os.getpid(), logging=LOG_PIPELINE.metrics(),
+                   indexes={'suggest_entries': len(SUGGEST_INDEX), 'suggest_built': SUGGEST_INDEX.is_built()},
+                   caches={'recommendations': len(RECOMMENDATIONS_CACHE), 'order_idempotency': len(ORDER_IDEMPOTENCY_CACHE), 'catalog_fallback': len(CATALOG_FALLBACK_CACHE)},
+                   breakers={b.name: b.snapshot() for b in (DB_BREAKER, S3_BREAKER)})
+
 # --- Zarządzanie Restauracjami ---
 @app.route('/admin/restaurants', methods=['GET', 'POST'])
 @admin_required
@@ -512,11 +1018,13 @@ def manage_restaurants():
                             image_s3_url = upload_file_to_s3(image_file, S3_BUCKET_NAME, unique_object_key)
                             if not image_s3_url: flash('Błąd wgrywania pliku do S3.', 'danger')
                         else: flash('Niedozwolony typ pliku.', 'warning')
+                    latitude, longitude = geo.geocode(postal_code, city) or (None, None)
                     try:
-                        sql = 'INSERT INTO "Restaurants" ("Name", "CuisineType", "Street", "StreetNumber", "PostalCode", "City", "ImageURL") VALUES (%s, %s, %s, %s, %s, %s, %s)'
-                        cursor.execute(sql, (name, cuisine, street, street_number, postal_code, city, image_s3_url))
+                        sql = 'INSERT INTO "Restaurants" ("Name", "CuisineType", "Street", "StreetNumber", "PostalCode", "City", "ImageURL", "Latitude", "Longitude") VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING "RestaurantID"'
+                        cursor.execute(sql, (name, cuisine, street, street_number, postal_code, city, image_s3_url, latitude, longitude)); new_restaurant_id = cursor.fetchone()['RestaurantID']
                         conn.commit(); flash(f'Restauracja "{name}" dodana.', 'success')
-                    except Exception as e: conn.rollback(); app.logger.error(f"Błąd dodawania restauracji '{name}': {e}"); flash('Błąd zapisu.', 'danger');
+                        RESTAURANT_GEO_INDEX.upsert(new_restaurant_id, latitude, longitude); SUGGEST_INDEX.upsert_restaurant(new_restaurant_id, name, cuisine, city)
+                    except Exception as e: note_db_failure(e); conn.rollback(); app.logger.error(f"Błąd dodawania restauracji '{name}': {e}"); flash('Błąd zapisu.', 'danger');
             elif action == 'delete':
                  form_submitted = True; restaurant_id_str = request.form.get('restaurant_id')
                  if not restaurant_id_str: flash('Nie podano ID.', 'warning')
@@ -527,15 +1035,17 @@ def manage_restaurants():
                          image_s3_url_to_delete = rest_img_row['ImageURL'] if rest_img_row and rest_img_row['ImageURL'] else None
                          cursor.execute('SELECT "ImageURL" FROM "Dishes" WHERE "RestaurantID" = %s', (restaurant_id,)); dishes_images_rows = cursor.fetchall()
                          cursor.execute('DELETE FROM "Restaurants" WHERE "RestaurantID" = %s', (restaurant_id,)); deleted_count = cursor.rowcount
+                         if deleted_count > 0:
+                             # Pliki z S3 usuwa worker, dopiero gdy usunięcie z bazy zostanie zatwierdzone
+                             for dish_image_row in dishes_images_rows: enqueue_s3_delete(cursor, dish_image_row['ImageURL'])
+                             enqueue_s3_delete(cursor, image_s3_url_to_delete)
                          conn.commit()
                          if deleted_count > 0:
                              app.logger.info(f"Usunięto restaurację ID: {restaurant_id}"); flash(f'Restauracja ID: {restaurant_id} usunięta.', 'success')
-                             for dish_image_row in dishes_images_rows:
-                                 if dish_image_row['ImageURL']: delete_file_from_s3(S3_BUCKET_NAME, dish_image_row['ImageURL'])
-                             if image_s3_url_to_delete: delete_file_from_s3(S3_BUCKET_NAME, image_s3_url_to_delete)
+                             RESTAURANT_GEO_INDEX.remove(restaurant_id); SUGGEST_INDEX.remove_restaurant(restaurant_id)
                          else: flash(f'Nie znaleziono restauracji ID {restaurant_id}.', 'warning')
                      except ValueError: flash('Nieprawidłowe ID.', 'warning')
-                     except Exception as e: conn.rollback(); app.logger.error(f"Błąd usuwania restauracji ID {restaurant_id_str}: {e}"); flash('Błąd usuwania.', 'danger')
+                     except Exception as e: note_db_failure(e); conn.rollback(); app.logger.error(f"Błąd usuwania restauracji ID {restaurant_id_str}: {e}"); flash('Błąd usuwania.', 'danger')
             if form_submitted:
                 if cursor: cursor.close();
                 if conn and not conn.closed: conn.close()
@@ -544,7 +1054,7 @@ def manage_restaurants():
         restaurants = rows_to_dicts(cursor, cursor.fetchall())
         restaurants_display = [{'FullAddress': format_address(r.get('Street'), r.get('StreetNumber'), r.get('PostalCode'), r.get('City')) or "-", **r} for r in restaurants]
         return render_template('admin/manage_restaurants.html', restaurants=restaurants_display)
-    except Exception as e: app.logger.error(f"Błąd w manage_restaurants: {e}"); flash("Wystąpił błąd.", "danger"); return redirect(url_for('admin_dashboard'))
+    except Exception as e: note_db_failure(e); app.logger.error(f"Błąd w manage_restaurants: {e}"); flash("Wystąpił błąd.", "danger"); return redirect(url_for('admin_dashboard'))
     finally:
          if cursor: cursor.close();
          if conn and not conn.closed: conn.close()
@@ -574,21 +1084,24 @@ def edit_restaurant(restaurant_id):
                     if new_image_uploaded_url: image_url_to_save = new_image_uploaded_url; delete_old_image = True
                     else: flash('Błąd wgrywania nowego obrazka.', 'danger'); image_url_to_save = original_image_url
                 else: flash('Niedozwolony typ pliku.', 'warning'); image_url_to_save = original_image_url
+            latitude, longitude = geo.geocode(postal_code, city) or (None, None)
             try:
-                sql = """UPDATE "Restaurants" SET "Name"=%s, "CuisineType"=%s, "Street"=%s, "StreetNumber"=%s, "PostalCode"=%s, "City"=%s, "ImageURL"=%s WHERE "RestaurantID"=%s"""
-                cursor.execute(sql, (name, cuisine, street, street_number, postal_code, city, image_url_to_save, restaurant_id)); conn.commit()
+                sql = """UPDATE "Restaurants" SET "Name"=%s, "CuisineType"=%s, "Street"=%s, "StreetNumber"=%s, "PostalCode"=%s, "City"=%s, "ImageURL"=%s, "Latitude"=%s, "Longitude"=%s WHERE "RestaurantID"=%s"""
+                cursor.execute(sql, (name, cuisine, street, street_number, postal_code, city, image_url_to_save, latitude, longitude, restaurant_id))
+                if delete_old_image: enqueue_s3_delete(cursor, original_image_url)
+                conn.commit()
                 flash(f'Restauracja "{name}" zaktualizowana.', 'success')
-                if delete_old_image and original_image_url: delete_file_from_s3(S3_BUCKET_NAME, original_image_url)
+                RESTAURANT_GEO_INDEX.upsert(restaurant_id, latitude, longitude); SUGGEST_INDEX.upsert_restaurant(restaurant_id, name, cuisine, city)
                 if cursor: cursor.close();
                 if conn and not conn.closed: conn.close()
                 return redirect(url_for('manage_restaurants'))
             except Exception as e:
-                conn.rollback(); app.logger.error(f"Błąd aktualizacji restauracji ID {restaurant_id}: {e}"); flash('Błąd zapisu.', 'danger');
+                note_db_failure(e); conn.rollback(); app.logger.error(f"Błąd aktualizacji restauracji ID {restaurant_id}: {e}"); flash('Błąd zapisu.', 'danger');
                 if new_image_uploaded_url: delete_file_from_s3(S3_BUCKET_NAME, new_image_uploaded_url)
                 failed_data = request.form.to_dict(); failed_data['RestaurantID'] = restaurant_id; failed_data['ImageURL'] = original_image_url
                 return render_template('admin/editRestaurant.html', restaurant=failed_data)
         return render_template('admin/editRestaurant.html', restaurant=restaurant)
-    except Exception as e: app.logger.error(f"Błąd edycji restauracji ID {restaurant_id}: {e}"); flash("Wystąpił błąd.", "danger"); return redirect(url_for('manage_restaurants'))
+    except Exception as e: note_db_failure(e); app.logger.error(f"Błąd edycji restauracji ID {restaurant_id}: {e}"); flash("Wystąpił błąd.", "danger"); return redirect(url_for('manage_restaurants'))
     finally:
         if cursor: cursor.close();
         if conn and not conn.closed: conn.close()
@@ -626,10 +1139,10 @@ def manage_dishes(restaurant_id=None):
                                  if not image_s3_url: flash('Błąd wgrywania obrazka dania.', 'danger')
                              else: flash('Niedozwolony typ pliku.', 'warning')
                         try:
-                            sql = 'INSERT INTO "Dishes" ("RestaurantID", "Name", "Description", "Price", "ImageURL") VALUES (%s, %s, %s, %s, %s)'
-                            cursor.execute(sql, (current_restaurant_id, name, description, price_decimal, image_s3_url)); conn.commit()
-                            flash(f'Danie "{name}" dodane.', 'success')
-                        except Exception as e: conn.rollback(); app.logger.error(f"Błąd dodawania dania '{name}': {e}"); flash('Błąd zapisu dania.', 'danger');
+                            sql = 'INSERT INTO "Dishes" ("RestaurantID", "Name", "Description", "Price", "ImageURL") VALUES (%s, %s, %s, %s, %s) RETURNING "DishID"'
+                            cursor.execute(sql, (current_restaurant_id, name, description, price_decimal, image_s3_url)); new_dish_id = cursor.fetchone()['DishID']; conn.commit()
+                            flash(f'Danie "{name}" dodane.', 'success'); SUGGEST_INDEX.upsert_dish(new_dish_id, name, current_restaurant_id)
+                        except Exception as e: note_db_failure(e); conn.rollback(); app.logger.error(f"Błąd dodawania dania '{name}': {e}"); flash('Błąd zapisu dania.', 'danger');
             elif action == 'delete':
                  form_submitted = True; dish_id_str = request.form.get('dish_id')
                  if not dish_id_str or not current_restaurant_id: flash('Brak ID dania/restauracji.', 'warning')
@@ -637,14 +1150,15 @@ def manage_dishes(restaurant_id=None):
                       try:
                           dish_id = int(dish_id_str); cursor.execute('SELECT "ImageURL" FROM "Dishes" WHERE "DishID" = %s', (dish_id,)); dish_img_row = cursor.fetchone()
                           image_s3_url_to_delete = dish_img_row['ImageURL'] if dish_img_row and dish_img_row['ImageURL'] else None
-                          cursor.execute('DELETE FROM "Dishes" WHERE "DishID" = %s AND "RestaurantID" = %s', (dish_id, current_restaurant_id)); deleted_count = cursor.rowcount; conn.commit()
+                          cursor.execute('DELETE FROM "Dishes" WHERE "DishID" = %s AND "RestaurantID" = %s', (dish_id, current_restaurant_id)); deleted_count = cursor.rowcount
+                          # Usuń plik z S3 tylko jeśli usunięcie z bazy się powiodło (zadanie w tej samej transakcji)
+                          if deleted_count > 0: enqueue_s3_delete(cursor, image_s3_url_to_delete)
+                          conn.commit()
                           if deleted_count > 0:
-                              app.logger.info(f"Usunięto danie ID: {dish_id}"); flash(f'Danie ID: {dish_id} usunięte.', 'success');
-                              # Usuń plik z S3 tylko jeśli usunięcie z bazy się powiodło
-                              if image_s3_url_to_delete: delete_file_from_s3(S3_BUCKET_NAME, image_s3_url_to_delete)
+                              app.logger.info(f"Usunięto danie ID: {dish_id}"); flash(f'Danie ID: {dish_id} usunięte.', 'success'); SUGGEST_INDEX.remove_dish(dish_id)
                           else: flash(f'Nie znaleziono dania ID {dish_id}.', 'warning')
                       except ValueError: flash('Nieprawidłowe ID dania.', 'warning')
-                      except Exception as e: conn.rollback(); app.logger.error(f"Błąd usuwania dania ID {dish_id_str}: {e}"); flash('Błąd usuwania.', 'danger')
+                      except Exception as e: note_db_failure(e); conn.rollback(); app.logger.error(f"Błąd usuwania dania ID {dish_id_str}: {e}"); flash('Błąd usuwania.', 'danger')
             if form_submitted:
                  redirect_to_restaurant_id = current_restaurant_id or restaurant_id;
                  if cursor: cursor.close();
@@ -657,7 +1171,7 @@ def manage_dishes(restaurant_id=None):
                 selected_restaurant_name = rest_name_row['Name']; cursor.execute('SELECT "DishID", "Name", "Description", "Price", "ImageURL" FROM "Dishes" WHERE "RestaurantID" = %s ORDER BY "Name"', (restaurant_id,)); dishes_display = rows_to_dicts(cursor, cursor.fetchall())
             else: flash(f"Restauracja ID {restaurant_id} nie znaleziona.", "warning"); return redirect(url_for('manage_dishes'))
         return render_template('admin/manage_dishes.html', dishes=dishes_display, restaurants=restaurants_list, selected_restaurant_id=restaurant_id, selected_restaurant_name=selected_restaurant_name)
-    except Exception as e: app.logger.error(f"Błąd w manage_dishes: {e}"); flash("Wystąpił błąd.", "danger"); return redirect(url_for('admin_dashboard'))
+    except Exception as e: note_db_failure(e); app.logger.error(f"Błąd w manage_dishes: {e}"); flash("Wystąpił błąd.", "danger"); return redirect(url_for('admin_dashboard'))
     finally:
          if cursor: cursor.close();
          if conn and not conn.closed: conn.close()
@@ -694,21 +1208,22 @@ def edit_dish(dish_id):
                      else: flash('Niedozwolony typ pliku.', 'warning'); image_url_to_save = original_image_url
                  try:
                      sql = """UPDATE "Dishes" SET "Name"=%s, "Description"=%s, "Price"=%s, "RestaurantID"=%s, "ImageURL"=%s WHERE "DishID"=%s"""
-                     cursor.execute(sql, (name, description, price_decimal, new_restaurant_id, image_url_to_save, dish_id)); conn.commit()
-                     flash(f'Danie "{name}" zaktualizowane.', 'success')
-                     if delete_old_image and original_image_url: delete_file_from_s3(S3_BUCKET_NAME, original_image_url)
+                     cursor.execute(sql, (name, description, price_decimal, new_restaurant_id, image_url_to_save, dish_id))
+                     if delete_old_image: enqueue_s3_delete(cursor, original_image_url)
+                     conn.commit()
+                     flash(f'Danie "{name}" zaktualizowane.', 'success'); SUGGEST_INDEX.upsert_dish(dish_id, name, new_restaurant_id)
                      if cursor: cursor.close();
                      if conn and not conn.closed: conn.close()
                      return redirect(url_for('manage_dishes', restaurant_id=new_restaurant_id))
                  except Exception as e:
-                     conn.rollback(); app.logger.error(f"Błąd aktualizacji dania ID {dish_id}: {e}"); flash('Błąd zapisu.', 'danger');
+                     note_db_failure(e); conn.rollback(); app.logger.error(f"Błąd aktualizacji dania ID {dish_id}: {e}"); flash('Błąd zapisu.', 'danger');
                      if new_image_uploaded_url: delete_file_from_s3(S3_BUCKET_NAME, new_image_uploaded_url)
                      failed_data = request.form.to_dict(); failed_data['DishID'] = dish_id; failed_data['ImageURL'] = original_image_url
                      return render_template('admin/editMenuItem.html', dish=failed_data, restaurants=restaurants_list)
             else: return render_template('admin/editMenuItem.html', dish=dish, restaurants=restaurants_list)
         return render_template('admin/editMenuItem.html', dish=dish, restaurants=restaurants_list)
     except Exception as e:
-        app.logger.error(f"Błąd edycji dania ID {dish_id}: {e}"); flash("Wystąpił błąd.", "danger"); fallback_restaurant_id = dish.get('RestaurantID') if isinstance(dish, dict) else None
+        note_db_failure(e); app.logger.error(f"Błąd edycji dania ID {dish_id}: {e}"); flash("Wystąpił błąd.", "danger"); fallback_restaurant_id = dish.get('RestaurantID') if isinstance(dish, dict) else None
         redirect_url = url_for('manage_dishes', restaurant_id=fallback_restaurant_id) if fallback_restaurant_id else url_for('admin_dashboard')
         return redirect(redirect_url)
     finally:
@@ -761,7 +1276,7 @@ def manage_users():
             except ValueError:
                 flash('Nieprawidłowe ID użytkownika.', 'warning')
             except Exception as e:
-                conn.rollback()
+                note_db_failure(e); conn.rollback()
                 app.logger.error(f"Błąd usuwania użytkownika ID {user_id_to_delete_str} przez UserID {current_user_id}: {e}")
                 flash('Wystąpił błąd podczas usuwania użytkownika.', 'danger')
             finally:
@@ -776,18 +1291,16 @@ def manage_users():
     # Metoda GET - wyświetlanie listy użytkowników
     users_display = []
     try:
-        if cursor is None or cursor.closed:
-             cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cursor.execute('SELECT "UserID", "Username", "IsAdmin" FROM "Users" ORDER BY "Username"')
-        users_display = rows_to_dicts(cursor, cursor.fetchall())
+        users_display = StreamedRows(conn, 'SELECT "UserID", "Username", "IsAdmin" FROM "Users" ORDER BY "Username"')
+        conn = None # Połączenie zamknie StreamedRows po wyrenderowaniu strony
     except Exception as e:
-        app.logger.error(f"Błąd pobierania listy użytkowników: {e}")
+        note_db_failure(e); app.logger.error(f"Błąd pobierania listy użytkowników: {e}")
         flash("Błąd pobierania listy użytkowników.", "danger")
     finally:
         if cursor and not cursor.closed: cursor.close()
         if conn and not conn.closed: conn.close()
 
-    return render_template('admin/manage_users.html', users=users_display)
+    return stream_page('admin/manage_users.html', users=users_display)
 
 
 @app.route('/admin/users/<int:user_id>/edit', methods=['GET', 'POST'])
@@ -851,7 +1364,7 @@ def edit_user(user_id):
                 return redirect(url_for('manage_users'))
 
             except Exception as e:
-                conn.rollback()
+                note_db_failure(e); conn.rollback()
                 app.logger.error(f"Błąd aktualizacji użytkownika ID {user_id}: {e}")
                 flash('Wystąpił błąd podczas zapisu zmian.', 'danger')
                 # Renderuj ponownie formularz z danymi, które użytkownik próbował zapisać
@@ -864,7 +1377,7 @@ def edit_user(user_id):
         return render_template('admin/edit_user.html', user=user)
 
     except Exception as e:
-        app.logger.error(f"Błąd edycji użytkownika ID {user_id}: {e}"); flash("Wystąpił błąd.", "danger")
+        note_db_failure(e); app.logger.error(f"Błąd edycji użytkownika ID {user_id}: {e}"); flash("Wystąpił błąd.", "danger")
         return redirect(url_for('manage_users'))
     finally:
         if cursor and not cursor.closed: cursor.close()
@@ -889,24 +1402,35 @@ def view_orders():
                     try:
                         order_id = int(order_id_str)
                         cursor.execute('UPDATE "Orders" SET "Status" = %s WHERE "OrderID" = %s', (new_status, order_id)); conn.commit();
-                        app.logger.info(f"Zmieniono status zam. #{order_id} na '{new_status}'."); flash('Status zamówienia zaktualizowany.', 'success')
+                        orders_logger.info(f"Zmieniono status zam. #{order_id} na '{new_status}'."); flash('Status zamówienia zaktualizowany.', 'success')
                     except ValueError: flash('Nieprawidłowe ID zamówienia.', 'warning')
-                    except Exception as e: conn.rollback(); app.logger.error(f"Błąd aktualizacji statusu zam. #{order_id_str}: {e}"); flash('Błąd aktualizacji statusu.', 'danger')
+                    except Exception as e: note_db_failure(e); conn.rollback(); app.logger.error(f"Błąd aktualizacji statusu zam. #{order_id_str}: {e}"); flash('Błąd aktualizacji statusu.', 'danger')
                 else: flash('Nieprawidłowe dane do aktualizacji.', 'warning')
             if form_submitted:
                 if cursor: cursor.close();
                 if conn and not conn.closed: conn.close()
-                return redirect(url_for('view_orders'))
-        sql = """SELECT o."OrderID", u."Username", o."OrderDate", o."TotalPrice", o."Status" FROM "Orders" o LEFT JOIN "Users" u ON o."UserID" = u."UserID" ORDER BY o."OrderDate" DESC"""
-        cursor.execute(sql); orders = rows_to_dicts(cursor, cursor.fetchall()); orders_display = []
-        for o in orders: o['Username'] = o['Username'] or "[Usunięty]"; orders_display.append(o)
-        return render_template('admin/view_orders.html', orders=orders_display)
-    except Exception as e: app.logger.error(f"Błąd w widoku zamówień admina: {e}"); flash("Błąd pobierania zamówień.", "danger"); return redirect(url_for('admin_dashboard'))
+                return redirect(url_for('view_orders', before=request.args.get('before')))
+        # Te same zapytania sprawdza `migrate.py check` (admin_orders_page, admin_orders_next_page)
+        before = parse_order_cursor(request.args.get('before'))
+        if before:
+            sql = """SELECT o."OrderID", u."Username", o."OrderDate", o."TotalPrice", o."Status" FROM "Orders" o LEFT JOIN "Users" u ON o."UserID" = u."UserID" WHERE (o."OrderDate", o."OrderID") < (%s, %s) ORDER BY o."OrderDate" DESC, o."OrderID" DESC LIMIT %s"""
+            params = (*before, ADMIN_ORDERS_PAGE_SIZE)
+        else:
+            sql = """SELECT o."OrderID", u."Username", o."OrderDate", o."TotalPrice", o."Status" FROM "Orders" o LEFT JOIN "Users" u ON o."UserID" = u."UserID" ORDER BY o."OrderDate" DESC, o."OrderID" DESC LIMIT %s"""
+            params = (ADMIN_ORDERS_PAGE_SIZE,)
+        orders = StreamedRows(conn, sql, params, transform=lambda o: dict(o, Username=o['Username'] or "[Usunięty]"))
+        conn = None # Połączenie zamknie StreamedRows po wyrenderowaniu strony
+        return stream_page('admin/view_orders.html', orders=orders, page_size=ADMIN_ORDERS_PAGE_SIZE, first_page=before is None)
+    except Exception as e: note_db_failure(e); app.logger.error(f"Błąd w widoku zamówień admina: {e}"); flash("Błąd pobierania zamówień.", "danger"); return redirect(url_for('admin_dashboard'))
     finally:
          if cursor: cursor.close();
          if conn and not conn.closed: conn.close()
 
 # --- Uruchomienie Aplikacji ---
+# Indeksy w pamięci budowane w tle przy imporcie (każdy worker gunicorna ma własne); worker.py ich nie potrzebuje
+if os.getenv('SUGGEST_WARMUP', 'true').lower() in ['true', '1', 't']: schedule_suggest_refresh()
+if os.getenv('GEO_WARMUP', 'true').lower() in ['true', '1', 't']: schedule_geo_refresh()
+
 if __name__ == '__main__':
     # Uruchomienie lokalne (nie używane przez App Runner)
     app.logger.info("Uruchamianie lokalnego serwera Flask...")
@@ -0,0 +1,88 @@
+"""Bezpieczniki (circuit breakers) dla zależności zewnętrznych: RDS, S3.
+
+Stany: 'closed' (wywołania przechodzą, liczone są kolejne błędy), 'open' (po `failure_threshold`
+błędach z rzędu wywołania od razu kończą się `CircuitOpenError`, bez czekania na timeout),
+'half_open' (po `reset_timeout` sekundach). W stanie półotwartym, jeśli podano `probe`,
+zależność sprawdza próba zdrowia w wątku tła, a żądania dalej dostają szybki błąd; bez
+próby przepuszczane jest jedno wywołanie testowe. Sukces zamyka obwód, błąd otwiera go ponownie.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger('papugo.breaker')
+
+STATE_CLOSED = 'closed'; STATE_OPEN = 'open'; STATE_HALF_OPEN = 'half_open'
+
+class CircuitOpenError(RuntimeError):
+    def __init__(self, name): super().__init__(f"Obwód '{name}' jest otwarty - zależność niedostępna"); self.name = name
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, reset_timeout=30, probe=None, failure_exceptions=(Exception,)):
+        self.name = name; self.failure_threshold = failure_threshold; self.reset_timeout = reset_timeout
+        self.probe = probe; self.failure_exceptions = failure_exceptions
+        self._lock = threading.Lock(); self._state = STATE_CLOSED; self._failures = 0; self._opened_at = None
+        self._trial_in_flight = False; self._probing = False
+        self._stats = {'calls': 0, 'failures': 0, 'rejected': 0, 'opened': 0, 'probes': 0, 'last_error': None}
+
+    @property
+    def state(self):
+        with self._lock: return self._state
+
+    def allow(self):
+        """True, jeśli wywołanie może pójść do zależności; przy okazji przełącza open -> half_open."""
+        start_probe = False
+        with self._lock:
+            if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = STATE_HALF_OPEN; self._trial_in_flight = False
+                logger.info(f"Obwód '{self.name}': half-open")
+            if self._state == STATE_CLOSED: allowed = True
+            elif self._state == STATE_HALF_OPEN and self.probe is None and not self._trial_in_flight: self._trial_in_flight = True; allowed = True
+            else: allowed = False
+            if self._state == STATE_HALF_OPEN and self.probe is not None and not self._probing: self._probing = True; start_probe = True
+            if allowed: self._stats['calls'] += 1
+            else: self._stats['rejected'] += 1
+        if start_probe: threading.Thread(target=self._run_probe, name=f"breaker-probe-{self.name}", daemon=True).start()
+        return allowed
+
+    def record_success(self):
+        with self._lock:
+            if self._state != STATE_CLOSED: logger.info(f"Obwód '{self.name}': closed")
+            self._state = STATE_CLOSED; self._failures = 0; self._trial_in_flight = False
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self._failures += 1; self._stats['failures'] += 1; self._trial_in_flight = False
+            if error is not None: self._stats['last_error'] = f"{type(error).__name__}: {error}"[:300]
+            if self._state == STATE_HALF_OPEN or (self._state == STATE_CLOSED and self._failures >= self.failure_threshold):
+                self._state = STATE_OPEN; self._opened_at = time.monotonic(); self._stats['opened'] += 1
+                logger.warning(f"Obwód '{self.name}': open po {self._failures} błędach ({self._stats['last_error']})")
+
+    def call(self, func, *args, **kwargs):
+        """Wywołuje `func` przez bezpiecznik; błędy spoza `failure_exceptions` nie są liczone jako awaria."""
+        if not self.allow(): raise CircuitOpenError(self.name)
+        try:
+            result = func(*args, **kwargs)
+        except self.failure_exceptions as e:
+            self.record_failure(e); raise
+        except Exception:
+            self.record_success(); raise # Zależność odpowiedziała (np. błąd SQL) - to nie awaria
+        self.record_success()
+        return result
+
+    def _run_probe(self):
+        try:
+            self.probe()
+        except Exception as e:
+            with self._lock: self._stats['probes'] += 1
+            self.record_failure(e)
+        else:
+            with self._lock: self._stats['probes'] += 1
+            self.record_success()
+        finally:
+            with self._lock: self._probing = False
+
+    def snapshot(self):
+        with self._lock:
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at)) if self._state == STATE_OPEN else None
+            return {'state': self._state, 'consecutive_failures': self._failures, 'retry_in_seconds': round(retry_in, 1) if retry_in is not None else None, **self._stats}
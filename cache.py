@@ -0,0 +1,35 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """Prosty, wątkowo bezpieczny cache LRU z czasem życia wpisów (w pamięci procesu)."""
+
+    def __init__(self, maxsize=1024, ttl_seconds=300):
+        self.maxsize = maxsize; self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict(); self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None: return default
+            value, expires_at = entry
+            if expires_at < time.monotonic(): del self._data[key]; return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl_seconds=None):
+        expires_at = time.monotonic() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            self._data[key] = (value, expires_at); self._data.move_to_end(key)
+            while len(self._data) > self.maxsize: self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[0] if entry else default
+
+    def clear(self):
+        with self._lock: self._data.clear()
+
+    def __len__(self): return len(self._data)
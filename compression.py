@@ -0,0 +1,86 @@
+"""Kompresja dynamicznych odpowiedzi (gzip, opcjonalnie brotli) w hooku after_request.
+
+Odpowiedzi buforowane są kompresowane w całości, jeśli przekraczają próg rozmiaru.
+Odpowiedzi strumieniowane (`stream_template`) są kompresowane kawałkami z flushem co
+`stream_flush_bytes`, więc przeglądarka dostaje pierwsze bajty przed końcem renderowania.
+Pliki statyczne (`send_file`, direct_passthrough) zostają bez zmian.
+"""
+import zlib
+
+try:
+    import brotli
+except ImportError: # Brotli jest opcjonalne - bez niego zostaje gzip
+    brotli = None
+
+DEFAULT_MIMETYPES = frozenset({'text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript', 'application/json', 'image/svg+xml'})
+
+def _accepted_encodings(header):
+    """Zwraca zbiór kodowań z Accept-Encoding z q > 0."""
+    accepted = set()
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try: q = float(value)
+                except ValueError: q = 0.0
+        if name and q > 0: accepted.add(name.strip().lower())
+    return accepted
+
+class ResponseCompressor:
+    def __init__(self, app=None, min_size=1024, gzip_level=6, brotli_level=4, stream_flush_bytes=8192, mimetypes=DEFAULT_MIMETYPES, enabled=True):
+        self.min_size = min_size; self.gzip_level = gzip_level; self.brotli_level = brotli_level
+        self.stream_flush_bytes = stream_flush_bytes; self.mimetypes = mimetypes; self.enabled = enabled
+        if app is not None: self.init_app(app)
+
+    def init_app(self, app):
+        app.after_request(self.after_request)
+
+    def choose_encoding(self, accept_encoding):
+        accepted = _accepted_encodings(accept_encoding)
+        if brotli is not None and 'br' in accepted: return 'br'
+        if 'gzip' in accepted: return 'gzip'
+        return None
+
+    def after_request(self, response):
+        from flask import request
+        if not self.enabled or response.direct_passthrough: return response
+        if response.status_code < 200 or response.status_code in (204, 206, 304): return response
+        if 'Content-Encoding' in response.headers or response.mimetype not in self.mimetypes: return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.choose_encoding(request.headers.get('Accept-Encoding'))
+        if not encoding: return response
+
+        if response.is_streamed:
+            response.response = self._compress_stream(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size: return response
+            response.set_data(brotli.compress(data, quality=self.brotli_level) if encoding == 'br' else self._gzip(data))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def _gzip(self, data):
+        compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31) # 31 = nagłówek gzip
+        return compressor.compress(data) + compressor.flush()
+
+    def _compress_stream(self, chunks, encoding):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_level)
+            compress = compressor.process; flush = compressor.flush; finish = compressor.finish
+        else:
+            compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+            compress = compressor.compress; flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH); finish = compressor.flush
+        pending = 0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str): chunk = chunk.encode('utf-8')
+                out = compress(chunk); pending += len(chunk)
+                # Flush co kilka KB: małe kawałki z Jinja osobno pogorszyłyby stopień kompresji
+                if pending >= self.stream_flush_bytes: out += flush(); pending = 0
+                if out: yield out
+            yield finish()
+        finally:
+            if hasattr(chunks, 'close'): chunks.close()
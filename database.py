@@ -0,0 +1,43 @@
+import os
+import psycopg2
+
+import logs
+
+# --- Połączenie z bazą poza kontekstem żądania Flask ---
+# Używane przez skrypty CLI (migracje, zadania w tle), które nie mają dostępu
+# do `flash()` ani `current_app` i powinny po prostu rzucić wyjątek.
+
+REQUIRED_DB_VARS = ('DB_HOST', 'DB_NAME', 'DB_USER', 'DB_PASSWORD')
+
+def connection_params(statement_timeout_ms=None):
+    """Zwraca parametry połączenia z env oraz listę brakujących zmiennych.
+
+    `connect_timeout` i keepalive TCP obowiązują zawsze (failover RDS nie zawiesza wątku na
+    minuty); `statement_timeout` tylko na życzenie - migracje i zadania wsadowe go nie chcą.
+    """
+    params = {
+        'host': os.environ.get('DB_HOST'),
+        'database': os.environ.get('DB_NAME'),
+        'user': os.environ.get('DB_USER'),
+        'password': os.environ.get('DB_PASSWORD'),
+        'port': os.environ.get('DB_PORT', '5432'),
+        'sslmode': os.environ.get('DB_SSLMODE', 'require'),
+        'application_name': application_name(logs.get_request_id()),
+        'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', '5')),
+        'keepalives': 1, 'keepalives_idle': 30, 'keepalives_interval': 10, 'keepalives_count': 3,
+    }
+    if statement_timeout_ms: params['options'] = f"-c statement_timeout={int(statement_timeout_ms)}"
+    missing = [name for name in REQUIRED_DB_VARS if not os.environ.get(name)]
+    return params, missing
+
+def application_name(request_id=None):
+    """Nazwa połączenia w pg_stat_activity / logach RDS (%a): z identyfikatorem żądania, max 63 znaki."""
+    name = os.environ.get('DB_APPLICATION_NAME', 'papugo')
+    return f"{name}:{request_id}"[:63] if request_id else name
+
+def connect(statement_timeout_ms=None, **overrides):
+    """Nawiązuje połączenie psycopg2; rzuca RuntimeError przy braku konfiguracji."""
+    params, missing = connection_params(statement_timeout_ms)
+    if missing: raise RuntimeError(f"Brak zmiennych środowiskowych bazy: {', '.join(missing)}")
+    params.update(overrides)
+    return psycopg2.connect(**params)
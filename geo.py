@@ -0,0 +1,165 @@
+"""Geokodowanie adresów restauracji i przestrzenny indeks "najbliżej mnie".
+
+Geokodowanie działa offline na dołączonej tabeli centroidów (`data/postal_centroids.csv`)
+dla dwucyfrowych prefiksów polskich kodów pocztowych, z miastem jako zapasem.
+Dokładność to kilka-kilkanaście km - wystarcza do sortowania restauracji po odległości.
+"""
+import csv
+import math
+import os
+import threading
+import time
+import unicodedata
+
+CENTROIDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'postal_centroids.csv')
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.19
+
+_centroids_by_prefix = None; _centroids_by_city = None
+_centroids_lock = threading.Lock()
+
+def normalize_text(text):
+    """Małe litery bez znaków diakrytycznych ("Łódź" -> "lodz"); wspólne z indeksem podpowiedzi."""
+    folded = unicodedata.normalize('NFKD', text.strip().casefold().replace('ł', 'l'))
+    return ''.join(ch for ch in folded if not unicodedata.combining(ch))
+
+def _load_centroids():
+    global _centroids_by_prefix, _centroids_by_city
+    with _centroids_lock:
+        if _centroids_by_prefix is not None: return
+        by_prefix = {}; by_city = {}
+        with open(CENTROIDS_PATH, encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                point = (float(row['latitude']), float(row['longitude']))
+                by_prefix[row['prefix']] = point
+                by_city.setdefault(normalize_text(row['city']), point) # Pierwszy prefiks miasta = centrum
+        _centroids_by_prefix = by_prefix; _centroids_by_city = by_city
+
+def geocode(postal_code=None, city=None):
+    """Zwraca (lat, lon) dla kodu pocztowego (np. '52-551') lub miasta; None gdy nieznane."""
+    _load_centroids()
+    digits = ''.join(ch for ch in (postal_code or '') if ch.isdigit())
+    if len(digits) >= 2 and digits[:2] in _centroids_by_prefix: return _centroids_by_prefix[digits[:2]]
+    if city: return _centroids_by_city.get(normalize_text(city))
+    return None
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1; dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+class GeoGridIndex:
+    """Indeks punktów w równej siatce lat/lon; zapytania przeszukują pierścienie komórek.
+
+    Wątki gunicorna współdzielą indeks: odczyty działają na migawce `_snapshot` (komórki razem
+    z ich prostokątem), zmiany (pełna przebudowa lub upsert/remove) są serializowane blokadą.
+    """
+
+    def __init__(self, cell_degrees=0.1, ttl_seconds=300, retry_seconds=30):
+        self.cell_degrees = cell_degrees; self.ttl_seconds = ttl_seconds; self.retry_seconds = retry_seconds
+        self._snapshot = ({}, None); self._points = {}; self._built_at = None
+        self._lock = threading.Lock(); self._built = threading.Event(); self._rebuilding = False; self._last_attempt = None
+
+    def _cell(self, lat, lon): return (int(math.floor(lat / self.cell_degrees)), int(math.floor(lon / self.cell_degrees)))
+
+    def is_built(self): return self._built.is_set()
+
+    def is_stale(self): return self._built_at is None or time.monotonic() - self._built_at > self.ttl_seconds
+
+    def wait_built(self, timeout):
+        """Czeka na pierwszą przebudowę (np. uruchomioną w tle przy starcie) najwyżej `timeout` s."""
+        return self._built.wait(timeout)
+
+    def __len__(self): return len(self._points)
+
+    def rebuild(self, points):
+        """Zastępuje zawartość indeksu; `points` to iterowalne (id, lat, lon)."""
+        cells = {}; by_id = {}
+        for item_id, lat, lon in points:
+            if lat is None or lon is None: continue
+            lat, lon = float(lat), float(lon)
+            by_id[item_id] = (lat, lon); cells.setdefault(self._cell(lat, lon), []).append((item_id, lat, lon))
+        with self._lock: self._set(cells, by_id); self._built_at = time.monotonic()
+        self._built.set()
+
+    def try_begin_rebuild(self):
+        """Zwraca True dla jednego wątku naraz (i nie częściej niż co `retry_seconds`) - pozostali czytają starą wersję."""
+        with self._lock:
+            now = time.monotonic()
+            if self._rebuilding or (self._last_attempt is not None and now - self._last_attempt < self.retry_seconds): return False
+            self._rebuilding = True; self._last_attempt = now; return True
+
+    def end_rebuild(self):
+        with self._lock: self._rebuilding = False
+
+    def upsert(self, item_id, lat, lon):
+        with self._lock:
+            cells = dict(self._snapshot[0]); points = dict(self._points)
+            self._remove_from(cells, points, item_id)
+            if lat is not None and lon is not None:
+                lat, lon = float(lat), float(lon); key = self._cell(lat, lon)
+                points[item_id] = (lat, lon); cells[key] = cells.get(key, []) + [(item_id, lat, lon)]
+            self._set(cells, points)
+
+    def remove(self, item_id):
+        with self._lock:
+            cells = dict(self._snapshot[0]); points = dict(self._points)
+            self._remove_from(cells, points, item_id)
+            self._set(cells, points)
+
+    def _set(self, cells, points):
+        rows = [key[0] for key in cells]; cols = [key[1] for key in cells]
+        self._snapshot = (cells, (min(rows), max(rows), min(cols), max(cols)) if cells else None); self._points = points
+
+    def _remove_from(self, cells, points, item_id):
+        old = points.pop(item_id, None)
+        if old is None: return
+        key = self._cell(*old); remaining = [p for p in cells.get(key, []) if p[0] != item_id]
+        if remaining: cells[key] = remaining
+        else: cells.pop(key, None)
+
+    def nearest(self, lat, lon, limit=20, max_km=None):
+        """Zwraca do `limit` par (id, odległość_km) posortowanych rosnąco po odległości."""
+        cells, bounds = self._snapshot
+        if not cells or limit <= 0: return []
+        center_row, center_col = self._cell(lat, lon)
+        found = []; visited_cells = 0
+
+        def collect(points):
+            for item_id, p_lat, p_lon in points:
+                distance = haversine_km(lat, lon, p_lat, p_lon)
+                if max_km is None or distance <= max_km: found.append((item_id, distance))
+
+        # Pierścienie bliższe niż prostokąt zajętych komórek są puste - zaczynamy od jego krawędzi
+        min_row, max_row, min_col, max_col = bounds
+        ring = max(0, min_row - center_row, center_row - max_row, min_col - center_col, center_col - max_col)
+        while visited_cells < len(cells):
+            # Najbliższy możliwy punkt w pierścieniu `ring` leży co najmniej (ring - 1) komórek dalej
+            if ring > 0:
+                lat_edge = min(89.9, abs(lat) + ring * self.cell_degrees)
+                ring_min_km = (ring - 1) * self.cell_degrees * KM_PER_DEGREE * math.cos(math.radians(lat_edge))
+                if max_km is not None and ring_min_km > max_km: break
+                if len(found) >= limit and ring_min_km > found[limit - 1][1]: break
+            if 8 * ring > len(cells) - visited_cells:
+                # Rzadka siatka: taniej przejrzeć pozostałe niepuste komórki niż obwód pierścienia
+                for (row, col), points in cells.items():
+                    if max(abs(row - center_row), abs(col - center_col)) >= ring: collect(points)
+                break
+            for row, col in self._ring_cells(center_row, center_col, ring):
+                points = cells.get((row, col))
+                if points: visited_cells += 1; collect(points)
+            found.sort(key=lambda pair: pair[1]); del found[limit:]; ring += 1
+        found.sort(key=lambda pair: pair[1])
+        return found[:limit]
+
+    @staticmethod
+    def _ring_cells(center_row, center_col, ring):
+        if ring == 0: yield (center_row, center_col); return
+        for col in range(center_col - ring, center_col + ring + 1):
+            yield (center_row - ring, col); yield (center_row + ring, col)
+        for row in range(center_row - ring + 1, center_row + ring):
+            yield (row, center_col - ring); yield (row, center_col + ring)
+
+    def within_radius(self, lat, lon, radius_km, limit=None):
+        return self.nearest(lat, lon, limit=limit if limit is not None else len(self._points), max_km=radius_km)
@@ -0,0 +1,172 @@
+"""Trwała kolejka zadań w tle oparta o tabelę "Jobs" (PostgreSQL).
+
+Handlery zlecają zadania przez `enqueue(cursor, ...)` na własnym kursorze, więc zadanie
+zapisuje się w tej samej transakcji co zmiana danych: rollback anuluje również zadanie.
+Worker (`worker.py`) pobiera zadania przez `FOR UPDATE SKIP LOCKED`, ponawia błędy
+z wykładniczym opóźnieniem, a po wyczerpaniu prób oznacza je jako 'dead'.
+Limit równoległości na typ zadania egzekwują sloty blokad doradczych, wspólne dla
+wszystkich wątków i procesów workerów.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+
+import psycopg2.extras
+
+import logs
+
+logger = logging.getLogger('papugo.jobs')
+
+STATUS_PENDING = 'pending'; STATUS_RUNNING = 'running'; STATUS_DONE = 'done'; STATUS_DEAD = 'dead'
+
+class JobType:
+    def __init__(self, name, func, max_attempts, concurrency, backoff_seconds, max_backoff_seconds):
+        self.name = name; self.func = func; self.max_attempts = max_attempts; self.concurrency = concurrency
+        self.backoff_seconds = backoff_seconds; self.max_backoff_seconds = max_backoff_seconds
+
+    def retry_delay(self, attempts):
+        """Opóźnienie przed kolejną próbą: backoff * 2^(próba-1), z limitem i losowym rozrzutem."""
+        delay = min(self.max_backoff_seconds, self.backoff_seconds * (2 ** max(0, attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+_registry = {}
+
+def job(name, max_attempts=5, concurrency=1, backoff_seconds=10, max_backoff_seconds=3600):
+    """Dekorator rejestrujący handler zadania typu `name`; handler dostaje słownik payload."""
+    def decorator(func):
+        _registry[name] = JobType(name, func, max_attempts, concurrency, backoff_seconds, max_backoff_seconds)
+        return func
+    return decorator
+
+def registered_types(): return dict(_registry)
+
+def enqueue(cursor, job_type, payload=None, delay_seconds=0, max_attempts=None):
+    """Dodaje zadanie w bieżącej transakcji kursora; zwraca JobID. Nie wykonuje commit."""
+    payload = dict(payload or {})
+    if logs.get_request_id(): payload.setdefault('_request_id', logs.get_request_id()) # Logi zadania wskażą żądanie, które je zleciło
+    if max_attempts is None: max_attempts = _registry[job_type].max_attempts if job_type in _registry else 5
+    cursor.execute('''INSERT INTO "Jobs" ("Type", "Payload", "MaxAttempts", "RunAt")
+                      VALUES (%s, %s, %s, CURRENT_TIMESTAMP + make_interval(secs => %s)) RETURNING "JobID"''',
+                   (job_type, psycopg2.extras.Json(payload), max_attempts, delay_seconds))
+    return cursor.fetchone()[0]
+
+class Worker:
+    """Pętla pobierająca i wykonująca zadania; jedna instancja = jedno połączenie z bazą."""
+
+    def __init__(self, connect, worker_id=None, poll_interval=1.0, stale_after_seconds=600, types=None):
+        self.connect = connect; self.poll_interval = poll_interval; self.stale_after_seconds = stale_after_seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        self.types = types; self.conn = None; self._next_type = 0
+
+    def _ensure_connection(self):
+        if self.conn is None or self.conn.closed: self.conn = self.connect()
+        return self.conn
+
+    def _job_types(self):
+        registry = registered_types()
+        return {name: registry[name] for name in (self.types or registry) if name in registry}
+
+    def _try_acquire_slot(self, cursor, job_type):
+        for slot in range(job_type.concurrency):
+            cursor.execute('SELECT pg_try_advisory_lock(hashtext(%s), %s)', (job_type.name, slot))
+            if cursor.fetchone()[0]: return slot
+        return None
+
+    def _release_slot(self, cursor, job_type, slot):
+        cursor.execute('SELECT pg_advisory_unlock(hashtext(%s), %s)', (job_type.name, slot))
+
+    def requeue_stale(self):
+        """Zwraca do kolejki zadania 'running' porzucone przez martwe workery."""
+        conn = self._ensure_connection()
+        with conn.cursor() as cursor:
+            cursor.execute('''UPDATE "Jobs" SET "Status" = %s, "LockedAt" = NULL, "LockedBy" = NULL,
+                              "LastError" = COALESCE("LastError", '') || 'Porzucone przez workera ' || COALESCE("LockedBy", '?') || E'\\n'
+                              WHERE "Status" = %s AND "LockedAt" < CURRENT_TIMESTAMP - make_interval(secs => %s)''',
+                           (STATUS_PENDING, STATUS_RUNNING, self.stale_after_seconds))
+            requeued = cursor.rowcount
+        conn.commit()
+        if requeued: logger.warning(f"Przywrócono {requeued} porzuconych zadań.")
+        return requeued
+
+    def run_once(self):
+        """Wykonuje co najwyżej jedno zadanie; zwraca True, jeśli coś zostało wykonane."""
+        conn = self._ensure_connection(); job_types = self._job_types()
+        if not job_types: return False
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT DISTINCT "Type" FROM "Jobs" WHERE "Status" = %s AND "RunAt" <= CURRENT_TIMESTAMP AND "Type" = ANY(%s)',
+                           (STATUS_PENDING, list(job_types)))
+            ready = sorted(row[0] for row in cursor.fetchall())
+            conn.commit()
+            if not ready: return False
+            # Rotacja typów - jeden zalany typ nie blokuje pozostałych
+            self._next_type = (self._next_type + 1) % len(ready); ready = ready[self._next_type:] + ready[:self._next_type]
+            for name in ready:
+                job_type = job_types[name]; slot = self._try_acquire_slot(cursor, job_type); conn.commit()
+                if slot is None: continue
+                try:
+                    claimed = self._claim(cursor, name)
+                    if claimed: self._execute(cursor, job_type, *claimed); return True
+                finally:
+                    self._release_slot(cursor, job_type, slot); conn.commit()
+        return False
+
+    def _claim(self, cursor, job_type_name):
+        cursor.execute('''UPDATE "Jobs" SET "Status" = %s, "Attempts" = "Attempts" + 1, "LockedAt" = CURRENT_TIMESTAMP, "LockedBy" = %s
+                          WHERE "JobID" = (SELECT "JobID" FROM "Jobs" WHERE "Status" = %s AND "Type" = %s AND "RunAt" <= CURRENT_TIMESTAMP
+                                           ORDER BY "RunAt" LIMIT 1 FOR UPDATE SKIP LOCKED)
+                          RETURNING "JobID", "Payload", "Attempts", "MaxAttempts"''',
+                       (STATUS_RUNNING, self.worker_id, STATUS_PENDING, job_type_name))
+        row = cursor.fetchone(); cursor.connection.commit()
+        return row
+
+    def _execute(self, cursor, job_type, job_id, payload, attempts, max_attempts):
+        started = time.monotonic(); payload = payload or {}
+        token = logs.set_request_id(payload.get('_request_id') or f"job-{job_id}")
+        try:
+            job_type.func(payload)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=5)}"
+            if attempts >= max_attempts:
+                cursor.execute('UPDATE "Jobs" SET "Status" = %s, "LastError" = %s, "FinishedAt" = CURRENT_TIMESTAMP, "LockedAt" = NULL WHERE "JobID" = %s',
+                               (STATUS_DEAD, error, job_id))
+                logger.error(f"Zadanie #{job_id} ({job_type.name}) przeniesione do dead-letter po {attempts} próbach: {e}")
+            else:
+                delay = job_type.retry_delay(attempts)
+                cursor.execute('''UPDATE "Jobs" SET "Status" = %s, "LastError" = %s, "LockedAt" = NULL, "LockedBy" = NULL,
+                                  "RunAt" = CURRENT_TIMESTAMP + make_interval(secs => %s) WHERE "JobID" = %s''',
+                               (STATUS_PENDING, error, delay, job_id))
+                logger.warning(f"Zadanie #{job_id} ({job_type.name}) nieudane (próba {attempts}/{max_attempts}), ponowienie za {delay:.0f}s: {e}")
+        else:
+            cursor.execute('UPDATE "Jobs" SET "Status" = %s, "FinishedAt" = CURRENT_TIMESTAMP, "LockedAt" = NULL WHERE "JobID" = %s', (STATUS_DONE, job_id))
+            logger.debug(f"Zadanie #{job_id} ({job_type.name}) wykonane w {time.monotonic() - started:.3f}s")
+        finally:
+            logs.reset_request_id(token)
+        cursor.connection.commit()
+
+    def housekeeping(self):
+        self.requeue_stale()
+        conn = self._ensure_connection()
+        with conn.cursor() as cursor: purged = purge_finished(cursor)
+        conn.commit()
+        if purged: logger.info(f"Usunięto {purged} zakończonych zadań.")
+
+    def run_forever(self, stop_event):
+        last_housekeeping = 0.0
+        while not stop_event.is_set():
+            try:
+                if time.monotonic() - last_housekeeping > 60: self.housekeeping(); last_housekeeping = time.monotonic()
+                if not self.run_once(): stop_event.wait(self.poll_interval)
+            except psycopg2.Error as e:
+                logger.error(f"Błąd bazy w workerze {self.worker_id}: {e}")
+                if self.conn is not None and not self.conn.closed: self.conn.close()
+                self.conn = None; stop_event.wait(min(30, self.poll_interval * 5))
+        if self.conn is not None and not self.conn.closed: self.conn.close()
+
+def purge_finished(cursor, older_than_days=7):
+    """Usuwa zakończone zadania 'done' starsze niż `older_than_days` dni."""
+    cursor.execute('DELETE FROM "Jobs" WHERE "Status" = %s AND "FinishedAt" < CURRENT_TIMESTAMP - make_interval(days => %s)', (STATUS_DONE, older_than_days))
+    return cursor.rowcount
@@ -0,0 +1,181 @@
+"""Nieblokujące logowanie: kolejka w pamięci + wątek zapisujący, rekordy w JSON.
+
+Wątki żądań tylko wkładają rekord do ograniczonej kolejki (`put_nowait`); gdy kolejka jest
+pełna (wolny stdout), rekord jest odrzucany i liczony, zamiast blokować żądanie. Zapis na
+stdout robi `QueueListener` w osobnym wątku. Każdy rekord dostaje identyfikator żądania
+z `contextvars`, a wybrane loggery mogą być próbkowane (np. `papugo.s3=0.1` zostawia
+~10% komunikatów INFO; ostrzeżenia i błędy przechodzą zawsze).
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+_request_id = contextvars.ContextVar('papugo_request_id', default=None)
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+# Atrybuty LogRecord, które nie są polami dodanymi przez `extra=`
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'request_id'}
+
+def new_request_id(incoming=None):
+    """Przyjmuje identyfikator z nagłówka (jeśli ma bezpieczny format) albo generuje nowy."""
+    return incoming if incoming and REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex
+
+def get_request_id(): return _request_id.get()
+
+def set_request_id(request_id):
+    """Ustawia identyfikator dla bieżącego wątku/kontekstu; zwraca token dla `reset_request_id`."""
+    return _request_id.set(request_id)
+
+def reset_request_id(token): _request_id.reset(token)
+
+def parse_sample_rates(value):
+    """'papugo.s3=0.1,papugo.orders=0.5' -> {'papugo.s3': 0.1, 'papugo.orders': 0.5}; błędne wpisy są pomijane."""
+    rates = {}
+    for part in (value or '').split(','):
+        name, _, rate = part.strip().partition('=')
+        try: rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError: continue
+    return rates
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}', 'level': record.levelname,
+                'logger': record.name, 'message': record.getMessage(), 'thread': record.threadName}
+        request_id = getattr(record, 'request_id', None)
+        if request_id: data['request_id'] = request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'): data[key] = value
+        if record.exc_text: data['exc'] = record.exc_text
+        elif record.exc_info: data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self): super().__init__('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+
+    def format(self, record):
+        if getattr(record, 'request_id', None) is None: record.request_id = '-'
+        return super().format(record)
+
+class ContextFilter(logging.Filter):
+    """Dopisuje identyfikator żądania i próbkuje komunikaty poniżej WARNING; działa w wątku żądania."""
+
+    def __init__(self, sample_rates=None, stats=None):
+        super().__init__(); self.stats = stats
+        # Najdłuższy prefiks wygrywa: 'papugo.s3.upload' przed 'papugo.s3'
+        self.sample_rates = sorted((sample_rates or {}).items(), key=lambda item: -len(item[0]))
+
+    def _rate(self, name):
+        for prefix, rate in self.sample_rates:
+            if name == prefix or name.startswith(prefix + '.'): return rate
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING and self.sample_rates:
+            rate = self._rate(record.name)
+            if rate < 1.0 and random.random() >= rate:
+                if self.stats: self.stats.add('sampled_out')
+                return False
+        record.request_id = _request_id.get()
+        return True
+
+class PipelineStats:
+    def __init__(self):
+        self._lock = threading.Lock(); self._counters = {'enqueued': 0, 'dropped': 0, 'sampled_out': 0, 'written': 0, 'write_errors': 0}
+        self._timers = {'enqueue_seconds': 0.0, 'write_seconds': 0.0}
+
+    def add(self, counter, amount=1):
+        with self._lock: self._counters[counter] += amount
+
+    def add_time(self, timer, seconds):
+        with self._lock: self._timers[timer] += seconds
+
+    def snapshot(self):
+        with self._lock: return {**self._counters, **self._timers}
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, który przy pełnej kolejce odrzuca rekord zamiast czekać."""
+
+    def __init__(self, log_queue, stats):
+        super().__init__(log_queue); self.stats = stats
+
+    def prepare(self, record):
+        # Tylko to, czego nie da się bezpiecznie zrobić w innym wątku: argumenty i traceback.
+        # Formatowanie JSON odbywa się w wątku zapisującym.
+        record = copy.copy(record)
+        record.message = record.getMessage(); record.msg = record.message; record.args = None
+        if record.exc_info: record.exc_text = logging.Formatter().formatException(record.exc_info); record.exc_info = None
+        return record
+
+    def emit(self, record):
+        started = time.perf_counter()
+        try:
+            self.queue.put_nowait(self.prepare(record)); self.stats.add('enqueued')
+        except queue.Full:
+            self.stats.add('dropped')
+        except Exception:
+            self.handleError(record)
+        finally:
+            self.stats.add_time('enqueue_seconds', time.perf_counter() - started)
+
+class TimedStreamHandler(logging.StreamHandler):
+    """Handler wątku zapisującego; mierzy czas zapisu na stdout."""
+
+    def __init__(self, stream, stats):
+        super().__init__(stream); self.stats = stats
+
+    def emit(self, record):
+        started = time.perf_counter()
+        try:
+            self.stream.write(self.format(record) + self.terminator); self.flush(); self.stats.add('written')
+        except Exception:
+            self.stats.add('write_errors')
+        finally:
+            self.stats.add_time('write_seconds', time.perf_counter() - started)
+
+class LogPipeline:
+    def __init__(self, level=logging.INFO, queue_size=10000, sample_rates=None, json_format=True, stream=None):
+        self.queue = queue.Queue(maxsize=queue_size); self.stats = PipelineStats()
+        self.handler = DroppingQueueHandler(self.queue, self.stats)
+        self.handler.addFilter(ContextFilter(sample_rates, self.stats))
+        self.output = TimedStreamHandler(stream or sys.stdout, self.stats)
+        self.output.setFormatter(JsonFormatter() if json_format else TextFormatter())
+        self.listener = logging.handlers.QueueListener(self.queue, self.output, respect_handler_level=False)
+        self.level = level; self.sample_rates = dict(sample_rates or {})
+
+    def install(self, logger=None):
+        logger = logger or logging.getLogger()
+        for handler in list(logger.handlers): logger.removeHandler(handler)
+        logger.addHandler(self.handler); logger.setLevel(self.level)
+        self.listener.start(); atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        if self.listener._thread is not None: self.listener.stop() # Opróżnia kolejkę przed zakończeniem procesu
+
+    def metrics(self):
+        stats = self.stats.snapshot(); handled = stats['enqueued'] + stats['dropped']
+        return {**stats, 'queue_size': self.queue.qsize(), 'queue_capacity': self.queue.maxsize, 'sample_rates': self.sample_rates,
+                'avg_enqueue_us': round(stats['enqueue_seconds'] / handled * 1e6, 2) if handled else 0.0,
+                'avg_write_us': round(stats['write_seconds'] / stats['written'] * 1e6, 2) if stats['written'] else 0.0}
+
+_pipeline = None; _pipeline_lock = threading.Lock()
+
+def configure(level='INFO', queue_size=10000, sample_rates=None, json_format=True):
+    """Instaluje potok na loggerze głównym (raz na proces) i zwraca go."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            level = logging.getLevelName(level.upper()) if isinstance(level, str) else level
+            _pipeline = LogPipeline(level if isinstance(level, int) else logging.INFO, queue_size, sample_rates, json_format).install()
+        return _pipeline
+
+def pipeline(): return _pipeline
@@ -0,0 +1,177 @@
+"""Zadania utrzymaniowe bazy PapuGO.
+
+Użycie:
+    python maintenance.py ensure-partitions [--months-ahead N]
+    python maintenance.py archive [--retention-days D] [--batch-size B] [--drop-empty]
+    python maintenance.py geocode-restaurants [--all]
+    python maintenance.py purge-idempotency-keys [--ttl-seconds S]
+    python maintenance.py refresh-recommendations [--full] [--top-k K]
+
+`ensure-partitions` tworzy partycje miesięczne "Orders"/"OrderItems" z wyprzedzeniem,
+`archive` przenosi zakończone zamówienia starsze niż okres retencji do "OrdersArchive",
+`geocode-restaurants` uzupełnia współrzędne restauracji z offline'owej tabeli centroidów,
+`purge-idempotency-keys` usuwa wygasłe klucze idempotencji zamówień,
+`refresh-recommendations` dolicza nowe zamówienia do rekomendacji dań (recommendations.py).
+"""
+import argparse
+import datetime
+import logging
+import os
+import re
+import sys
+
+from dotenv import load_dotenv
+
+import database
+import geo
+import recommendations
+
+logger = logging.getLogger('papugo.maintenance')
+
+ARCHIVABLE_STATUSES = ('Dostarczone', 'Anulowane')
+DEFAULT_RETENTION_DAYS = int(os.getenv('ORDER_RETENTION_DAYS', '180'))
+DEFAULT_MONTHS_AHEAD = 3
+PARTITIONS_LOCK_KEY = 7261_0003
+DEFAULT_IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400'))
+PARTITION_NAME_RE = re.compile(r'^Orders_p(\d{4})(\d{2})$')
+
+def ensure_partitions(conn, months_ahead=DEFAULT_MONTHS_AHEAD):
+    """Tworzy brakujące partycje od bieżącego miesiąca na `months_ahead` miesięcy do przodu.
+
+    Zaczyna wcześniej, jeśli w partycji domyślnej leżą starsze zamówienia - funkcja bazy przenosi
+    je do nowo utworzonych partycji. Zwraca None, gdy inny proces właśnie tworzy partycje.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_xact_lock(%s)', (PARTITIONS_LOCK_KEY,))
+        if not cursor.fetchone()[0]: conn.rollback(); return None
+        cursor.execute("SELECT papugo_ensure_order_partitions(LEAST(date_trunc('month', CURRENT_TIMESTAMP)::timestamp, (SELECT min(\"OrderDate\") FROM \"Orders_default\")), "
+                       "(date_trunc('month', CURRENT_TIMESTAMP) + make_interval(months => %s))::timestamp)", (months_ahead + 1,))
+        created = cursor.fetchone()[0]
+    conn.commit()
+    return created
+
+def archive_batch(conn, cutoff, batch_size):
+    """Przenosi jedną paczkę zamówień do archiwum; zwraca liczbę przeniesionych zamówień."""
+    statuses = list(ARCHIVABLE_STATUSES)
+    with conn.cursor() as cursor:
+        # FOR UPDATE: status nie zmieni się między kopiowaniem a usunięciem
+        cursor.execute('''SELECT "OrderID", "OrderDate" FROM "Orders"
+                          WHERE "Status" = ANY(%s) AND "OrderDate" < %s
+                          ORDER BY "OrderDate" LIMIT %s FOR UPDATE SKIP LOCKED''', (statuses, cutoff, batch_size))
+        rows = cursor.fetchall()
+        if not rows: conn.rollback(); return 0
+        order_ids = [row[0] for row in rows]
+        cursor.execute('''INSERT INTO "OrdersArchive" ("OrderID", "UserID", "OrderDate", "TotalPrice", "Status")
+                          SELECT "OrderID", "UserID", "OrderDate", "TotalPrice", "Status" FROM "Orders"
+                          WHERE "OrderID" = ANY(%s) AND "OrderDate" < %s''', (order_ids, cutoff))
+        cursor.execute('''INSERT INTO "OrderItemsArchive" ("OrderItemID", "OrderID", "DishID", "Quantity", "PricePerItem")
+                          SELECT "OrderItemID", "OrderID", "DishID", "Quantity", "PricePerItem" FROM "OrderItems"
+                          WHERE "OrderID" = ANY(%s) AND "OrderDate" < %s''', (order_ids, cutoff))
+        # Pozycje znikają przez ON DELETE CASCADE
+        cursor.execute('DELETE FROM "Orders" WHERE "OrderID" = ANY(%s) AND "OrderDate" < %s', (order_ids, cutoff))
+        moved = cursor.rowcount
+    conn.commit()
+    return moved
+
+def drop_empty_partitions(conn, cutoff):
+    """Odłącza i usuwa puste partycje miesięczne w całości starsze niż `cutoff`."""
+    dropped = []
+    with conn.cursor() as cursor:
+        cursor.execute('''SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                          WHERE i.inhparent = '"Orders"'::regclass ORDER BY c.relname''')
+        for (relname,) in cursor.fetchall():
+            match = PARTITION_NAME_RE.match(relname)
+            if not match: continue
+            year, month = int(match.group(1)), int(match.group(2))
+            month_end = datetime.datetime(year + month // 12, month % 12 + 1, 1)
+            if month_end > cutoff: continue
+            items_relname = f"OrderItems_p{match.group(1)}{match.group(2)}"
+            cursor.execute(f'SELECT EXISTS (SELECT 1 FROM "{relname}") OR EXISTS (SELECT 1 FROM "{items_relname}")')
+            if cursor.fetchone()[0]: continue
+            cursor.execute(f'ALTER TABLE "OrderItems" DETACH PARTITION "{items_relname}"'); cursor.execute(f'DROP TABLE "{items_relname}"')
+            cursor.execute(f'ALTER TABLE "Orders" DETACH PARTITION "{relname}"'); cursor.execute(f'DROP TABLE "{relname}"')
+            dropped.append(relname)
+    conn.commit()
+    return dropped
+
+def archive_orders(conn, retention_days=DEFAULT_RETENTION_DAYS, batch_size=1000, drop_empty=False):
+    """Archiwizuje zakończone zamówienia starsze niż `retention_days` dni, paczkami."""
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=retention_days)
+    total = 0
+    while True:
+        moved = archive_batch(conn, cutoff, batch_size)
+        if not moved: break
+        total += moved; logger.info(f"Zarchiwizowano {moved} zamówień (łącznie {total}).")
+    dropped = drop_empty_partitions(conn, cutoff) if drop_empty else []
+    for relname in dropped: logger.info(f"Usunięto pustą partycję {relname}.")
+    return total, dropped
+
+def geocode_restaurants(conn, only_missing=True):
+    """Uzupełnia "Latitude"/"Longitude" restauracji; zwraca (zaktualizowane, nieznane adresy)."""
+    updated = 0; unknown = 0
+    with conn.cursor() as cursor:
+        sql = 'SELECT "RestaurantID", "PostalCode", "City" FROM "Restaurants"'
+        if only_missing: sql += ' WHERE "Latitude" IS NULL OR "Longitude" IS NULL'
+        cursor.execute(sql)
+        for restaurant_id, postal_code, city in cursor.fetchall():
+            coordinates = geo.geocode(postal_code, city)
+            if not coordinates: unknown += 1; continue
+            cursor.execute('UPDATE "Restaurants" SET "Latitude" = %s, "Longitude" = %s WHERE "RestaurantID" = %s', (*coordinates, restaurant_id))
+            updated += 1
+    conn.commit()
+    return updated, unknown
+
+def purge_idempotency_keys(conn, ttl_seconds=DEFAULT_IDEMPOTENCY_TTL_SECONDS):
+    """Usuwa klucze idempotencji starsze niż TTL; zwraca liczbę usuniętych."""
+    with conn.cursor() as cursor:
+        cursor.execute('DELETE FROM "OrderIdempotencyKeys" WHERE "CreatedAt" < CURRENT_TIMESTAMP - make_interval(secs => %s)', (ttl_seconds,))
+        deleted = cursor.rowcount
+    conn.commit()
+    return deleted
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Zadania utrzymaniowe zamówień PapuGO")
+    sub = parser.add_subparsers(dest='command', required=True)
+    ensure = sub.add_parser('ensure-partitions', help="Utwórz partycje na kolejne miesiące")
+    ensure.add_argument('--months-ahead', type=int, default=DEFAULT_MONTHS_AHEAD)
+    archive = sub.add_parser('archive', help="Przenieś zakończone zamówienia do archiwum")
+    archive.add_argument('--retention-days', type=int, default=DEFAULT_RETENTION_DAYS)
+    archive.add_argument('--batch-size', type=int, default=1000)
+    archive.add_argument('--drop-empty', action='store_true', help="Usuń puste partycje sprzed okresu retencji")
+    geocode = sub.add_parser('geocode-restaurants', help="Uzupełnij współrzędne restauracji")
+    geocode.add_argument('--all', action='store_true', help="Przelicz także restauracje z już ustawionymi współrzędnymi")
+    purge = sub.add_parser('purge-idempotency-keys', help="Usuń wygasłe klucze idempotencji zamówień")
+    purge.add_argument('--ttl-seconds', type=int, default=DEFAULT_IDEMPOTENCY_TTL_SECONDS)
+    refresh = sub.add_parser('refresh-recommendations', help="Odśwież rekomendacje dań na podstawie nowych zamówień")
+    refresh.add_argument('--full', action='store_true', help="Przelicz od zera, razem z archiwum zamówień")
+    refresh.add_argument('--top-k', type=int, default=recommendations.DEFAULT_TOP_K)
+    refresh.add_argument('--min-pair-count', type=int, default=recommendations.DEFAULT_MIN_PAIR_COUNT)
+    refresh.add_argument('--batch-size', type=int, default=recommendations.DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    conn = database.connect()
+    try:
+        if args.command == 'ensure-partitions':
+            created = ensure_partitions(conn, args.months_ahead)
+            if created is None: print("Inny proces tworzy właśnie partycje."); return 1
+            print(f"Utworzono partycji: {created}")
+        elif args.command == 'archive':
+            total, dropped = archive_orders(conn, args.retention_days, args.batch_size, args.drop_empty)
+            print(f"Zarchiwizowano zamówień: {total}, usunięto partycji: {len(dropped)}")
+        elif args.command == 'geocode-restaurants':
+            updated, unknown = geocode_restaurants(conn, only_missing=not args.all)
+            print(f"Zaktualizowano restauracji: {updated}, nieznany adres: {unknown}")
+        elif args.command == 'purge-idempotency-keys':
+            print(f"Usunięto kluczy: {purge_idempotency_keys(conn, args.ttl_seconds)}")
+        elif args.command == 'refresh-recommendations':
+            stats = recommendations.refresh(conn, full=args.full, batch_size=args.batch_size, top_k=args.top_k, min_pair_count=args.min_pair_count)
+            if stats is None: print("Inny przebieg jest w toku."); return 1
+            print(f"Zamówień: {stats['orders']}, dań: {stats['dishes']}, par: {stats['pairs']}, rekomendacji: {stats['recommendations']}, znacznik: {stats['last_order_id']}")
+        return 0
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
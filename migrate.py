@@ -0,0 +1,232 @@
+"""Wersjonowane migracje schematu PapuGO.
+
+Użycie:
+    python migrate.py status           # lista migracji i ich stan
+    python migrate.py up [--to N]      # zastosuj oczekujące migracje (do wersji N)
+    python migrate.py down [--steps K] # wycofaj K ostatnich migracji (domyślnie 1)
+    python migrate.py check [--seed]   # EXPLAIN gorących zapytań, błąd przy Seq Scan
+
+Migracje to pary plików `migrations/NNNN_nazwa.up.sql` / `NNNN_nazwa.down.sql`.
+Każda migracja wykonywana jest w osobnej transakcji.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+
+from dotenv import load_dotenv
+
+import database
+
+logger = logging.getLogger('papugo.migrate')
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_FILE_RE = re.compile(r'^(\d{4})_([a-z0-9_]+)\.(up|down)\.sql$')
+# Stały klucz blokady doradczej - dwa równoległe deploye nie migrują naraz
+MIGRATION_LOCK_KEY = 7261_0001
+
+# --- Gorące zapytania z app.py ---
+# (nazwa, zapytanie, zapytanie zwracające przykładowe parametry z bazy)
+HOT_QUERIES = [
+    ('my_orders',
+     'SELECT "OrderID", "OrderDate", "TotalPrice", "Status" FROM "Orders" WHERE "UserID" = %s ORDER BY "OrderDate" DESC',
+     'SELECT "UserID" FROM "Orders" WHERE "UserID" IS NOT NULL LIMIT 1'),
+    ('restaurant_menu',
+     'SELECT "DishID", "Name", "Description", "Price", "ImageURL" FROM "Dishes" WHERE "RestaurantID" = %s ORDER BY "Name"',
+     'SELECT "RestaurantID" FROM "Dishes" LIMIT 1'),
+    ('order_items',
+     'SELECT oi."Quantity", oi."PricePerItem", d."Name", d."ImageURL" FROM "OrderItems" oi JOIN "Dishes" d ON oi."DishID" = d."DishID" WHERE oi."OrderID" = %s AND oi."OrderDate" = %s',
+     'SELECT "OrderID", "OrderDate" FROM "OrderItems" LIMIT 1'),
+    ('archived_orders',
+     'SELECT "OrderID", "OrderDate", "TotalPrice", "Status" FROM "OrdersArchive" WHERE "UserID" = %s ORDER BY "OrderDate" DESC',
+     'SELECT "UserID" FROM "Orders" WHERE "UserID" IS NOT NULL LIMIT 1'),
+    ('login',
+     'SELECT "UserID", "Username", "IsAdmin", "Password" FROM "Users" WHERE "Username" = %s',
+     'SELECT "Username" FROM "Users" LIMIT 1'),
+    # view_orders(): pierwsza i kolejna strona; parametrem jest też rozmiar strony (ADMIN_ORDERS_PAGE_SIZE)
+    ('admin_orders_page',
+     'SELECT o."OrderID", u."Username", o."OrderDate", o."TotalPrice", o."Status" FROM "Orders" o LEFT JOIN "Users" u ON o."UserID" = u."UserID" ORDER BY o."OrderDate" DESC, o."OrderID" DESC LIMIT %s',
+     'SELECT 100 FROM "Orders" LIMIT 1'),
+    ('admin_orders_next_page',
+     'SELECT o."OrderID", u."Username", o."OrderDate", o."TotalPrice", o."Status" FROM "Orders" o LEFT JOIN "Users" u ON o."UserID" = u."UserID" WHERE (o."OrderDate", o."OrderID") < (%s, %s) ORDER BY o."OrderDate" DESC, o."OrderID" DESC LIMIT %s',
+     'SELECT "OrderDate", "OrderID", 100 FROM "Orders" ORDER BY "OrderDate" DESC, "OrderID" DESC OFFSET 100 LIMIT 1'),
+]
+
+# Syntetyczne dane do `check --seed`; wycofywane razem z transakcją sprawdzenia.
+SEED_SQL = """
+SELECT papugo_ensure_order_partitions((CURRENT_TIMESTAMP - INTERVAL '13 months')::timestamp, CURRENT_TIMESTAMP::timestamp);
+INSERT INTO "Users" ("Username", "Password")
+    SELECT 'seed_user_' || g, 'x' FROM generate_series(1, %(users)s) g;
+INSERT INTO "Restaurants" ("Name", "CuisineType", "City")
+    SELECT 'Seed Restaurant ' || g, 'Kuchnia ' || (g %% 20), 'Miasto ' || (g %% 50) FROM generate_series(1, %(restaurants)s) g;
+INSERT INTO "Dishes" ("RestaurantID", "Name", "Price")
+    SELECT r."RestaurantID", 'Danie ' || g, (g %% 90) + 9.99
+    FROM "Restaurants" r CROSS JOIN generate_series(1, %(dishes_per_restaurant)s) g
+    WHERE r."Name" LIKE 'Seed Restaurant %%';
+INSERT INTO "Orders" ("UserID", "OrderDate", "TotalPrice", "Status")
+    SELECT u."UserID", CURRENT_TIMESTAMP - (random() * INTERVAL '365 days'), 50, 'Dostarczone'
+    FROM "Users" u CROSS JOIN generate_series(1, %(orders_per_user)s) g
+    WHERE u."Username" LIKE 'seed_user_%%';
+INSERT INTO "OrderItems" ("OrderID", "OrderDate", "DishID", "Quantity", "PricePerItem")
+    SELECT o."OrderID", o."OrderDate", d."DishID", 1, d."Price"
+    FROM "Orders" o
+    JOIN LATERAL (SELECT "DishID", "Price" FROM "Dishes" WHERE "DishID" >= (o."OrderID" * 7919) %% %(dish_span)s ORDER BY "DishID" LIMIT 3) d ON TRUE;
+INSERT INTO "OrdersArchive" ("OrderID", "UserID", "OrderDate", "TotalPrice", "Status")
+    SELECT "OrderID", "UserID", "OrderDate", "TotalPrice", "Status" FROM "Orders"
+    WHERE "OrderDate" < CURRENT_TIMESTAMP - INTERVAL '180 days';
+"""
+
+class Migration:
+    def __init__(self, version, name, up_path=None, down_path=None):
+        self.version = version; self.name = name
+        self.up_path = up_path; self.down_path = down_path
+
+    def read(self, direction):
+        path = self.up_path if direction == 'up' else self.down_path
+        if not path: raise RuntimeError(f"Migracja {self.version:04d}_{self.name} nie ma pliku .{direction}.sql")
+        with open(path, encoding='utf-8') as f: return f.read()
+
+    def __repr__(self): return f"{self.version:04d}_{self.name}"
+
+def discover_migrations(directory=MIGRATIONS_DIR):
+    """Zwraca listę migracji posortowaną po wersji."""
+    found = {}
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE_RE.match(filename)
+        if not match: continue
+        version, name, direction = int(match.group(1)), match.group(2), match.group(3)
+        migration = found.setdefault(version, Migration(version, name))
+        if migration.name != name: raise RuntimeError(f"Dwie migracje o wersji {version:04d}: {migration.name}, {name}")
+        setattr(migration, f"{direction}_path", os.path.join(directory, filename))
+    return [found[v] for v in sorted(found)]
+
+def ensure_migrations_table(conn):
+    with conn.cursor() as cursor:
+        cursor.execute('''CREATE TABLE IF NOT EXISTS "SchemaMigrations" (
+            "Version" INTEGER PRIMARY KEY, "Name" VARCHAR(255) NOT NULL,
+            "AppliedAt" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)''')
+    conn.commit()
+
+def applied_versions(conn):
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT "Version" FROM "SchemaMigrations" ORDER BY "Version"')
+        return [row[0] for row in cursor.fetchall()]
+
+def _run_migration(conn, migration, direction):
+    with conn.cursor() as cursor:
+        cursor.execute(migration.read(direction))
+        if direction == 'up': cursor.execute('INSERT INTO "SchemaMigrations" ("Version", "Name") VALUES (%s, %s)', (migration.version, migration.name))
+        else: cursor.execute('DELETE FROM "SchemaMigrations" WHERE "Version" = %s', (migration.version,))
+    conn.commit()
+
+def migrate_up(conn, target=None):
+    applied = set(applied_versions(conn)); done = []
+    for migration in discover_migrations():
+        if migration.version in applied: continue
+        if target is not None and migration.version > target: break
+        logger.info(f"Stosowanie migracji {migration}...")
+        try: _run_migration(conn, migration, 'up')
+        except Exception: conn.rollback(); logger.error(f"Migracja {migration} nie powiodła się."); raise
+        done.append(migration)
+    return done
+
+def migrate_down(conn, steps=1):
+    by_version = {m.version: m for m in discover_migrations()}; done = []
+    for version in sorted(applied_versions(conn), reverse=True)[:steps]:
+        migration = by_version.get(version)
+        if not migration: raise RuntimeError(f"Brak plików dla zastosowanej migracji {version:04d}")
+        logger.info(f"Wycofywanie migracji {migration}...")
+        try: _run_migration(conn, migration, 'down')
+        except Exception: conn.rollback(); logger.error(f"Wycofanie {migration} nie powiodło się."); raise
+        done.append(migration)
+    return done
+
+# --- Sprawdzanie planów zapytań ---
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []): yield from _plan_nodes(child)
+
+def _is_empty_partition(cursor, relname):
+    """Seq Scan po pustej partycji (np. domyślnej) jest najtańszym planem i nie jest problemem."""
+    if not relname: return False
+    cursor.execute('SELECT relispartition AND reltuples <= 0 FROM pg_class WHERE oid = to_regclass(%s)', (f'"{relname}"',))
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+def explain_hot_queries(conn):
+    """Zwraca listę (nazwa, węzły Seq Scan, plan) dla każdego gorącego zapytania; pominięte mają plan None."""
+    results = []
+    with conn.cursor() as cursor:
+        for name, sql, sample_sql in HOT_QUERIES:
+            params = None
+            if sample_sql:
+                cursor.execute(sample_sql); row = cursor.fetchone()
+                if not row: results.append((name, [], None)); continue
+                params = tuple(row)
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0][0]['Plan']
+            seq_scans = [node.get('Relation Name') for node in _plan_nodes(plan) if node.get('Node Type') == 'Seq Scan']
+            seq_scans = [relname for relname in seq_scans if not _is_empty_partition(cursor, relname)]
+            results.append((name, seq_scans, plan))
+    return results
+
+def seed_dataset(conn, scale=1):
+    params = {'users': 2000 * scale, 'restaurants': 200 * scale, 'dishes_per_restaurant': 40,
+              'orders_per_user': 10, 'dish_span': 8000 * scale}
+    with conn.cursor() as cursor:
+        cursor.execute(SEED_SQL, params)
+        for table in ('Users', 'Restaurants', 'Dishes', 'Orders', 'OrderItems', 'OrdersArchive'): cursor.execute(f'ANALYZE "{table}"')
+
+def check(conn, seed=False, scale=1):
+    """Uruchamia EXPLAIN na gorących zapytaniach; True jeśli żadne nie używa Seq Scan i sprawdzono co najmniej jedno."""
+    try:
+        if seed: logger.info("Wstawianie danych testowych (zostaną wycofane)..."); seed_dataset(conn, scale)
+        results = explain_hot_queries(conn)
+    finally:
+        conn.rollback()
+    ok = True; checked = 0
+    for name, seq_scans, plan in results:
+        if plan is None: print(f"SKIP {name}: brak danych do parametru"); continue
+        checked += 1
+        if seq_scans:
+            ok = False
+            print(f"FAIL {name}: Seq Scan na {', '.join(filter(None, seq_scans))}")
+            print(json.dumps(plan, indent=2, ensure_ascii=False))
+        else: print(f"OK   {name}: {plan['Node Type']}")
+    if not checked: print("FAIL: nie sprawdzono żadnego zapytania - pusta baza? Użyj --seed."); ok = False
+    return ok
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migracje schematu PapuGO")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status', help="Pokaż stan migracji")
+    up = sub.add_parser('up', help="Zastosuj oczekujące migracje"); up.add_argument('--to', type=int, default=None)
+    down = sub.add_parser('down', help="Wycofaj migracje"); down.add_argument('--steps', type=int, default=1)
+    chk = sub.add_parser('check', help="Sprawdź plany gorących zapytań")
+    chk.add_argument('--seed', action='store_true', help="Wstaw tymczasowe dane testowe przed EXPLAIN")
+    chk.add_argument('--scale', type=int, default=1, help="Mnożnik rozmiaru danych testowych")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    conn = database.connect()
+    try:
+        ensure_migrations_table(conn)
+        with conn.cursor() as cursor: cursor.execute('SELECT pg_advisory_lock(%s)', (MIGRATION_LOCK_KEY,))
+        if args.command == 'status':
+            applied = set(applied_versions(conn))
+            for migration in discover_migrations(): print(f"[{'x' if migration.version in applied else ' '}] {migration}")
+        elif args.command == 'up':
+            done = migrate_up(conn, args.to); print(f"Zastosowano migracji: {len(done)}")
+        elif args.command == 'down':
+            done = migrate_down(conn, args.steps); print(f"Wycofano migracji: {len(done)}")
+        elif args.command == 'check':
+            if not check(conn, seed=args.seed, scale=args.scale): return 1
+        return 0
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,5 @@
+DROP TABLE IF EXISTS "OrderItems";
+DROP TABLE IF EXISTS "Orders";
+DROP TABLE IF EXISTS "Dishes";
+DROP TABLE IF EXISTS "Restaurants";
+DROP TABLE IF EXISTS "Users";
@@ -0,0 +1,47 @@
+-- Schemat bazowy PapuGO (odtworzony z zapytań w app.py).
+
+CREATE TABLE IF NOT EXISTS "Users" (
+    "UserID"   SERIAL PRIMARY KEY,
+    "Username" VARCHAR(100) NOT NULL,
+    "Password" VARCHAR(255) NOT NULL,
+    "IsAdmin"  BOOLEAN NOT NULL DEFAULT FALSE,
+    CONSTRAINT "Users_Username_key" UNIQUE ("Username")
+);
+
+CREATE TABLE IF NOT EXISTS "Restaurants" (
+    "RestaurantID" SERIAL PRIMARY KEY,
+    "Name"         VARCHAR(255) NOT NULL,
+    "CuisineType"  VARCHAR(100),
+    "Street"       VARCHAR(255),
+    "StreetNumber" VARCHAR(20),
+    "PostalCode"   VARCHAR(10),
+    "City"         VARCHAR(100),
+    "ImageURL"     TEXT
+);
+
+-- Usunięcie restauracji usuwa jej menu (manage_restaurants sprząta zdjęcia dań z S3).
+CREATE TABLE IF NOT EXISTS "Dishes" (
+    "DishID"       SERIAL PRIMARY KEY,
+    "RestaurantID" INTEGER NOT NULL REFERENCES "Restaurants" ("RestaurantID") ON DELETE CASCADE,
+    "Name"         VARCHAR(255) NOT NULL,
+    "Description"  TEXT,
+    "Price"        NUMERIC(10, 2) NOT NULL CHECK ("Price" >= 0),
+    "ImageURL"     TEXT
+);
+
+-- Zamówienia usuniętych użytkowników zostają (view_orders pokazuje "[Usunięty]").
+CREATE TABLE IF NOT EXISTS "Orders" (
+    "OrderID"    SERIAL PRIMARY KEY,
+    "UserID"     INTEGER REFERENCES "Users" ("UserID") ON DELETE SET NULL,
+    "OrderDate"  TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "TotalPrice" NUMERIC(10, 2) NOT NULL,
+    "Status"     VARCHAR(50) NOT NULL DEFAULT 'Złożone'
+);
+
+CREATE TABLE IF NOT EXISTS "OrderItems" (
+    "OrderItemID"  SERIAL PRIMARY KEY,
+    "OrderID"      INTEGER NOT NULL REFERENCES "Orders" ("OrderID") ON DELETE CASCADE,
+    "DishID"       INTEGER REFERENCES "Dishes" ("DishID") ON DELETE SET NULL,
+    "Quantity"     INTEGER NOT NULL CHECK ("Quantity" > 0),
+    "PricePerItem" NUMERIC(10, 2) NOT NULL
+);
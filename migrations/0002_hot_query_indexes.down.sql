@@ -0,0 +1,5 @@
+DROP INDEX IF EXISTS "OrderItems_DishID_idx";
+DROP INDEX IF EXISTS "OrderItems_OrderID_idx";
+DROP INDEX IF EXISTS "Dishes_RestaurantID_Name_idx";
+DROP INDEX IF EXISTS "Orders_OrderDate_idx";
+DROP INDEX IF EXISTS "Orders_UserID_OrderDate_idx";
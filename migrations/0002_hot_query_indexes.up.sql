@@ -0,0 +1,22 @@
+-- Indeksy pod najczęstsze zapytania z app.py.
+-- "Users"."Username" jest już pokryty przez ograniczenie UNIQUE z 0001.
+
+-- my_orders(): WHERE "UserID" = %s ORDER BY "OrderDate" DESC (index-only scan)
+CREATE INDEX IF NOT EXISTS "Orders_UserID_OrderDate_idx"
+    ON "Orders" ("UserID", "OrderDate" DESC) INCLUDE ("OrderID", "TotalPrice", "Status");
+
+-- view_orders(): ORDER BY "OrderDate" DESC, "OrderID" DESC z paginacją po kluczu - bez sortowania całej tabeli
+CREATE INDEX IF NOT EXISTS "Orders_OrderDate_idx"
+    ON "Orders" ("OrderDate" DESC, "OrderID" DESC);
+
+-- restaurant_detail() / manage_dishes(): WHERE "RestaurantID" = %s ORDER BY "Name"
+CREATE INDEX IF NOT EXISTS "Dishes_RestaurantID_Name_idx"
+    ON "Dishes" ("RestaurantID", "Name") INCLUDE ("Price");
+
+-- track_order_detail(): WHERE "OrderID" = %s (FK nie tworzy indeksu automatycznie)
+CREATE INDEX IF NOT EXISTS "OrderItems_OrderID_idx"
+    ON "OrderItems" ("OrderID") INCLUDE ("DishID", "Quantity", "PricePerItem");
+
+-- ON DELETE SET NULL przy usuwaniu dania nie skanuje całej tabeli pozycji
+CREATE INDEX IF NOT EXISTS "OrderItems_DishID_idx"
+    ON "OrderItems" ("DishID");
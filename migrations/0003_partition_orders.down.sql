@@ -0,0 +1,48 @@
+-- Powrót do niepartycjonowanych tabel; zarchiwizowane zamówienia wracają do "Orders".
+
+CREATE TABLE "Orders_plain" (
+    "OrderID"    INTEGER NOT NULL DEFAULT nextval('"Orders_OrderID_seq"'::regclass),
+    "UserID"     INTEGER REFERENCES "Users" ("UserID") ON DELETE SET NULL,
+    "OrderDate"  TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "TotalPrice" NUMERIC(10, 2) NOT NULL,
+    "Status"     VARCHAR(50) NOT NULL DEFAULT 'Złożone'
+);
+CREATE TABLE "OrderItems_plain" (
+    "OrderItemID"  INTEGER NOT NULL DEFAULT nextval('"OrderItems_OrderItemID_seq"'::regclass),
+    "OrderID"      INTEGER NOT NULL,
+    "DishID"       INTEGER REFERENCES "Dishes" ("DishID") ON DELETE SET NULL,
+    "Quantity"     INTEGER NOT NULL CHECK ("Quantity" > 0),
+    "PricePerItem" NUMERIC(10, 2) NOT NULL
+);
+
+INSERT INTO "Orders_plain" ("OrderID", "UserID", "OrderDate", "TotalPrice", "Status")
+    SELECT "OrderID", "UserID", "OrderDate", "TotalPrice", "Status" FROM "Orders"
+    UNION ALL
+    SELECT a."OrderID", u."UserID", a."OrderDate", a."TotalPrice", a."Status"
+    FROM "OrdersArchive" a LEFT JOIN "Users" u ON u."UserID" = a."UserID";
+INSERT INTO "OrderItems_plain" ("OrderItemID", "OrderID", "DishID", "Quantity", "PricePerItem")
+    SELECT "OrderItemID", "OrderID", "DishID", "Quantity", "PricePerItem" FROM "OrderItems"
+    UNION ALL
+    SELECT a."OrderItemID", a."OrderID", d."DishID", a."Quantity", a."PricePerItem"
+    FROM "OrderItemsArchive" a LEFT JOIN "Dishes" d ON d."DishID" = a."DishID";
+
+ALTER SEQUENCE "Orders_OrderID_seq" OWNED BY "Orders_plain"."OrderID";
+ALTER SEQUENCE "OrderItems_OrderItemID_seq" OWNED BY "OrderItems_plain"."OrderItemID";
+
+DROP TABLE "OrderItemsArchive";
+DROP TABLE "OrdersArchive";
+DROP TABLE "OrderItems";
+DROP TABLE "Orders";
+DROP FUNCTION IF EXISTS papugo_ensure_order_partitions(TIMESTAMP, TIMESTAMP);
+
+ALTER TABLE "Orders_plain" RENAME TO "Orders";
+ALTER TABLE "OrderItems_plain" RENAME TO "OrderItems";
+ALTER TABLE "Orders" ADD CONSTRAINT "Orders_pkey" PRIMARY KEY ("OrderID");
+ALTER TABLE "OrderItems" ADD CONSTRAINT "OrderItems_pkey" PRIMARY KEY ("OrderItemID");
+ALTER TABLE "OrderItems" ADD CONSTRAINT "OrderItems_OrderID_fkey"
+    FOREIGN KEY ("OrderID") REFERENCES "Orders" ("OrderID") ON DELETE CASCADE;
+
+CREATE INDEX "Orders_UserID_OrderDate_idx" ON "Orders" ("UserID", "OrderDate" DESC) INCLUDE ("OrderID", "TotalPrice", "Status");
+CREATE INDEX "Orders_OrderDate_idx" ON "Orders" ("OrderDate" DESC, "OrderID" DESC);
+CREATE INDEX "OrderItems_OrderID_idx" ON "OrderItems" ("OrderID") INCLUDE ("DishID", "Quantity", "PricePerItem");
+CREATE INDEX "OrderItems_DishID_idx" ON "OrderItems" ("DishID");
@@ -0,0 +1,109 @@
+-- Miesięczne partycjonowanie "Orders"/"OrderItems" po "OrderDate" oraz tabele archiwum.
+-- Klucz partycjonowania musi być częścią PK i FK, dlatego "OrderItems" dostaje kolumnę "OrderDate".
+
+ALTER TABLE "OrderItems" RENAME TO "OrderItems_legacy";
+ALTER TABLE "Orders" RENAME TO "Orders_legacy";
+ALTER INDEX "OrderItems_pkey" RENAME TO "OrderItems_legacy_pkey";
+ALTER INDEX "Orders_pkey" RENAME TO "Orders_legacy_pkey";
+DROP INDEX IF EXISTS "Orders_UserID_OrderDate_idx";
+DROP INDEX IF EXISTS "Orders_OrderDate_idx";
+DROP INDEX IF EXISTS "OrderItems_OrderID_idx";
+DROP INDEX IF EXISTS "OrderItems_DishID_idx";
+
+CREATE TABLE "Orders" (
+    "OrderID"    INTEGER NOT NULL DEFAULT nextval('"Orders_OrderID_seq"'::regclass),
+    "UserID"     INTEGER REFERENCES "Users" ("UserID") ON DELETE SET NULL,
+    "OrderDate"  TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "TotalPrice" NUMERIC(10, 2) NOT NULL,
+    "Status"     VARCHAR(50) NOT NULL DEFAULT 'Złożone',
+    PRIMARY KEY ("OrderID", "OrderDate")
+) PARTITION BY RANGE ("OrderDate");
+
+CREATE TABLE "OrderItems" (
+    "OrderItemID"  INTEGER NOT NULL DEFAULT nextval('"OrderItems_OrderItemID_seq"'::regclass),
+    "OrderID"      INTEGER NOT NULL,
+    "OrderDate"    TIMESTAMP NOT NULL,
+    "DishID"       INTEGER REFERENCES "Dishes" ("DishID") ON DELETE SET NULL,
+    "Quantity"     INTEGER NOT NULL CHECK ("Quantity" > 0),
+    "PricePerItem" NUMERIC(10, 2) NOT NULL,
+    PRIMARY KEY ("OrderItemID", "OrderDate"),
+    FOREIGN KEY ("OrderID", "OrderDate") REFERENCES "Orders" ("OrderID", "OrderDate") ON DELETE CASCADE
+) PARTITION BY RANGE ("OrderDate");
+
+ALTER SEQUENCE "Orders_OrderID_seq" OWNED BY "Orders"."OrderID";
+ALTER SEQUENCE "OrderItems_OrderItemID_seq" OWNED BY "OrderItems"."OrderItemID";
+
+-- Partycje domyślne łapią wiersze spoza utworzonych miesięcy, więc INSERT nigdy nie zawodzi.
+CREATE TABLE "Orders_default" PARTITION OF "Orders" DEFAULT;
+CREATE TABLE "OrderItems_default" PARTITION OF "OrderItems" DEFAULT;
+
+-- Tworzy brakujące partycje miesięczne w przedziale [start_month, end_month).
+-- Wywoływana przez `maintenance.py ensure-partitions`.
+CREATE OR REPLACE FUNCTION papugo_ensure_order_partitions(start_month TIMESTAMP, end_month TIMESTAMP)
+RETURNS INTEGER AS $$
+DECLARE
+    month_start TIMESTAMP := date_trunc('month', start_month);
+    month_end   TIMESTAMP;
+    suffix      TEXT;
+    created     INTEGER := 0;
+BEGIN
+    WHILE month_start < end_month LOOP
+        month_end := month_start + INTERVAL '1 month';
+        suffix := to_char(month_start, 'YYYYMM');
+        IF to_regclass(format('%I', 'Orders_p' || suffix)) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I PARTITION OF "Orders" FOR VALUES FROM (%L) TO (%L)',
+                           'Orders_p' || suffix, month_start, month_end);
+            created := created + 1;
+        END IF;
+        IF to_regclass(format('%I', 'OrderItems_p' || suffix)) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I PARTITION OF "OrderItems" FOR VALUES FROM (%L) TO (%L)',
+                           'OrderItems_p' || suffix, month_start, month_end);
+            created := created + 1;
+        END IF;
+        month_start := month_end;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT papugo_ensure_order_partitions(
+    COALESCE((SELECT min("OrderDate") FROM "Orders_legacy"), CURRENT_TIMESTAMP),
+    date_trunc('month', CURRENT_TIMESTAMP) + INTERVAL '3 months');
+
+INSERT INTO "Orders" ("OrderID", "UserID", "OrderDate", "TotalPrice", "Status")
+    SELECT "OrderID", "UserID", "OrderDate", "TotalPrice", "Status" FROM "Orders_legacy";
+INSERT INTO "OrderItems" ("OrderItemID", "OrderID", "OrderDate", "DishID", "Quantity", "PricePerItem")
+    SELECT oi."OrderItemID", oi."OrderID", o."OrderDate", oi."DishID", oi."Quantity", oi."PricePerItem"
+    FROM "OrderItems_legacy" oi JOIN "Orders_legacy" o ON o."OrderID" = oi."OrderID";
+
+DROP TABLE "OrderItems_legacy";
+DROP TABLE "Orders_legacy";
+
+-- Indeksy na tabeli nadrzędnej są tworzone automatycznie w każdej partycji.
+CREATE INDEX "Orders_UserID_OrderDate_idx" ON "Orders" ("UserID", "OrderDate" DESC) INCLUDE ("OrderID", "TotalPrice", "Status");
+CREATE INDEX "Orders_OrderDate_idx" ON "Orders" ("OrderDate" DESC, "OrderID" DESC);
+CREATE INDEX "Orders_OrderID_idx" ON "Orders" ("OrderID");
+CREATE INDEX "OrderItems_OrderID_idx" ON "OrderItems" ("OrderID", "OrderDate") INCLUDE ("DishID", "Quantity", "PricePerItem");
+CREATE INDEX "OrderItems_DishID_idx" ON "OrderItems" ("DishID");
+
+-- Archiwum zakończonych zamówień (Dostarczone/Anulowane) starszych niż okres retencji.
+-- Tylko dopisywane, więc fillfactor 100 i brak FK do "Users" (historia przeżywa usunięcie konta).
+CREATE TABLE "OrdersArchive" (
+    "OrderID"    INTEGER PRIMARY KEY,
+    "UserID"     INTEGER,
+    "OrderDate"  TIMESTAMP NOT NULL,
+    "TotalPrice" NUMERIC(10, 2) NOT NULL,
+    "Status"     VARCHAR(50) NOT NULL,
+    "ArchivedAt" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) WITH (fillfactor = 100);
+
+CREATE TABLE "OrderItemsArchive" (
+    "OrderItemID"  INTEGER PRIMARY KEY,
+    "OrderID"      INTEGER NOT NULL REFERENCES "OrdersArchive" ("OrderID") ON DELETE CASCADE,
+    "DishID"       INTEGER,
+    "Quantity"     INTEGER NOT NULL,
+    "PricePerItem" NUMERIC(10, 2) NOT NULL
+) WITH (fillfactor = 100);
+
+CREATE INDEX "OrdersArchive_UserID_OrderDate_idx" ON "OrdersArchive" ("UserID", "OrderDate" DESC) INCLUDE ("OrderID", "TotalPrice", "Status");
+CREATE INDEX "OrderItemsArchive_OrderID_idx" ON "OrderItemsArchive" ("OrderID") INCLUDE ("DishID", "Quantity", "PricePerItem");
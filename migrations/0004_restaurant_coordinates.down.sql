@@ -0,0 +1,2 @@
+ALTER TABLE "Restaurants" DROP COLUMN IF EXISTS "Longitude";
+ALTER TABLE "Restaurants" DROP COLUMN IF EXISTS "Latitude";
@@ -0,0 +1,4 @@
+-- Współrzędne restauracji z geokodowania offline (geo.py); uzupełnienie: `maintenance.py geocode-restaurants`.
+-- Zapytania "najbliżej mnie" obsługuje indeks siatkowy w procesie aplikacji, nie indeks bazy.
+ALTER TABLE "Restaurants" ADD COLUMN IF NOT EXISTS "Latitude" DOUBLE PRECISION;
+ALTER TABLE "Restaurants" ADD COLUMN IF NOT EXISTS "Longitude" DOUBLE PRECISION;
@@ -0,0 +1,11 @@
+-- Klucze idempotencji płatności: ponowione /place_order z tym samym kluczem zwraca istniejące zamówienie.
+-- PRIMARY KEY jest ostateczną ochroną przed podwójnym zamówieniem przy równoległych żądaniach.
+CREATE TABLE IF NOT EXISTS "OrderIdempotencyKeys" (
+    "IdempotencyKey" UUID PRIMARY KEY,
+    "UserID"         INTEGER NOT NULL,
+    "OrderID"        INTEGER,
+    "CreatedAt"      TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- `maintenance.py purge-idempotency-keys` usuwa klucze starsze niż TTL
+CREATE INDEX IF NOT EXISTS "OrderIdempotencyKeys_CreatedAt_idx" ON "OrderIdempotencyKeys" ("CreatedAt");
@@ -0,0 +1,20 @@
+-- Kolejka zadań w tle (jobs.py / worker.py).
+CREATE TABLE IF NOT EXISTS "Jobs" (
+    "JobID"       BIGSERIAL PRIMARY KEY,
+    "Type"        VARCHAR(100) NOT NULL,
+    "Payload"     JSONB NOT NULL DEFAULT '{}'::jsonb,
+    "Status"      VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK ("Status" IN ('pending', 'running', 'done', 'dead')),
+    "Attempts"    INTEGER NOT NULL DEFAULT 0,
+    "MaxAttempts" INTEGER NOT NULL DEFAULT 5,
+    "RunAt"       TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "LockedAt"    TIMESTAMP,
+    "LockedBy"    VARCHAR(255),
+    "LastError"   TEXT,
+    "CreatedAt"   TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "FinishedAt"  TIMESTAMP
+);
+
+-- Odpytywanie workera dotyka tylko oczekujących/uruchomionych wierszy
+CREATE INDEX IF NOT EXISTS "Jobs_pending_idx" ON "Jobs" ("Type", "RunAt") WHERE "Status" = 'pending';
+CREATE INDEX IF NOT EXISTS "Jobs_running_idx" ON "Jobs" ("LockedAt") WHERE "Status" = 'running';
+CREATE INDEX IF NOT EXISTS "Jobs_dead_idx" ON "Jobs" ("Type", "FinishedAt") WHERE "Status" = 'dead';
@@ -0,0 +1,4 @@
+DROP TABLE IF EXISTS "RecommendationState";
+DROP TABLE IF EXISTS "DishRecommendations";
+DROP TABLE IF EXISTS "DishPairCounts";
+DROP TABLE IF EXISTS "DishOrderCounts";
@@ -0,0 +1,32 @@
+-- Rekomendacje dań liczone wsadowo przez `maintenance.py refresh-recommendations` (recommendations.py).
+-- Skumulowane liczniki: w ilu zamówieniach wystąpiło danie / para dań tej samej restauracji.
+CREATE TABLE IF NOT EXISTS "DishOrderCounts" (
+    "DishID"     INTEGER PRIMARY KEY REFERENCES "Dishes" ("DishID") ON DELETE CASCADE,
+    "OrderCount" INTEGER NOT NULL
+);
+
+-- Para zapisana w obu kierunkach, więc sąsiadów dania czyta się jednym zakresem klucza
+CREATE TABLE IF NOT EXISTS "DishPairCounts" (
+    "DishID"      INTEGER NOT NULL REFERENCES "Dishes" ("DishID") ON DELETE CASCADE,
+    "OtherDishID" INTEGER NOT NULL REFERENCES "Dishes" ("DishID") ON DELETE CASCADE,
+    "PairCount"   INTEGER NOT NULL,
+    PRIMARY KEY ("DishID", "OtherDishID")
+);
+CREATE INDEX IF NOT EXISTS "DishPairCounts_OtherDishID_idx" ON "DishPairCounts" ("OtherDishID");
+
+-- Tablica do odczytu na stronach: najlepsze K dań "często zamawiane razem" dla każdego dania
+CREATE TABLE IF NOT EXISTS "DishRecommendations" (
+    "DishID"            INTEGER NOT NULL REFERENCES "Dishes" ("DishID") ON DELETE CASCADE,
+    "Rank"              SMALLINT NOT NULL,
+    "RecommendedDishID" INTEGER NOT NULL REFERENCES "Dishes" ("DishID") ON DELETE CASCADE,
+    "Score"             REAL NOT NULL,
+    PRIMARY KEY ("DishID", "Rank")
+) WITH (fillfactor = 100);
+CREATE INDEX IF NOT EXISTS "DishRecommendations_RecommendedDishID_idx" ON "DishRecommendations" ("RecommendedDishID");
+
+-- Znacznik przyrostowego odświeżania: zamówienia do "LastOrderID" włącznie są już policzone
+CREATE TABLE IF NOT EXISTS "RecommendationState" (
+    "Name"        VARCHAR(100) PRIMARY KEY,
+    "LastOrderID" INTEGER NOT NULL DEFAULT 0,
+    "UpdatedAt"   TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
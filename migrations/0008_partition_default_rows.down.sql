@@ -0,0 +1,28 @@
+-- Poprzednia wersja funkcji z migracji 0003 (bez przenoszenia wierszy z partycji domyślnych).
+
+CREATE OR REPLACE FUNCTION papugo_ensure_order_partitions(start_month TIMESTAMP, end_month TIMESTAMP)
+RETURNS INTEGER AS $$
+DECLARE
+    month_start TIMESTAMP := date_trunc('month', start_month);
+    month_end   TIMESTAMP;
+    suffix      TEXT;
+    created     INTEGER := 0;
+BEGIN
+    WHILE month_start < end_month LOOP
+        month_end := month_start + INTERVAL '1 month';
+        suffix := to_char(month_start, 'YYYYMM');
+        IF to_regclass(format('%I', 'Orders_p' || suffix)) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I PARTITION OF "Orders" FOR VALUES FROM (%L) TO (%L)',
+                           'Orders_p' || suffix, month_start, month_end);
+            created := created + 1;
+        END IF;
+        IF to_regclass(format('%I', 'OrderItems_p' || suffix)) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I PARTITION OF "OrderItems" FOR VALUES FROM (%L) TO (%L)',
+                           'OrderItems_p' || suffix, month_start, month_end);
+            created := created + 1;
+        END IF;
+        month_start := month_end;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,59 @@
+-- papugo_ensure_order_partitions przenosi wiersze z partycji domyślnych.
+-- CREATE TABLE ... PARTITION OF nie zadziała, jeśli "Orders_default" zawiera już wiersze z danego
+-- miesiąca (ograniczenie partycji domyślnej zostałoby naruszone). Wtedy partycja miesiąca powstaje
+-- jako osobna tabela, przejmuje wiersze z partycji domyślnej i dopiero potem jest dołączana.
+-- Pozycje przenoszone są przed zamówieniami, bo usunięcie zamówienia z "Orders_default"
+-- kasuje (ON DELETE CASCADE) pozycje, które wciąż na nie wskazują.
+
+CREATE OR REPLACE FUNCTION papugo_ensure_order_partitions(start_month TIMESTAMP, end_month TIMESTAMP)
+RETURNS INTEGER AS $$
+DECLARE
+    month_start     TIMESTAMP := date_trunc('month', start_month);
+    month_end       TIMESTAMP;
+    orders_part     TEXT;
+    items_part      TEXT;
+    orders_missing  BOOLEAN;
+    items_missing   BOOLEAN;
+    created         INTEGER := 0;
+BEGIN
+    WHILE month_start < end_month LOOP
+        month_end := month_start + INTERVAL '1 month';
+        orders_part := 'Orders_p' || to_char(month_start, 'YYYYMM');
+        items_part := 'OrderItems_p' || to_char(month_start, 'YYYYMM');
+        orders_missing := to_regclass(format('%I', orders_part)) IS NULL;
+        items_missing := to_regclass(format('%I', items_part)) IS NULL;
+        IF orders_missing OR items_missing THEN
+            -- Między kopiowaniem a usunięciem z partycji domyślnej nie może dojść nowy wiersz z tego miesiąca
+            LOCK TABLE "Orders_default", "OrderItems_default" IN SHARE ROW EXCLUSIVE MODE;
+            IF NOT EXISTS (SELECT 1 FROM "Orders_default" WHERE "OrderDate" >= month_start AND "OrderDate" < month_end)
+               AND NOT EXISTS (SELECT 1 FROM "OrderItems_default" WHERE "OrderDate" >= month_start AND "OrderDate" < month_end) THEN
+                IF orders_missing THEN
+                    EXECUTE format('CREATE TABLE %I PARTITION OF "Orders" FOR VALUES FROM (%L) TO (%L)', orders_part, month_start, month_end);
+                    created := created + 1;
+                END IF;
+                IF items_missing THEN
+                    EXECUTE format('CREATE TABLE %I PARTITION OF "OrderItems" FOR VALUES FROM (%L) TO (%L)', items_part, month_start, month_end);
+                    created := created + 1;
+                END IF;
+            ELSIF NOT (orders_missing AND items_missing) THEN
+                RAISE EXCEPTION 'Partycja domyślna zawiera wiersze z %, a istnieje tylko jedna z partycji % / % - napraw ręcznie',
+                    to_char(month_start, 'YYYY-MM'), orders_part, items_part;
+            ELSE
+                EXECUTE format('CREATE TABLE %I (LIKE "OrderItems" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', items_part);
+                EXECUTE format('INSERT INTO %I SELECT * FROM "OrderItems_default" WHERE "OrderDate" >= %L AND "OrderDate" < %L', items_part, month_start, month_end);
+                EXECUTE format('DELETE FROM "OrderItems_default" WHERE "OrderDate" >= %L AND "OrderDate" < %L', month_start, month_end);
+                EXECUTE format('CREATE TABLE %I (LIKE "Orders" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', orders_part);
+                EXECUTE format('INSERT INTO %I SELECT * FROM "Orders_default" WHERE "OrderDate" >= %L AND "OrderDate" < %L', orders_part, month_start, month_end);
+                EXECUTE format('DELETE FROM "Orders_default" WHERE "OrderDate" >= %L AND "OrderDate" < %L', month_start, month_end);
+                -- Dołączenie tworzy indeksy z tabel nadrzędnych i sprawdza FK pozycji do już dołączonych zamówień
+                EXECUTE format('ALTER TABLE "Orders" ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', orders_part, month_start, month_end);
+                EXECUTE format('ALTER TABLE "OrderItems" ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', items_part, month_start, month_end);
+                RAISE NOTICE 'Przeniesiono wiersze z partycji domyślnych do % / %', orders_part, items_part;
+                created := created + 2;
+            END IF;
+        END IF;
+        month_start := month_end;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
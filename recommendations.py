@@ -0,0 +1,129 @@
+"""Wsadowe liczenie rekomendacji dań: popularność i "często zamawiane razem".
+
+Zamówienia zamieniane są na rzadką macierz binarną X (zamówienia x dania); X^T X daje
+na przekątnej liczbę zamówień z daniem, a poza nią liczbę zamówień z parą dań. Liczniki
+kumulowane są w "DishOrderCounts"/"DishPairCounts", a przebieg przyrostowy czyta tylko
+zamówienia powyżej znacznika "LastOrderID". Wynik dla stron (najlepsze K dań na danie,
+podobieństwo kosinusowe) trafia do "DishRecommendations".
+
+Zamówienia anulowane po policzeniu zostają w licznikach do pełnego przeliczenia (`full=True`).
+"""
+import logging
+
+import numpy as np
+import psycopg2.extras
+from scipy import sparse
+
+logger = logging.getLogger('papugo.recommendations')
+
+REFRESH_LOCK_KEY = 7261_0002
+STATE_NAME = 'dish_cooccurrence'
+EXCLUDED_STATUSES = ('Anulowane',)
+DEFAULT_TOP_K = 10
+DEFAULT_MIN_PAIR_COUNT = 2
+DEFAULT_BATCH_SIZE = 20000
+# Zamówienia młodsze niż to opóźnienie czekają na kolejny przebieg: transakcja z niższym
+# OrderID mogła jeszcze nie zostać zatwierdzona, a znacznik przeskoczyłby ją na zawsze.
+DEFAULT_SETTLE_SECONDS = 300
+
+LIVE_ITEMS_SQL = '''SELECT o."OrderID", i."DishID" FROM "Orders" o
+                    JOIN "OrderItems" i ON i."OrderID" = o."OrderID" AND i."OrderDate" = o."OrderDate"
+                    WHERE o."OrderID" > %s AND o."OrderID" <= %s AND o."Status" <> ALL(%s) AND i."DishID" IS NOT NULL'''
+ARCHIVE_ITEMS_SQL = '''SELECT o."OrderID", i."DishID" FROM "OrdersArchive" o
+                       JOIN "OrderItemsArchive" i ON i."OrderID" = o."OrderID"
+                       WHERE o."OrderID" > %s AND o."OrderID" <= %s AND o."Status" <> ALL(%s) AND i."DishID" IS NOT NULL'''
+
+def cooccurrence(order_ids, dish_ids, n_dishes):
+    """Zwraca macierz n_dishes x n_dishes: przekątna = zamówienia z daniem, reszta = zamówienia z parą."""
+    if len(order_ids) == 0: return sparse.csr_matrix((n_dishes, n_dishes), dtype=np.int64)
+    _, order_index = np.unique(order_ids, return_inverse=True)
+    x = sparse.csr_matrix((np.ones(len(order_index), dtype=np.int64), (order_index, dish_ids)), shape=(order_index.max() + 1, n_dishes))
+    x.sum_duplicates(); x.data[:] = 1 # Danie liczy się raz na zamówienie, niezależnie od liczby pozycji i ilości
+    return (x.T @ x).tocsr()
+
+def top_k_scores(dish_ids, other_ids, pair_counts, dish_counts, other_counts, top_k):
+    """Podobieństwo kosinusowe par i K najlepszych sąsiadów na danie; zwraca (danie, ranga, sąsiad, wynik)."""
+    if len(dish_ids) == 0: return []
+    scores = pair_counts / np.sqrt(dish_counts.astype(np.float64) * other_counts)
+    order = np.lexsort((other_ids, -scores, dish_ids)) # Remis rozstrzyga niższe ID - wynik deterministyczny
+    dish_ids, other_ids, scores = dish_ids[order], other_ids[order], scores[order]
+    group_start = np.r_[True, dish_ids[1:] != dish_ids[:-1]]
+    positions = np.arange(len(dish_ids))
+    ranks = positions - np.maximum.accumulate(np.where(group_start, positions, 0))
+    keep = ranks < top_k
+    return list(zip(dish_ids[keep].tolist(), ranks[keep].tolist(), other_ids[keep].tolist(), scores[keep].tolist()))
+
+def _restaurant_of_dishes(cursor):
+    cursor.execute('SELECT "DishID", "RestaurantID" FROM "Dishes"'); rows = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+    restaurant_of = np.full(int(rows[:, 0].max()) + 1 if len(rows) else 1, -1, dtype=np.int64)
+    restaurant_of[rows[:, 0]] = rows[:, 1]
+    return restaurant_of
+
+def _accumulate(cursor, sql, low, high, batch_size, restaurant_of):
+    """Sumuje X^T X paczkami po `batch_size` numerów zamówień; zwraca (macierz, liczba zamówień)."""
+    n_dishes = len(restaurant_of); total = sparse.csr_matrix((n_dishes, n_dishes), dtype=np.int64); orders = 0
+    for start in range(low, high, batch_size):
+        cursor.execute(sql, (start, min(start + batch_size, high), list(EXCLUDED_STATUSES)))
+        rows = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+        rows = rows[rows[:, 1] < n_dishes] # Dania dodane w trakcie przebiegu - policzy je następny
+        if not len(rows): continue
+        total = total + cooccurrence(rows[:, 0], rows[:, 1], n_dishes); orders += len(np.unique(rows[:, 0]))
+    return total, orders
+
+def refresh(conn, full=False, batch_size=DEFAULT_BATCH_SIZE, top_k=DEFAULT_TOP_K, min_pair_count=DEFAULT_MIN_PAIR_COUNT, settle_seconds=DEFAULT_SETTLE_SECONDS):
+    """Dolicza nowe zamówienia (albo przelicza wszystko przy `full`) i odświeża rekomendacje.
+
+    Całość działa w jednej transakcji: liczniki i znacznik zmieniają się razem albo wcale.
+    Zwraca słownik ze statystykami przebiegu.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_xact_lock(%s)', (REFRESH_LOCK_KEY,))
+        if not cursor.fetchone()[0]: conn.rollback(); logger.warning("Inny przebieg rekomendacji jest w toku - pomijam."); return None
+        cursor.execute('INSERT INTO "RecommendationState" ("Name") VALUES (%s) ON CONFLICT DO NOTHING', (STATE_NAME,))
+        cursor.execute('SELECT "LastOrderID" FROM "RecommendationState" WHERE "Name" = %s FOR UPDATE', (STATE_NAME,))
+        watermark = 0 if full else cursor.fetchone()[0]
+        cursor.execute('SELECT max("OrderID") FROM "Orders" WHERE "OrderDate" < CURRENT_TIMESTAMP - make_interval(secs => %s)', (settle_seconds,))
+        high = cursor.fetchone()[0] or watermark
+        if full:
+            cursor.execute('SELECT max("OrderID") FROM "OrdersArchive"'); high = max(high, cursor.fetchone()[0] or 0)
+            cursor.execute('TRUNCATE "DishOrderCounts", "DishPairCounts", "DishRecommendations"')
+        stats = {'orders': 0, 'dishes': 0, 'pairs': 0, 'recommendations': 0, 'last_order_id': max(high, watermark)}
+        if high <= watermark and not full: conn.rollback(); return stats
+
+        restaurant_of = _restaurant_of_dishes(cursor)
+        counts, stats['orders'] = _accumulate(cursor, LIVE_ITEMS_SQL, watermark, high, batch_size, restaurant_of)
+        if full:
+            archived, archived_orders = _accumulate(cursor, ARCHIVE_ITEMS_SQL, 0, high, batch_size, restaurant_of)
+            counts = counts + archived; stats['orders'] += archived_orders
+
+        dish_counts = counts.diagonal(); dishes = np.flatnonzero(dish_counts); dishes = dishes[restaurant_of[dishes] >= 0] # Danie usunięte w trakcie
+        pairs = sparse.triu(counts, k=1).tocoo() # Każda para raz; zapis w obu kierunkach niżej
+        same_restaurant = (restaurant_of[pairs.row] == restaurant_of[pairs.col]) & (restaurant_of[pairs.row] >= 0)
+        rows, cols, values = pairs.row[same_restaurant], pairs.col[same_restaurant], pairs.data[same_restaurant]
+        psycopg2.extras.execute_values(cursor, '''INSERT INTO "DishOrderCounts" ("DishID", "OrderCount") VALUES %s
+                                                  ON CONFLICT ("DishID") DO UPDATE SET "OrderCount" = "DishOrderCounts"."OrderCount" + EXCLUDED."OrderCount"''',
+                                       list(zip(dishes.tolist(), dish_counts[dishes].tolist())), page_size=1000)
+        psycopg2.extras.execute_values(cursor, '''INSERT INTO "DishPairCounts" ("DishID", "OtherDishID", "PairCount") VALUES %s
+                                                  ON CONFLICT ("DishID", "OtherDishID") DO UPDATE SET "PairCount" = "DishPairCounts"."PairCount" + EXCLUDED."PairCount"''',
+                                       list(zip(np.r_[rows, cols].tolist(), np.r_[cols, rows].tolist(), np.r_[values, values].tolist())), page_size=1000)
+        stats['dishes'] = len(dishes); stats['pairs'] = len(values)
+
+        # Zmiana licznika dania zmienia wyniki wszystkich jego par, a pary są zawsze w obrębie jednej
+        # restauracji - wystarczy przeliczyć rekomendacje restauracji, których dania się pojawiły.
+        restaurants = np.unique(restaurant_of[dishes]); restaurants = restaurants[restaurants >= 0].tolist()
+        if restaurants: stats['recommendations'] = _rebuild_recommendations(cursor, restaurants, top_k, min_pair_count)
+        cursor.execute('UPDATE "RecommendationState" SET "LastOrderID" = %s, "UpdatedAt" = CURRENT_TIMESTAMP WHERE "Name" = %s', (stats['last_order_id'], STATE_NAME))
+    conn.commit()
+    return stats
+
+def _rebuild_recommendations(cursor, restaurant_ids, top_k, min_pair_count):
+    cursor.execute('''SELECT p."DishID", p."OtherDishID", p."PairCount", a."OrderCount", b."OrderCount"
+                      FROM "DishPairCounts" p JOIN "Dishes" d ON d."DishID" = p."DishID"
+                      JOIN "DishOrderCounts" a ON a."DishID" = p."DishID" JOIN "DishOrderCounts" b ON b."DishID" = p."OtherDishID"
+                      WHERE d."RestaurantID" = ANY(%s) AND p."PairCount" >= %s''', (restaurant_ids, min_pair_count))
+    data = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 5)
+    recommendations = top_k_scores(data[:, 0], data[:, 1], data[:, 2], data[:, 3], data[:, 4], top_k)
+    cursor.execute('DELETE FROM "DishRecommendations" r USING "Dishes" d WHERE d."DishID" = r."DishID" AND d."RestaurantID" = ANY(%s)', (restaurant_ids,))
+    psycopg2.extras.execute_values(cursor, 'INSERT INTO "DishRecommendations" ("DishID", "Rank", "RecommendedDishID", "Score") VALUES %s',
+                                   recommendations, page_size=1000)
+    return len(recommendations)
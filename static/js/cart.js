@@ -0,0 +1,70 @@
+// static/js/cart.js
+// Progressive enhancement koszyka: formularze z atrybutem data-cart-api są wysyłane fetch()
+// do /api/cart/*, a strona aktualizuje się na podstawie zwróconego podsumowania koszyka.
+// Bez JavaScriptu (albo przy błędzie sieci) formularze działają jak zwykłe POST + przekierowanie.
+(function () {
+    var ALERT_CLASSES = {success: 'alert-success', danger: 'alert-danger', warning: 'alert-warning', info: 'alert-info'};
+
+    function formatPrice(value) {
+        return value.toFixed(2) + ' zł';
+    }
+
+    function showMessage(message, category) {
+        var container = document.getElementById('ajaxMessages');
+        if (!container || !message) return;
+        var alert = document.createElement('div');
+        alert.className = 'alert ' + (ALERT_CLASSES[category] || 'alert-secondary') + ' alert-dismissible fade show mt-3';
+        alert.setAttribute('role', 'alert');
+        alert.textContent = message;
+        var close = document.createElement('button');
+        close.type = 'button'; close.className = 'btn-close'; close.setAttribute('data-bs-dismiss', 'alert'); close.setAttribute('aria-label', 'Close');
+        alert.appendChild(close);
+        container.replaceChildren(alert);
+    }
+
+    function updateBadge(cart) {
+        var badge = document.getElementById('cartBadge');
+        if (!badge) return;
+        badge.textContent = cart.count;
+        badge.classList.toggle('d-none', cart.count === 0);
+    }
+
+    function updateCartTable(cart) {
+        var rows = document.querySelectorAll('[data-cart-row]');
+        if (!rows.length) return;
+        if (cart.count === 0) { window.location.reload(); return; } // Pusty koszyk renderuje serwer
+        var itemsById = {};
+        cart.items.forEach(function (item) { itemsById[item.id] = item; });
+        // Nowa pozycja (np. z "Często zamawiane razem") - wiersz tabeli i rekomendacje renderuje serwer
+        if (cart.items.some(function (item) { return !document.querySelector('[data-cart-row="' + item.id + '"]'); })) { window.location.reload(); return; }
+        rows.forEach(function (row) {
+            var item = itemsById[row.getAttribute('data-cart-row')];
+            if (!item) { row.remove(); return; }
+            row.querySelector('[data-cart-row-total]').textContent = formatPrice(item.total);
+            var input = row.querySelector('input[name="quantity"]');
+            if (input) input.value = item.quantity;
+        });
+        var total = document.querySelector('[data-cart-total]');
+        if (total) total.textContent = formatPrice(cart.total);
+    }
+
+    document.addEventListener('submit', function (event) {
+        var form = event.target;
+        var apiUrl = form.getAttribute('data-cart-api');
+        if (!apiUrl || !window.fetch) return;
+        event.preventDefault();
+        var button = form.querySelector('button[type="submit"]');
+        if (button) button.disabled = true;
+        fetch(apiUrl, {method: 'POST', body: new FormData(form), credentials: 'same-origin', headers: {'Accept': 'application/json'}})
+            .then(function (response) {
+                return response.json().then(function (data) { return {status: response.status, data: data}; });
+            })
+            .then(function (result) {
+                if (result.status === 401 && result.data.login_url) { window.location = result.data.login_url; return; }
+                showMessage(result.data.message, result.data.category);
+                if (result.data.cart) { updateBadge(result.data.cart); updateCartTable(result.data.cart); }
+            })
+            .catch(function () { form.submit(); })
+            .finally(function () { if (button) button.disabled = false; });
+    });
+})();
@@ -0,0 +1,84 @@
+// static/js/suggest.js
+// Podpowiedzi w polu wyszukiwania: pole z atrybutem data-suggest-url odpytuje /api/suggest
+// (z opóźnieniem po ostatnim klawiszu) i pokazuje listę pod polem. Strzałki wybierają pozycję,
+// Enter przechodzi do niej, a bez wybranej pozycji formularz wysyła się jak dotąd do /search.
+(function () {
+    var DEBOUNCE_MS = 120;
+    var TYPE_ICONS = {restaurant: 'bi-shop', dish: 'bi-egg-fried', cuisine: 'bi-tags', city: 'bi-geo-alt'};
+
+    function setup(input) {
+        var menu = document.createElement('ul');
+        menu.className = 'dropdown-menu w-100 shadow-sm';
+        menu.setAttribute('role', 'listbox');
+        input.parentNode.appendChild(menu);
+        var timer = null, lastQuery = null, active = -1, cache = {};
+
+        function items() { return menu.querySelectorAll('a.dropdown-item'); }
+
+        function hide() { menu.classList.remove('show'); active = -1; }
+
+        function highlight(index) {
+            var links = items();
+            links.forEach(function (link, i) { link.classList.toggle('active', i === index); });
+            active = index;
+        }
+
+        function render(suggestions) {
+            menu.replaceChildren();
+            if (!suggestions.length) { hide(); return; }
+            suggestions.forEach(function (suggestion) {
+                var link = document.createElement('a');
+                link.className = 'dropdown-item d-flex align-items-center'; link.href = suggestion.url; link.setAttribute('role', 'option');
+                var icon = document.createElement('i');
+                icon.className = 'bi ' + (TYPE_ICONS[suggestion.type] || 'bi-search') + ' me-2 text-muted';
+                var label = document.createElement('span');
+                label.className = 'text-truncate'; label.textContent = suggestion.label;
+                link.append(icon, label);
+                if (suggestion.detail) {
+                    var detail = document.createElement('small');
+                    detail.className = 'text-muted ms-auto ps-2 text-truncate'; detail.textContent = suggestion.detail;
+                    link.appendChild(detail);
+                }
+                var item = document.createElement('li');
+                item.appendChild(link);
+                menu.appendChild(item);
+            });
+            active = -1;
+            menu.classList.add('show');
+        }
+
+        function fetchSuggestions(query) {
+            if (cache[query]) { render(cache[query]); return; }
+            fetch(input.getAttribute('data-suggest-url') + '?q=' + encodeURIComponent(query), {headers: {'Accept': 'application/json'}})
+                .then(function (response) { return response.ok ? response.json() : {suggestions: []}; })
+                .then(function (data) {
+                    if (data.ready) cache[query] = data.suggestions; // Pustej odpowiedzi z niezbudowanego indeksu nie zapamiętujemy
+                    if (input.value.trim() === query) render(data.suggestions);
+                })
+                .catch(hide);
+        }
+
+        input.addEventListener('input', function () {
+            var query = input.value.trim();
+            clearTimeout(timer);
+            if (!query) { lastQuery = null; hide(); return; }
+            if (query === lastQuery) return;
+            timer = setTimeout(function () { lastQuery = query; fetchSuggestions(query); }, DEBOUNCE_MS);
+        });
+
+        input.addEventListener('keydown', function (event) {
+            var links = items();
+            if (!menu.classList.contains('show') || !links.length) return;
+            if (event.key === 'ArrowDown') { event.preventDefault(); highlight((active + 1) % links.length); }
+            else if (event.key === 'ArrowUp') { event.preventDefault(); highlight(active <= 0 ? links.length - 1 : active - 1); }
+            else if (event.key === 'Enter' && active >= 0) { event.preventDefault(); window.location = links[active].href; }
+            else if (event.key === 'Escape') hide();
+        });
+
+        input.addEventListener('blur', function () { setTimeout(hide, 150); }); // Po kliknięciu w podpowiedź
+        input.addEventListener('focus', function () { if (menu.children.length && input.value.trim()) menu.classList.add('show'); });
+    }
+
+    if (!window.fetch) return;
+    document.querySelectorAll('input[data-suggest-url]').forEach(setup);
+})();
@@ -0,0 +1,168 @@
+"""Indeks podpowiedzi wyszukiwarki (type-ahead) w pamięci procesu.
+
+Posortowana tablica kluczy (`bisect`) nad nazwami restauracji, rodzajami kuchni, miastami
+i nazwami dań. Klucze są złożone bez polskich znaków i wielkości liter ("lodz" znajduje
+"Łódź"), a każde słowo nazwy jest osobnym kluczem ("pizza" znajduje "Mama Pizza").
+Zapytanie nie dotyka bazy; zmiany katalogu nanoszone są przyrostowo (kopiowanie przy zapisie).
+"""
+import bisect
+import re
+import threading
+import time
+
+import geo
+
+TYPE_RESTAURANT = 'restaurant'; TYPE_DISH = 'dish'; TYPE_CUISINE = 'cuisine'; TYPE_CITY = 'city'
+# Przy równym dopasowaniu restauracje przed kuchniami, miastami i daniami
+TYPE_RANK = {TYPE_RESTAURANT: 0, TYPE_CUISINE: 1, TYPE_CITY: 2, TYPE_DISH: 3}
+_WORD_RE = re.compile(r'\w+')
+
+def fold(text):
+    """Normalizuje tekst do porównań jak geokoder (bez diakrytyków), dodatkowo scala białe znaki."""
+    return ' '.join(geo.normalize_text(text or '').split())
+
+def _keys_for(label):
+    folded = fold(label)
+    if not folded: return set()
+    keys = {folded}
+    words = _WORD_RE.findall(folded)
+    for i in range(1, len(words)): keys.add(' '.join(words[i:])) # Sufiksy od granicy słowa
+    return keys
+
+class SuggestIndex:
+    """Posortowana lista (klucz, ranga typu, id wpisu) + słownik wpisów; odczyty bez blokad.
+
+    Lista i słownik publikowane są razem jako jedna krotka `_snapshot` - czytelnik bierze ją raz
+    i nigdy nie zobaczy kluczy z nowej wersji przy wpisach ze starej.
+    """
+
+    def __init__(self, ttl_seconds=300, retry_seconds=30, max_scan=200):
+        self.ttl_seconds = ttl_seconds; self.retry_seconds = retry_seconds; self.max_scan = max_scan
+        self._snapshot = ([], {})
+        self._restaurants = {}; self._dishes = {}; self._shared = {} # Kuchnie/miasta: id wpisu -> liczba restauracji
+        self._built_at = None; self._lock = threading.Lock(); self._rebuilding = False; self._last_attempt = None
+
+    def is_built(self): return self._built_at is not None
+
+    def is_stale(self): return self._built_at is None or time.monotonic() - self._built_at > self.ttl_seconds
+
+    def __len__(self): return len(self._snapshot[1])
+
+    # --- Budowa i zmiany przyrostowe ---
+    def rebuild(self, restaurants, dishes):
+        """`restaurants`: (id, nazwa, kuchnia, miasto); `dishes`: (id, nazwa, id restauracji)."""
+        state = _State({}, {}, {}, {}, [])
+        for restaurant_id, name, cuisine, city in restaurants: state.add_restaurant(restaurant_id, name, cuisine, city)
+        for dish_id, name, restaurant_id in dishes: state.add_dish(dish_id, name, restaurant_id)
+        state.keys.sort()
+        with self._lock: self._install(state); self._built_at = time.monotonic()
+
+    def try_begin_rebuild(self):
+        """Zwraca True dla jednego wątku naraz (i nie częściej niż co `retry_seconds`) - pozostali czytają starą wersję."""
+        with self._lock:
+            now = time.monotonic()
+            if self._rebuilding or (self._last_attempt is not None and now - self._last_attempt < self.retry_seconds): return False
+            self._rebuilding = True; self._last_attempt = now; return True
+
+    def end_rebuild(self):
+        with self._lock: self._rebuilding = False
+
+    def upsert_restaurant(self, restaurant_id, name, cuisine, city):
+        with self._lock:
+            state = self._copy(); state.remove_restaurant(restaurant_id, keep_dishes=True)
+            state.add_restaurant(restaurant_id, name, cuisine, city)
+            for dish_id, (dish_name, dish_restaurant_id) in list(state.dishes.items()):
+                if dish_restaurant_id == restaurant_id: state.add_dish(dish_id, dish_name, restaurant_id) # Odśwież nazwę restauracji w opisie
+            self._install(state)
+
+    def remove_restaurant(self, restaurant_id):
+        with self._lock: state = self._copy(); state.remove_restaurant(restaurant_id); self._install(state)
+
+    def upsert_dish(self, dish_id, name, restaurant_id):
+        with self._lock: state = self._copy(); state.add_dish(dish_id, name, restaurant_id); self._install(state)
+
+    def remove_dish(self, dish_id):
+        with self._lock: state = self._copy(); state.remove_dish(dish_id); self._install(state)
+
+    def _copy(self):
+        keys, entries = self._snapshot
+        return _State(dict(entries), dict(self._restaurants), dict(self._dishes), dict(self._shared), list(keys), sorted_keys=True)
+
+    def _install(self, state):
+        self._snapshot = (state.keys, state.entries)
+        self._restaurants = state.restaurants; self._dishes = state.dishes; self._shared = state.shared
+
+    # --- Zapytania ---
+    def search(self, query, limit=8):
+        """Zwraca do `limit` wpisów, których nazwa (lub słowo nazwy) zaczyna się od `query`."""
+        prefix = fold(query)
+        if not prefix or limit <= 0: return []
+        keys, entries = self._snapshot
+        start = bisect.bisect_left(keys, (prefix,))
+        matches = {}
+        for key, rank, entry_id in keys[start:start + self.max_scan]:
+            if not key.startswith(prefix): break
+            # Dopasowanie od początku nazwy ma pierwszeństwo przed dopasowaniem od środka
+            score = (0 if entries[entry_id]['folded'].startswith(prefix) else 1, rank, len(key))
+            if entry_id not in matches or score < matches[entry_id]: matches[entry_id] = score
+        ranked = sorted(matches, key=lambda entry_id: (matches[entry_id], entries[entry_id]['folded']))
+        return [entries[entry_id] for entry_id in ranked[:limit]]
+
+class _State:
+    """Robocza kopia indeksu modyfikowana pod blokadą i podmieniana atomowo."""
+
+    def __init__(self, entries, restaurants, dishes, shared, keys, sorted_keys=False):
+        self.entries = entries; self.restaurants = restaurants; self.dishes = dishes; self.shared = shared
+        self.keys = keys; self.sorted_keys = sorted_keys
+
+    def _add_entry(self, entry_id, entry_type, label, ref=None, detail=None):
+        self._remove_entry(entry_id)
+        self.entries[entry_id] = {'type': entry_type, 'label': label, 'ref': ref, 'detail': detail, 'folded': fold(label)}
+        for key in _keys_for(label):
+            item = (key, TYPE_RANK[entry_type], entry_id)
+            if self.sorted_keys: bisect.insort(self.keys, item)
+            else: self.keys.append(item)
+
+    def _remove_entry(self, entry_id):
+        entry = self.entries.pop(entry_id, None)
+        if entry is None: return
+        for key in _keys_for(entry['label']):
+            item = (key, TYPE_RANK[entry['type']], entry_id)
+            if self.sorted_keys:
+                position = bisect.bisect_left(self.keys, item)
+                if position < len(self.keys) and self.keys[position] == item: del self.keys[position]
+            else: self.keys.remove(item)
+
+    def _add_shared(self, entry_type, label):
+        if not label or not fold(label): return
+        entry_id = (entry_type, fold(label))
+        if entry_id not in self.shared: self._add_entry(entry_id, entry_type, label)
+        self.shared[entry_id] = self.shared.get(entry_id, 0) + 1
+
+    def _release_shared(self, entry_type, label):
+        if not label or not fold(label): return
+        entry_id = (entry_type, fold(label)); remaining = self.shared.get(entry_id, 0) - 1
+        if remaining > 0: self.shared[entry_id] = remaining
+        else: self.shared.pop(entry_id, None); self._remove_entry(entry_id)
+
+    def add_restaurant(self, restaurant_id, name, cuisine, city):
+        self.restaurants[restaurant_id] = (name, cuisine, city)
+        self._add_entry((TYPE_RESTAURANT, restaurant_id), TYPE_RESTAURANT, name, ref=restaurant_id, detail=' · '.join(filter(None, [cuisine, city])) or None)
+        self._add_shared(TYPE_CUISINE, cuisine); self._add_shared(TYPE_CITY, city)
+
+    def remove_restaurant(self, restaurant_id, keep_dishes=False):
+        old = self.restaurants.pop(restaurant_id, None)
+        if old is None: return
+        _, cuisine, city = old
+        self._remove_entry((TYPE_RESTAURANT, restaurant_id))
+        self._release_shared(TYPE_CUISINE, cuisine); self._release_shared(TYPE_CITY, city)
+        if not keep_dishes:
+            for dish_id in [d for d, (_, r) in self.dishes.items() if r == restaurant_id]: self.remove_dish(dish_id)
+
+    def add_dish(self, dish_id, name, restaurant_id):
+        self.dishes[dish_id] = (name, restaurant_id)
+        restaurant = self.restaurants.get(restaurant_id)
+        self._add_entry((TYPE_DISH, dish_id), TYPE_DISH, name, ref=restaurant_id, detail=restaurant[0] if restaurant else None)
+
+    def remove_dish(self, dish_id):
+        self.dishes.pop(dish_id, None); self._remove_entry((TYPE_DISH, dish_id))
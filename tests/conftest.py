@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# Moduły aplikacji leżą płasko w katalogu głównym repozytorium
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope='session')
+def papugo():
+    """Moduł aplikacji bez bazy: puste DB_* (get_db_connection() zwraca None) i bez budowy indeksów w tle."""
+    for key in ('DB_HOST', 'DB_NAME', 'DB_USER', 'DB_PASSWORD'): os.environ[key] = '' # Puste wartości - load_dotenv() ich nie nadpisze
+    os.environ.update(SUGGEST_WARMUP='false', GEO_WARMUP='false')
+    for key, value in {'FLASK_SECRET_KEY': 'test', 'S3_BUCKET_NAME': 'test-bucket', 'AWS_REGION': 'eu-central-1'}.items(): os.environ.setdefault(key, value)
+    import app
+    app.app.config.update(TESTING=True)
+    return app
@@ -0,0 +1,129 @@
+"""Bezpiecznik: przejścia closed -> open -> half_open, próba zdrowia i liczenie błędów zapytań RDS po udanym połączeniu."""
+import threading
+import time
+
+import psycopg2
+import pytest
+
+import breaker
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Sterowany zegar `time.monotonic` - upływ reset_timeout bez czekania."""
+    now = [1000.0]
+    monkeypatch.setattr(breaker.time, 'monotonic', lambda: now[0])
+    return now
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, "warunek nie spełniony w czasie"
+        time.sleep(0.005)
+
+def fail(): raise OSError('down')
+
+def test_opens_after_threshold_consecutive_failures():
+    cb = breaker.CircuitBreaker('t', failure_threshold=3)
+    cb.record_failure(OSError('a')); cb.record_failure(OSError('b'))
+    assert cb.state == breaker.STATE_CLOSED and cb.allow()
+    cb.record_success() # Sukces przerywa serię
+    for _ in range(2): cb.record_failure(OSError('c'))
+    assert cb.state == breaker.STATE_CLOSED
+    cb.record_failure(OSError('d'))
+    snapshot = cb.snapshot()
+    assert snapshot['state'] == breaker.STATE_OPEN and snapshot['opened'] == 1 and snapshot['last_error'] == 'OSError: d'
+
+def test_open_circuit_fails_fast_without_calling_dependency(clock):
+    cb = breaker.CircuitBreaker('t', failure_threshold=1, reset_timeout=30)
+    with pytest.raises(OSError): cb.call(fail)
+    calls = []
+    with pytest.raises(breaker.CircuitOpenError): cb.call(calls.append, 1)
+    assert calls == [] and cb.snapshot()['rejected'] == 1
+    clock[0] += 29
+    assert not cb.allow()
+
+def test_errors_outside_failure_exceptions_do_not_count():
+    cb = breaker.CircuitBreaker('t', failure_threshold=1, failure_exceptions=(OSError,))
+    with pytest.raises(ValueError): cb.call(int, 'x') # Zależność odpowiedziała błędem logicznym
+    assert cb.state == breaker.STATE_CLOSED and cb.snapshot()['failures'] == 0
+
+def test_half_open_without_probe_lets_one_trial_call_through(clock):
+    cb = breaker.CircuitBreaker('t', failure_threshold=1, reset_timeout=30)
+    cb.record_failure(OSError('down'))
+    clock[0] += 30
+    assert cb.allow() # Jedno wywołanie testowe
+    assert cb.state == breaker.STATE_HALF_OPEN and not cb.allow()
+    cb.record_failure(OSError('still down')) # Nieudana próba - obwód znowu otwarty na pełny czas
+    assert cb.state == breaker.STATE_OPEN and not cb.allow()
+    clock[0] += 30
+    assert cb.call(lambda: 'ok') == 'ok'
+    assert cb.state == breaker.STATE_CLOSED and cb.allow() and cb.allow()
+
+def test_probe_success_closes_circuit_while_requests_keep_failing_fast(clock):
+    release = threading.Event(); probed = []
+    def probe(): probed.append(1); release.wait(2)
+    cb = breaker.CircuitBreaker('t', failure_threshold=1, reset_timeout=30, probe=probe)
+    cb.record_failure(OSError('down'))
+    clock[0] += 30
+    assert not cb.allow() and not cb.allow() # Żądania nie czekają na próbę
+    wait_for(lambda: probed)
+    assert len(probed) == 1 and cb.state == breaker.STATE_HALF_OPEN # Jedna próba naraz
+    release.set()
+    wait_for(lambda: cb.state == breaker.STATE_CLOSED)
+    assert cb.snapshot()['probes'] == 1 and cb.allow()
+
+def test_probe_failure_reopens_circuit(clock):
+    def probe(): raise OSError('probe failed')
+    cb = breaker.CircuitBreaker('t', failure_threshold=1, reset_timeout=30, probe=probe)
+    cb.record_failure(OSError('down'))
+    clock[0] += 30
+    assert not cb.allow()
+    wait_for(lambda: cb.snapshot()['probes'] == 1)
+    wait_for(lambda: not cb._probing)
+    snapshot = cb.snapshot()
+    assert snapshot['state'] == breaker.STATE_OPEN and snapshot['opened'] == 2 and snapshot['last_error'] == 'OSError: probe failed'
+
+# --- RDS: połączenie się udaje, zapytania kończy statement_timeout ---
+class FakeConnection:
+    closed = False
+    def close(self): self.closed = True
+
+@pytest.fixture
+def db_breaker(papugo, monkeypatch):
+    cb = breaker.CircuitBreaker('rds', failure_threshold=3, reset_timeout=30, failure_exceptions=(psycopg2.OperationalError,))
+    monkeypatch.setattr(papugo, 'DB_BREAKER', cb)
+    return cb
+
+def request_with_query(papugo, query_error=None):
+    with papugo.app.test_request_context('/'):
+        papugo.connect_through_breaker(FakeConnection)
+        if query_error is not None: papugo.note_db_failure(query_error)
+
+def test_query_timeouts_open_breaker_although_connects_succeed(papugo, db_breaker):
+    timeout = psycopg2.extensions.QueryCanceledError('canceling statement due to statement timeout')
+    for _ in range(2): request_with_query(papugo, timeout)
+    assert db_breaker.snapshot()['consecutive_failures'] == 2 # Udane połączenia nie zerują serii
+    request_with_query(papugo, timeout)
+    assert db_breaker.state == breaker.STATE_OPEN
+    connects = []
+    with papugo.app.test_request_context('/'), pytest.raises(breaker.CircuitOpenError): papugo.connect_through_breaker(lambda: connects.append(1))
+    assert connects == []
+
+def test_request_without_query_errors_resets_failure_streak(papugo, db_breaker):
+    timeout = psycopg2.extensions.QueryCanceledError('canceling statement due to statement timeout')
+    for _ in range(2): request_with_query(papugo, timeout)
+    request_with_query(papugo)
+    assert db_breaker.snapshot()['consecutive_failures'] == 0
+    request_with_query(papugo, psycopg2.errors.UndefinedTable('no such table')) # Błąd SQL to nie awaria bazy
+    assert db_breaker.snapshot()['consecutive_failures'] == 0
+
+def test_failed_connect_counts_once(papugo, db_breaker):
+    def refuse(): raise psycopg2.OperationalError('could not connect')
+    with papugo.app.test_request_context('/'), pytest.raises(psycopg2.OperationalError): papugo.connect_through_breaker(refuse)
+    assert db_breaker.snapshot()['consecutive_failures'] == 1
+
+def test_unhandled_query_error_already_reported_counts_once(papugo, db_breaker):
+    timeout = psycopg2.extensions.QueryCanceledError('canceling statement due to statement timeout')
+    with pytest.raises(psycopg2.OperationalError), papugo.app.test_request_context('/'):
+        papugo.connect_through_breaker(FakeConnection); papugo.note_db_failure(timeout); raise timeout
+    assert db_breaker.snapshot()['consecutive_failures'] == 1
@@ -0,0 +1,79 @@
+"""API koszyka (/api/cart/*): kody odpowiedzi i podsumowanie koszyka; koszyk żyje w sesji, baza nie jest potrzebna."""
+import pytest
+
+CART = {'10': {'name': 'Pizza Margherita', 'price': 25.5, 'quantity': 2}, '11': {'name': 'Pierogi ruskie', 'price': 18.0, 'quantity': 1}}
+
+@pytest.fixture
+def client(papugo):
+    return papugo.app.test_client()
+
+@pytest.fixture
+def logged_in(client):
+    with client.session_transaction() as session:
+        session['user_id'] = 1; session['cart'] = {dish_id: dict(item) for dish_id, item in CART.items()}
+    return client
+
+def cart_in_session(client):
+    with client.session_transaction() as session: return session.get('cart')
+
+@pytest.mark.parametrize('method, url', [('get', '/api/cart'), ('post', '/api/cart/add/10'), ('post', '/api/cart/update/10'), ('post', '/api/cart/remove/10')])
+def test_requires_login(client, method, url):
+    response = getattr(client, method)(url, json={'quantity': 1})
+    assert response.status_code == 401
+    assert response.json['ok'] is False and response.json['login_url'] == '/login'
+
+def test_get_returns_summary(logged_in):
+    response = logged_in.get('/api/cart')
+    assert response.status_code == 200
+    cart = response.json['cart']
+    assert cart['count'] == 2 and cart['total'] == 69.0
+    assert {'id': 10, 'name': 'Pizza Margherita', 'price': 25.5, 'quantity': 2, 'total': 51.0} in cart['items']
+
+def test_update_sets_quantity(logged_in):
+    response = logged_in.post('/api/cart/update/10', json={'quantity': 4})
+    assert response.status_code == 200
+    assert response.json['ok'] is True and response.json['category'] == 'info'
+    assert response.json['cart']['total'] == 120.0
+    assert cart_in_session(logged_in)['10']['quantity'] == 4
+
+def test_update_accepts_form_field(logged_in):
+    response = logged_in.post('/api/cart/update/11', data={'quantity': '3'})
+    assert response.status_code == 200 and cart_in_session(logged_in)['11']['quantity'] == 3
+
+def test_update_to_zero_removes_item(logged_in):
+    response = logged_in.post('/api/cart/update/10', json={'quantity': 0})
+    assert response.status_code == 200 and response.json['cart']['count'] == 1
+    assert '10' not in cart_in_session(logged_in)
+
+@pytest.mark.parametrize('payload', [{'quantity': 'dużo'}, {}, {'quantity': None}])
+def test_update_rejects_invalid_quantity(logged_in, payload):
+    response = logged_in.post('/api/cart/update/10', json=payload)
+    assert response.status_code == 400
+    assert response.json['ok'] is False and response.json['category'] == 'warning'
+    assert response.json['cart']['total'] == 69.0 # Koszyk bez zmian
+
+def test_update_of_item_not_in_cart_is_404(logged_in):
+    response = logged_in.post('/api/cart/update/99', json={'quantity': 1})
+    assert response.status_code == 404 and response.json['category'] == 'warning' and response.json['cart']['count'] == 2
+
+def test_remove(logged_in):
+    response = logged_in.post('/api/cart/remove/11')
+    assert response.status_code == 200 and response.json['category'] == 'info'
+    assert response.json['cart']['count'] == 1 and response.json['cart']['total'] == 51.0
+    response = logged_in.post('/api/cart/remove/11')
+    assert response.status_code == 404 and response.json['ok'] is False
+
+@pytest.mark.parametrize('quantity', [0, -2, 'x'])
+def test_add_rejects_invalid_quantity(logged_in, quantity):
+    response = logged_in.post('/api/cart/add/10', json={'quantity': quantity})
+    assert response.status_code == 400 and response.json['category'] == 'warning'
+
+def test_add_without_database_is_503_in_json_not_flash(logged_in):
+    response = logged_in.post('/api/cart/add/12', json={'quantity': 1})
+    assert response.status_code == 503 and response.json['category'] == 'danger' and response.json['cart']['count'] == 2
+    with logged_in.session_transaction() as session: assert not session.get('_flashes')
+
+def test_api_keeps_pending_flashes_for_next_page(logged_in):
+    with logged_in.session_transaction() as session: session['_flashes'] = [('success', 'Zalogowano.')]
+    assert logged_in.post('/api/cart/update/10', json={'quantity': 3}).status_code == 200
+    with logged_in.session_transaction() as session: assert session['_flashes'] == [('success', 'Zalogowano.')]
@@ -0,0 +1,122 @@
+"""Kompresja odpowiedzi: wybór kodowania, próg rozmiaru, strumienie gzip/br i odpowiedzi pomijane."""
+import io
+import zlib
+
+import pytest
+from flask import Flask, Response, send_file
+
+import compression
+from compression import ResponseCompressor, _accepted_encodings
+
+needs_brotli = pytest.mark.skipif(compression.brotli is None, reason="brak pakietu Brotli")
+
+PAGE = ''.join(f"<li>Restauracja {i} - Pizza Margherita, Pierogi ruskie</li>\n" for i in range(400))
+CHUNK_COUNT = 60
+
+@pytest.fixture
+def progress():
+    return []
+
+@pytest.fixture
+def client(progress):
+    app = Flask(__name__)
+    ResponseCompressor(app, min_size=1024, stream_flush_bytes=2048)
+
+    @app.route('/big')
+    def big(): return PAGE
+
+    @app.route('/small')
+    def small(): return '<p>ok</p>'
+
+    @app.route('/stream')
+    def stream():
+        def generate():
+            for i in range(CHUNK_COUNT): progress.append(i); yield f"<tr><td>{i}</td><td>{'x' * 500}</td></tr>\n"
+        return Response(generate(), mimetype='text/html')
+
+    @app.route('/file')
+    def file(): return send_file(io.BytesIO(PAGE.encode()), mimetype='text/html')
+
+    @app.route('/not-modified')
+    def not_modified(): return Response(status=304, mimetype='text/html')
+
+    return app.test_client()
+
+def gunzip(data): return zlib.decompressobj(31).decompress(data)
+
+def test_accepted_encodings_skip_q_zero_and_bad_q():
+    assert _accepted_encodings('gzip;q=0, br;q=0.5, Deflate') == {'br', 'deflate'}
+    assert _accepted_encodings('gzip; q=0.0, br;q=abc') == set()
+    assert _accepted_encodings(None) == set()
+
+def test_choose_encoding_prefers_brotli_only_when_accepted():
+    compressor = ResponseCompressor()
+    assert compressor.choose_encoding('gzip, br;q=0') == 'gzip'
+    assert compressor.choose_encoding('identity') is None
+    if compression.brotli is not None: assert compressor.choose_encoding('gzip, br') == 'br'
+
+def test_body_below_min_size_is_left_uncompressed(client):
+    response = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers and response.data == b'<p>ok</p>'
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+def test_buffered_body_is_gzipped(client):
+    response = client.get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert int(response.headers['Content-Length']) == len(response.data) < len(PAGE)
+    assert gunzip(response.data).decode() == PAGE
+
+def test_no_accept_encoding_means_identity(client):
+    response = client.get('/big')
+    assert 'Content-Encoding' not in response.headers and response.get_data(as_text=True) == PAGE
+
+@needs_brotli
+def test_buffered_body_is_brotli_compressed(client):
+    response = client.get('/big', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert compression.brotli.decompress(response.data).decode() == PAGE
+
+def expected_stream(): return ''.join(f"<tr><td>{i}</td><td>{'x' * 500}</td></tr>\n" for i in range(CHUNK_COUNT))
+
+def decode_until_output(chunks, decode):
+    """Czyta skompresowane kawałki do pierwszego niepustego wyniku (pierwszy bywa samym nagłówkiem gzip)."""
+    for chunk in chunks:
+        out = decode(chunk)
+        if out: return out
+    return b''
+
+def test_streamed_gzip_flushes_before_the_end_and_decodes_completely(client, progress):
+    response = client.get('/stream', headers={'Accept-Encoding': 'gzip'}, buffered=False)
+    assert response.headers['Content-Encoding'] == 'gzip' and 'Content-Length' not in response.headers
+    chunks = iter(response.response); decoder = zlib.decompressobj(31)
+    first = decode_until_output(chunks, decoder.decompress)
+    # Początek strony da się zdekodować, zanim generator doszedł do końca
+    assert first.startswith(b'<tr><td>0</td>') and len(progress) < CHUNK_COUNT
+    rest = b''.join(decoder.decompress(chunk) for chunk in chunks) + decoder.flush()
+    response.close()
+    assert decoder.eof and (first + rest).decode() == expected_stream()
+
+@needs_brotli
+def test_streamed_brotli_decodes_completely(client, progress):
+    response = client.get('/stream', headers={'Accept-Encoding': 'br'}, buffered=False)
+    assert response.headers['Content-Encoding'] == 'br'
+    chunks = iter(response.response); decoder = compression.brotli.Decompressor()
+    first = decode_until_output(chunks, decoder.process)
+    assert first.startswith(b'<tr><td>0</td>') and len(progress) < CHUNK_COUNT
+    rest = b''.join(decoder.process(chunk) for chunk in chunks)
+    response.close()
+    assert decoder.is_finished() and (first + rest).decode() == expected_stream()
+
+def test_direct_passthrough_file_is_left_alone(client):
+    response = client.get('/file', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers and response.get_data(as_text=True) == PAGE
+
+def test_not_modified_is_left_alone(client):
+    response = client.get('/not-modified', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 304 and 'Content-Encoding' not in response.headers
+
+def test_app_responses_are_compressed_without_database(papugo):
+    # Strona główna bez bazy (pusty cache zapasowy) - i tak przechodzi przez kompresję aplikacji
+    response = papugo.app.test_client().get('/', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200 and response.headers['Content-Encoding'] == 'gzip'
+    assert '</html>' in gunzip(response.data).decode()
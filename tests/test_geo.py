@@ -0,0 +1,111 @@
+"""Geokodowanie i indeks siatkowy "najbliżej mnie": poprawność względem przeszukania pełnego i budżet opóźnienia."""
+import random
+import time
+
+import pytest
+
+import geo
+
+# Prostokąt obejmujący Polskę
+LAT_RANGE = (49.0, 54.8); LON_RANGE = (14.1, 24.1)
+
+def random_points(rng, count, start_id=0):
+    return [(start_id + i, rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for i in range(count)]
+
+def brute_force(points, lat, lon, limit, max_km=None):
+    pairs = [(item_id, geo.haversine_km(lat, lon, p_lat, p_lon)) for item_id, p_lat, p_lon in points]
+    pairs = [pair for pair in pairs if max_km is None or pair[1] <= max_km]
+    return sorted(pairs, key=lambda pair: pair[1])[:limit]
+
+def assert_same_neighbours(found, expected):
+    # Porównanie odległości, nie kolejności id - przy remisach kolejność jest dowolna
+    assert [round(d, 9) for _, d in found] == [round(d, 9) for _, d in expected]
+
+def test_normalize_text_and_geocode():
+    assert geo.normalize_text(' Łódź ') == 'lodz'
+    assert geo.geocode('00-950') == geo.geocode(city='Warszawa')
+    assert geo.geocode(city='łódź') is not None
+    assert geo.geocode('xx', 'Atlantyda') is None
+
+def test_haversine_known_distance():
+    warsaw, krakow = (52.2297, 21.0122), (50.0647, 19.9450)
+    assert geo.haversine_km(*warsaw, *krakow) == pytest.approx(252, abs=2)
+
+@pytest.mark.parametrize('limit,max_km', [(1, None), (10, None), (30, 50), (200, 25)])
+def test_nearest_matches_brute_force(limit, max_km):
+    rng = random.Random(limit)
+    points = random_points(rng, 3000)
+    index = geo.GeoGridIndex(); index.rebuild(points)
+    for _ in range(50):
+        lat, lon = rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+        assert_same_neighbours(index.nearest(lat, lon, limit=limit, max_km=max_km), brute_force(points, lat, lon, limit, max_km))
+
+def test_nearest_from_outside_occupied_area_and_sparse_grid():
+    points = [(1, 52.23, 21.01), (2, 50.06, 19.94), (3, 54.35, 18.65)]
+    index = geo.GeoGridIndex(); index.rebuild(points)
+    # Punkt startowy daleko poza prostokątem zajętych komórek (Berlin)
+    assert [item_id for item_id, _ in index.nearest(52.52, 13.40, limit=3)] == [3, 1, 2]
+    assert index.nearest(52.52, 13.40, limit=3, max_km=100) == []
+
+def test_ring_search_stops_early_on_dense_grid(monkeypatch):
+    rng = random.Random(3)
+    index = geo.GeoGridIndex(); index.rebuild(random_points(rng, 20000))
+    calls = []
+    real_haversine = geo.haversine_km
+    monkeypatch.setattr(geo, 'haversine_km', lambda *args: calls.append(1) or real_haversine(*args))
+    index.nearest(52.0, 19.0, limit=10)
+    # Przy ~3,5 punktu na komórkę 10 sąsiadów leży w kilku pierścieniach - nie liczymy odległości do całego indeksu
+    assert 0 < len(calls) < 500
+
+def test_upsert_and_remove_update_results():
+    index = geo.GeoGridIndex(); index.rebuild([(1, 52.23, 21.01), (2, 50.06, 19.94), (3, None, None)])
+    assert len(index) == 2
+    index.upsert(3, 52.24, 21.02)
+    assert index.nearest(52.24, 21.02, limit=1)[0][0] == 3
+    index.upsert(3, 54.35, 18.65) # Przeniesienie do innej komórki
+    assert [item_id for item_id, _ in index.nearest(52.24, 21.02, limit=2)] == [1, 2]
+    index.upsert(1, None, None) # Utrata współrzędnych = usunięcie z indeksu
+    index.remove(2)
+    assert [item_id for item_id, _ in index.nearest(52.24, 21.02, limit=5)] == [3]
+    index.remove(3)
+    assert index.nearest(52.24, 21.02) == [] and len(index) == 0
+
+def test_within_radius():
+    rng = random.Random(5)
+    points = random_points(rng, 2000)
+    index = geo.GeoGridIndex(); index.rebuild(points)
+    expected = brute_force(points, 51.1, 17.0, len(points), 30)
+    assert_same_neighbours(index.within_radius(51.1, 17.0, 30), expected)
+
+def test_nearest_reads_one_version_while_writer_installs_next(monkeypatch):
+    """Zapis w trakcie zapytania (np. usunięcie ostatniego punktu: brak prostokąta) nie miesza komórek i granic z dwóch wersji."""
+    index = geo.GeoGridIndex(); index.rebuild([(1, 52.23, 21.01), (2, 50.06, 19.94)])
+    real_haversine = geo.haversine_km; writer_ran = []
+    def haversine_then_write(*args):
+        if not writer_ran: writer_ran.append(True); index.remove(1); index.remove(2)
+        return real_haversine(*args)
+    monkeypatch.setattr(geo, 'haversine_km', haversine_then_write)
+    assert [item_id for item_id, _ in index.nearest(52.24, 21.02, limit=2)] == [1, 2] # Cała stara wersja
+    assert writer_ran and index.nearest(52.24, 21.02) == []
+
+def test_rebuild_is_throttled_and_first_build_can_be_awaited():
+    index = geo.GeoGridIndex(retry_seconds=60)
+    assert not index.is_built() and not index.wait_built(0.01)
+    assert index.try_begin_rebuild()
+    assert not index.try_begin_rebuild() # Przebudowa w toku
+    index.rebuild([(1, 52.23, 21.01)]); index.end_rebuild()
+    assert not index.try_begin_rebuild() # Za wcześnie na ponowienie
+    assert index.wait_built(0.01) and not index.is_stale()
+
+# --- Budżet opóźnienia ---
+def test_nearest_p99_under_5ms_on_large_catalog():
+    rng = random.Random(13)
+    index = geo.GeoGridIndex(); index.rebuild(random_points(rng, 100000))
+    origins = [(rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for _ in range(1000)]
+    for lat, lon in origins[:20]: index.nearest(lat, lon, limit=30, max_km=50) # Rozgrzewka
+    timings = []
+    for lat, lon in origins:
+        started = time.perf_counter(); index.nearest(lat, lon, limit=30, max_km=50); timings.append(time.perf_counter() - started)
+    timings.sort()
+    p99 = timings[int(len(timings) * 0.99)]
+    assert p99 < 0.005, f"p99 {p99 * 1000:.2f} ms"
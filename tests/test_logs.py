@@ -0,0 +1,80 @@
+"""Potok logów: odrzucanie przy pełnej kolejce, próbkowanie po prefiksie loggera i identyfikator żądania."""
+import io
+import json
+import logging
+import time
+
+import pytest
+
+import logs
+
+def make_record(name='papugo.test', level=logging.INFO, msg='komunikat %s', args=(1,)):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+@pytest.fixture
+def isolated_logger(request):
+    """Logger bez propagacji do root (tam siedzi potok aplikacji, jeśli któryś test ją zaimportował)."""
+    logger = logging.getLogger(f"tests.logs.{request.node.name}"); logger.propagate = False; logger.setLevel(logging.DEBUG)
+    yield logger
+    for handler in list(logger.handlers): logger.removeHandler(handler)
+
+def test_full_queue_drops_records_without_blocking(isolated_logger):
+    pipeline = logs.LogPipeline(queue_size=2) # Bez uruchomionego wątku zapisującego - nikt nie opróżnia kolejki
+    isolated_logger.addHandler(pipeline.handler)
+    started = time.perf_counter()
+    for i in range(50): isolated_logger.info("rekord %d", i)
+    assert time.perf_counter() - started < 0.5
+    metrics = pipeline.metrics()
+    assert metrics['enqueued'] == 2 and metrics['dropped'] == 48 and metrics['queue_size'] == 2
+    # W kolejce leżą pierwsze rekordy, już z wyliczoną treścią (formatowanie w innym wątku nie dotyka argumentów)
+    first = pipeline.queue.get_nowait()
+    assert first.getMessage() == 'rekord 0' and first.args is None
+
+def test_sampling_uses_longest_matching_prefix(monkeypatch):
+    stats = logs.PipelineStats()
+    context_filter = logs.ContextFilter({'papugo.s3': 0.0, 'papugo.s3.upload': 1.0, 'papugo.orders': 0.5}, stats)
+    assert context_filter.filter(make_record('papugo.s3.upload'))
+    assert context_filter.filter(make_record('papugo.s3.upload.multipart'))
+    assert not context_filter.filter(make_record('papugo.s3'))
+    assert not context_filter.filter(make_record('papugo.s3.delete'))
+    assert context_filter.filter(make_record('papugo.s3x')) # Prefiks kończy się na granicy kropki
+    monkeypatch.setattr(logs.random, 'random', lambda: 0.7)
+    assert not context_filter.filter(make_record('papugo.orders'))
+    monkeypatch.setattr(logs.random, 'random', lambda: 0.2)
+    assert context_filter.filter(make_record('papugo.orders'))
+    assert stats.snapshot()['sampled_out'] == 3
+
+@pytest.mark.parametrize('level', [logging.WARNING, logging.ERROR, logging.CRITICAL])
+def test_sampling_never_drops_warnings_and_above(level):
+    context_filter = logs.ContextFilter({'papugo': 0.0})
+    assert context_filter.filter(make_record('papugo.s3', level))
+    assert not context_filter.filter(make_record('papugo.s3', logging.INFO))
+
+def test_request_id_is_attached_in_calling_context():
+    context_filter = logs.ContextFilter()
+    token = logs.set_request_id('req-123')
+    try:
+        record = make_record(); assert context_filter.filter(record) and record.request_id == 'req-123'
+    finally: logs.reset_request_id(token)
+    record = make_record(); context_filter.filter(record)
+    assert record.request_id is None and logs.get_request_id() is None
+
+def test_request_id_reaches_json_output(isolated_logger):
+    output = io.StringIO()
+    pipeline = logs.LogPipeline(stream=output).install(isolated_logger)
+    token = logs.set_request_id('abc.42')
+    try: isolated_logger.info("zamówienie %s", 7, extra={'order_id': 7})
+    finally: logs.reset_request_id(token)
+    isolated_logger.info("poza żądaniem")
+    pipeline.stop() # Opróżnia kolejkę
+    first, second = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert first['request_id'] == 'abc.42' and first['message'] == 'zamówienie 7' and first['order_id'] == 7
+    assert 'request_id' not in second and pipeline.metrics()['written'] == 2
+
+def test_new_request_id_accepts_only_safe_header_values():
+    assert logs.new_request_id('abc-123_X.y') == 'abc-123_X.y'
+    for unsafe in ('a b', 'x' * 65, 'id\nforged', ''):
+        assert logs.new_request_id(unsafe) != unsafe and len(logs.new_request_id(unsafe)) == 32
+
+def test_parse_sample_rates_clamps_and_skips_bad_entries():
+    assert logs.parse_sample_rates('papugo.s3=0.1, papugo.orders=2,bad,x=abc') == {'papugo.s3': 0.1, 'papugo.orders': 1.0}
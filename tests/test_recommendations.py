@@ -0,0 +1,39 @@
+"""Rekomendacje dań: liczniki z X^T X i wybór K najlepszych sąsiadów (bez bazy)."""
+import numpy as np
+
+import recommendations
+
+def counts_of(matrix): return matrix.toarray().tolist()
+
+def test_cooccurrence_counts_dish_once_per_order():
+    # Zamówienie 7: danie 1 dwa razy (dwie pozycje) i danie 2; zamówienie 9: dania 1 i 3
+    order_ids = np.array([7, 7, 7, 9, 9]); dish_ids = np.array([1, 1, 2, 1, 3])
+    assert counts_of(recommendations.cooccurrence(order_ids, dish_ids, 4)) == [
+        [0, 0, 0, 0],
+        [0, 2, 1, 1],
+        [0, 1, 1, 0],
+        [0, 1, 0, 1],
+    ]
+
+def test_cooccurrence_of_empty_batch_is_empty_matrix():
+    matrix = recommendations.cooccurrence(np.array([], dtype=np.int64), np.array([], dtype=np.int64), 3)
+    assert matrix.shape == (3, 3) and matrix.nnz == 0
+
+def test_top_k_cuts_ranks_per_dish():
+    dish_ids = np.array([1, 1, 1, 2, 2]); other_ids = np.array([2, 3, 4, 1, 3])
+    pair_counts = np.array([4, 2, 1, 4, 3]); dish_counts = np.array([4, 4, 4, 5, 5]); other_counts = np.array([5, 4, 4, 4, 4])
+    result = recommendations.top_k_scores(dish_ids, other_ids, pair_counts, dish_counts, other_counts, top_k=2)
+    assert [(dish, rank, other) for dish, rank, other, _ in result] == [(1, 0, 2), (1, 1, 3), (2, 0, 1), (2, 1, 3)]
+    dish, rank, other, score = result[0]
+    assert score == 4 / np.sqrt(4 * 5) # Podobieństwo kosinusowe
+
+def test_top_k_breaks_ties_by_lower_dish_id_regardless_of_input_order():
+    # Trzy sąsiedzi dania 5 z identycznym wynikiem, podani w różnej kolejności
+    other_ids = np.array([30, 10, 20])
+    for permutation in ([0, 1, 2], [2, 0, 1], [1, 2, 0]):
+        result = recommendations.top_k_scores(np.array([5, 5, 5]), other_ids[permutation], np.array([2, 2, 2]), np.array([4, 4, 4]), np.array([4, 4, 4]), top_k=2)
+        assert [(rank, other) for _, rank, other, _ in result] == [(0, 10), (1, 20)]
+
+def test_top_k_of_no_pairs_is_empty():
+    empty = np.array([], dtype=np.int64)
+    assert recommendations.top_k_scores(empty, empty, empty, empty, empty, top_k=3) == []
@@ -0,0 +1,150 @@
+"""Indeks podpowiedzi: ranking prefiksów, zmiany przyrostowe i budżet opóźnienia /api/suggest."""
+import bisect
+import random
+import time
+import types
+
+import pytest
+
+import suggest
+
+RESTAURANTS = [
+    (1, 'Pizzeria Roma', 'Włoska', 'Łódź'),
+    (2, 'Mama Pizza', 'Włoska', 'Warszawa'),
+    (3, 'Sushi Bar', 'Japońska', 'Łódź'),
+    (4, 'Pierogarnia', 'Polska', 'Kraków'),
+]
+DISHES = [
+    (10, 'Pizza Margherita', 1),
+    (11, 'Pierogi ruskie', 4),
+    (12, 'Pieczeń', 4),
+    (13, 'Maki łosoś', 3),
+]
+
+def build(restaurants=RESTAURANTS, dishes=DISHES):
+    index = suggest.SuggestIndex()
+    index.rebuild(restaurants, dishes)
+    return index
+
+def labels(results): return [(entry['type'], entry['label']) for entry in results]
+
+def state_of(index):
+    """Porównywalna zawartość indeksu (klucze i wpisy) - do zestawienia zmian przyrostowych z pełną przebudową."""
+    keys, entries = index._snapshot
+    return keys, {entry_id: (e['type'], e['label'], e['ref'], e['detail']) for entry_id, e in entries.items()}
+
+def test_fold_removes_diacritics_case_and_extra_spaces():
+    assert suggest.fold('  Łódź   Bałuty ') == 'lodz baluty'
+    assert suggest.fold(None) == ''
+
+def test_search_matches_folded_prefix_and_later_words():
+    index = build()
+    assert ('city', 'Łódź') in labels(index.search('lodz'))
+    # "pizza" pasuje do początku "Pizza Margherita" i do drugiego słowa "Mama Pizza"
+    assert {('restaurant', 'Mama Pizza'), ('dish', 'Pizza Margherita')} <= set(labels(index.search('pizza')))
+    assert index.search('zza') == [] # Tylko od granicy słowa, nie od środka
+    assert index.search('') == [] and index.search('pi', limit=0) == []
+
+def test_search_ranks_name_start_before_later_word_then_by_type():
+    index = build()
+    results = labels(index.search('pi'))
+    # Początek nazwy przed dopasowaniem od drugiego słowa; przy równym dopasowaniu restauracja przed daniem
+    assert results.index(('restaurant', 'Pierogarnia')) < results.index(('dish', 'Pierogi ruskie'))
+    assert results.index(('dish', 'Pieczeń')) < results.index(('restaurant', 'Mama Pizza'))
+    assert results[0] == ('restaurant', 'Pierogarnia')
+
+def test_search_respects_limit():
+    index = build()
+    assert len(index.search('p', limit=2)) == 2
+
+def test_restaurant_entry_has_detail_and_dish_points_to_restaurant():
+    index = build()
+    restaurant, = [e for e in index.search('sushi') if e['type'] == 'restaurant']
+    assert restaurant['ref'] == 3 and restaurant['detail'] == 'Japońska · Łódź'
+    dish, = index.search('maki')
+    assert dish['ref'] == 3 and dish['detail'] == 'Sushi Bar'
+
+def test_shared_cuisine_and_city_survive_until_last_restaurant_is_removed():
+    index = build()
+    index.remove_restaurant(1)
+    assert ('cuisine', 'Włoska') in labels(index.search('wlo')) # Wciąż ma ją "Mama Pizza"
+    assert ('city', 'Łódź') in labels(index.search('lodz')) # Wciąż ma je "Sushi Bar"
+    index.remove_restaurant(2)
+    assert ('cuisine', 'Włoska') not in labels(index.search('wlo'))
+    index.remove_restaurant(3)
+    assert index.search('lodz') == []
+
+def test_remove_restaurant_drops_its_dishes():
+    index = build()
+    index.remove_restaurant(4)
+    assert labels(index.search('pie')) == []
+    assert 11 not in index._dishes and 12 not in index._dishes
+
+def test_upsert_restaurant_moves_shared_entries_and_renames_dish_detail():
+    index = build()
+    index.upsert_restaurant(3, 'Sushi Master', 'Japońska', 'Gdańsk')
+    assert ('city', 'Gdańsk') in labels(index.search('gda'))
+    assert ('city', 'Łódź') in labels(index.search('lodz')) # Nadal "Pizzeria Roma"
+    dish, = index.search('maki')
+    assert dish['detail'] == 'Sushi Master'
+    assert index.search('sushi bar') == []
+
+def test_incremental_changes_match_full_rebuild():
+    index = build()
+    index.upsert_restaurant(5, 'Kebab King', 'Turecka', 'Łódź')
+    index.upsert_dish(14, 'Kebab w bułce', 5)
+    index.upsert_dish(10, 'Pizza Quattro Formaggi', 1)
+    index.upsert_restaurant(2, 'Mama Pizza', 'Włoska', 'Gdańsk')
+    index.remove_dish(12)
+    index.remove_restaurant(4)
+    expected = build(
+        [(1, 'Pizzeria Roma', 'Włoska', 'Łódź'), (2, 'Mama Pizza', 'Włoska', 'Gdańsk'), (3, 'Sushi Bar', 'Japońska', 'Łódź'), (5, 'Kebab King', 'Turecka', 'Łódź')],
+        [(10, 'Pizza Quattro Formaggi', 1), (13, 'Maki łosoś', 3), (14, 'Kebab w bułce', 5)])
+    assert state_of(index) == state_of(expected)
+    assert index._snapshot[0] == sorted(index._snapshot[0])
+
+def test_search_reads_one_version_while_writer_installs_next(monkeypatch):
+    """Zapis wchodzący między odczyt kluczy a odczyt wpisów (wersja zainstalowana w połowie) nie może dać KeyError."""
+    index = build(); expected = labels(index.search('pizza')); writer_ran = []
+    def bisect_left_then_write(keys, item):
+        if not writer_ran: writer_ran.append(True); index.remove_restaurant(2); index.remove_dish(10)
+        return bisect.bisect_left(keys, item)
+    monkeypatch.setattr(suggest, 'bisect', types.SimpleNamespace(bisect_left=bisect_left_then_write, insort=bisect.insort))
+    assert labels(index.search('pizza')) == expected # Cała stara wersja
+    assert writer_ran
+    monkeypatch.undo()
+    assert index.search('pizza') == [] # Nowa wersja bez "Mama Pizza" i "Pizza Margherita"
+
+def test_rebuild_is_throttled_to_one_thread_and_retry_interval():
+    index = suggest.SuggestIndex(retry_seconds=60)
+    assert index.try_begin_rebuild()
+    assert not index.try_begin_rebuild() # Przebudowa w toku
+    index.end_rebuild()
+    assert not index.try_begin_rebuild() # Za wcześnie na ponowienie
+
+# --- Budżet opóźnienia ---
+WORDS = ['pizza', 'pierogi', 'sushi', 'burger', 'kebab', 'ramen', 'tacos', 'zupa', 'sałatka', 'makaron', 'kotlet', 'placki',
+         'łosoś', 'kurczak', 'wołowina', 'curry', 'pho', 'naleśniki', 'gofry', 'lody']
+CITIES = ['Warszawa', 'Kraków', 'Łódź', 'Wrocław', 'Poznań', 'Gdańsk', 'Szczecin', 'Bydgoszcz', 'Lublin', 'Białystok']
+
+@pytest.fixture(scope='module')
+def large_index():
+    rng = random.Random(7)
+    restaurants = [(i, f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} {i}", f"Kuchnia {i % 40}", rng.choice(CITIES)) for i in range(5000)]
+    dishes = [(i, f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} nr {i}", rng.randrange(5000)) for i in range(100000)]
+    index = suggest.SuggestIndex()
+    index.rebuild(restaurants, dishes)
+    return index
+
+def test_search_p99_under_5ms_on_large_catalog(large_index):
+    assert len(large_index) > 100000
+    rng = random.Random(11)
+    queries = [rng.choice(WORDS + CITIES)[:rng.randint(1, 6)] for _ in range(2000)]
+    for query in queries[:50]: large_index.search(query) # Rozgrzewka
+    timings = []
+    for query in queries:
+        started = time.perf_counter(); results = large_index.search(query); timings.append(time.perf_counter() - started)
+        assert results
+    timings.sort()
+    p99 = timings[int(len(timings) * 0.99)]
+    assert p99 < 0.005, f"p99 {p99 * 1000:.2f} ms"
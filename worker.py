@@ -0,0 +1,133 @@
+"""Worker kolejki zadań PapuGO - uruchamiany obok gunicorna.
+
+Przy okazji wykonuje okresowe zadania utrzymaniowe (maintenance.py), każde we własnym wątku:
+co `PARTITION_CHECK_INTERVAL` sekund tworzy partycje zamówień na kolejne miesiące, a co
+`ARCHIVE_INTERVAL` sekund przenosi zakończone zamówienia do archiwum, a co
+`RECOMMENDATIONS_REFRESH_INTERVAL` sekund dolicza nowe zamówienia do rekomendacji dań, a co
+`IDEMPOTENCY_PURGE_INTERVAL` sekund usuwa wygasłe klucze idempotencji. `0` wyłącza zadanie.
+
+Użycie:
+    python worker.py [--threads N]         # przetwarzaj zadania
+    python worker.py dead [--limit N]      # pokaż zadania w dead-letter
+    python worker.py requeue JOB_ID...     # ponów wskazane zadania z dead-letter
+"""
+import argparse
+import logging
+import os
+import signal
+import sys
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+os.environ.setdefault('SUGGEST_WARMUP', 'false') # Worker nie obsługuje /api/suggest
+os.environ.setdefault('GEO_WARMUP', 'false') # ani strony głównej
+
+import app  # noqa: E402 - rejestruje handlery zadań (@jobs.job) zdefiniowane w aplikacji
+import database  # noqa: E402
+import jobs  # noqa: E402
+import maintenance  # noqa: E402
+import recommendations  # noqa: E402
+
+logger = logging.getLogger('papugo.worker')
+
+PARTITION_CHECK_INTERVAL = int(os.getenv('PARTITION_CHECK_INTERVAL', '21600'))
+ARCHIVE_INTERVAL = int(os.getenv('ARCHIVE_INTERVAL', '86400'))
+ARCHIVE_DROP_EMPTY = os.getenv('ARCHIVE_DROP_EMPTY', 'false').lower() in ['true', '1', 't']
+RECOMMENDATIONS_REFRESH_INTERVAL = int(os.getenv('RECOMMENDATIONS_REFRESH_INTERVAL', '3600'))
+IDEMPOTENCY_PURGE_INTERVAL = int(os.getenv('IDEMPOTENCY_PURGE_INTERVAL', '3600'))
+
+def ensure_partitions(conn):
+    created = maintenance.ensure_partitions(conn)
+    if created: logger.info(f"Utworzono partycji zamówień: {created}")
+
+def archive_orders(conn):
+    # Paczki wybierane z FOR UPDATE SKIP LOCKED - workery kilku instancji nie przeniosą tego samego zamówienia
+    total, dropped = maintenance.archive_orders(conn, drop_empty=ARCHIVE_DROP_EMPTY)
+    if total or dropped: logger.info(f"Zarchiwizowano zamówień: {total}, usunięto partycji: {len(dropped)}")
+
+def refresh_recommendations(conn):
+    # Blokada doradcza w refresh() - przebieg z innej instancji lub z maintenance.py jest po prostu pomijany
+    stats = recommendations.refresh(conn)
+    if stats: logger.info(f"Rekomendacje odświeżone: zamówień {stats['orders']}, rekomendacji {stats['recommendations']}, znacznik {stats['last_order_id']}")
+
+def purge_idempotency_keys(conn):
+    deleted = maintenance.purge_idempotency_keys(conn)
+    if deleted: logger.info(f"Usunięto wygasłych kluczy idempotencji: {deleted}")
+
+# (nazwa wątku, odstęp w sekundach, zadanie, opis do logu błędu)
+PERIODIC_TASKS = [
+    ('partitions', PARTITION_CHECK_INTERVAL, ensure_partitions, 'utworzyć partycji zamówień'),
+    ('archive', ARCHIVE_INTERVAL, archive_orders, 'zarchiwizować zamówień'),
+    ('recommendations', RECOMMENDATIONS_REFRESH_INTERVAL, refresh_recommendations, 'odświeżyć rekomendacji dań'),
+    ('idempotency-keys', IDEMPOTENCY_PURGE_INTERVAL, purge_idempotency_keys, 'usunąć wygasłych kluczy idempotencji'),
+]
+
+def every(stop_event, interval, task, description):
+    """Przy starcie i potem co `interval` sekund wykonuje `task` na nowym połączeniu; błąd trafia do logu, pętla działa dalej."""
+    while not stop_event.is_set():
+        conn = None
+        try:
+            conn = database.connect(); task(conn)
+        except Exception as e:
+            logger.error(f"Nie udało się {description}: {e}")
+        finally:
+            if conn is not None and not conn.closed: conn.close()
+        stop_event.wait(interval)
+
+def run(threads, poll_interval, periodic_tasks=PERIODIC_TASKS):
+    stop_event = threading.Event()
+    def handle_signal(signum, frame):
+        logger.info(f"Otrzymano sygnał {signum}, kończenie po bieżących zadaniach...")
+        stop_event.set()
+    signal.signal(signal.SIGTERM, handle_signal); signal.signal(signal.SIGINT, handle_signal)
+
+    logger.info(f"Start workera: {threads} wątków, typy zadań: {', '.join(sorted(jobs.registered_types()))}")
+    workers = [jobs.Worker(database.connect, poll_interval=poll_interval) for _ in range(threads)]
+    pool = [threading.Thread(target=w.run_forever, args=(stop_event,), name=f"jobs-worker-{i}", daemon=True) for i, w in enumerate(workers)]
+    pool += [threading.Thread(target=every, args=(stop_event, interval, task, description), name=name, daemon=True)
+             for name, interval, task, description in periodic_tasks if interval > 0]
+    for thread in pool: thread.start()
+    while any(thread.is_alive() for thread in pool): stop_event.wait(1)
+    return 0
+
+def list_dead(limit):
+    conn = database.connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT "JobID", "Type", "Attempts", "FinishedAt", "LastError" FROM "Jobs" WHERE "Status" = %s ORDER BY "FinishedAt" DESC LIMIT %s',
+                           (jobs.STATUS_DEAD, limit))
+            for job_id, job_type, attempts, finished_at, last_error in cursor.fetchall():
+                print(f"#{job_id} {job_type} prób={attempts} {finished_at:%Y-%m-%d %H:%M}: {(last_error or '').splitlines()[0] if last_error else '-'}")
+    finally:
+        conn.close()
+    return 0
+
+def requeue(job_ids):
+    conn = database.connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('''UPDATE "Jobs" SET "Status" = %s, "Attempts" = 0, "RunAt" = CURRENT_TIMESTAMP, "FinishedAt" = NULL
+                              WHERE "JobID" = ANY(%s) AND "Status" = %s''', (jobs.STATUS_PENDING, job_ids, jobs.STATUS_DEAD))
+            print(f"Ponowiono zadań: {cursor.rowcount}")
+        conn.commit()
+    finally:
+        conn.close()
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Worker kolejki zadań PapuGO")
+    parser.add_argument('--threads', type=int, default=int(os.getenv('WORKER_THREADS', '2')))
+    parser.add_argument('--poll-interval', type=float, default=float(os.getenv('WORKER_POLL_INTERVAL', '1.0')))
+    sub = parser.add_subparsers(dest='command')
+    dead = sub.add_parser('dead', help="Pokaż zadania w dead-letter"); dead.add_argument('--limit', type=int, default=50)
+    requeue_parser = sub.add_parser('requeue', help="Ponów zadania z dead-letter"); requeue_parser.add_argument('job_ids', type=int, nargs='+')
+    args = parser.parse_args(argv)
+
+    if args.command == 'dead': return list_dead(args.limit)
+    if args.command == 'requeue': return requeue(args.job_ids)
+    return run(args.threads, args.poll_interval)
+
+if __name__ == '__main__':
+    sys.exit(main())